@@ -5,10 +5,12 @@ from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from app.config.config import Config
 from app.models.models import db
+from app.utils.password import configure_password_hasher
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_password_hasher(app.config)
     
     # Initialize extensions
     db.init_app(app)
@@ -27,15 +29,18 @@ def create_app(config_class=Config):
     from app.api.routes import api
     from app.api.student_routes import student_api
     from app.api.student_unmap_endpoint import student_api as student_unmap_api
+    from app.api.upload_routes import upload_api
     
     # Đăng ký các blueprint
     # Lưu ý: route '/students' trong routes.py đã bị vô hiệu hóa để tránh xung đột
     app.register_blueprint(api, url_prefix='/api')
     app.register_blueprint(student_api, url_prefix='/api')
     app.register_blueprint(student_unmap_api, url_prefix='/api')
+    app.register_blueprint(upload_api, url_prefix='/api')
     
     @app.route('/health')
     def health_check():
-        return {'status': 'healthy'}, 200
+        from app.services.login_limiter import login_limiter_stats
+        return {'status': 'healthy', 'login': login_limiter_stats()}, 200
     
     return app
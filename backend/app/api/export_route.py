@@ -1,9 +1,9 @@
-from flask import jsonify, request, send_file
+from flask import jsonify, request
 from flask_jwt_extended import jwt_required
 from app.api import api
 from app.services.auth import get_current_user
 from app.models.models import AuditLog
-from app.services.export import generate_export_file
+from app.services.export import generate_export_file, make_export_response
 import traceback
 
 @api.route('/users/export', methods=['GET'])
@@ -71,15 +71,13 @@ def export_users():
             action='export_users',
             details=details,
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='user',
+            target_ids=user_ids if mode == 'selected' else None,
+            filters={'mode': mode, 'format': format, **filters}
         )
         
-        return send_file(
-            result['file_obj'],
-            mimetype=result['mimetype'],
-            as_attachment=True,
-            download_name=result['filename']
-        )
+        return make_export_response(result)
         
     except Exception as e:
         print(f"Error exporting users: {str(e)}")
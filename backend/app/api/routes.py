@@ -1,6 +1,8 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.auth import authenticate_user, get_current_user, verify_2fa
+from app.services.bulk_operations import BulkOperationError, get_bulk_operation, run_bulk_request
+from app.services.login_limiter import LoginBusyError, login_slot
 from app.services.user import get_all_users, create_new_user, delete_user, update_user, toggle_user_status, bulk_import_users
 from app.models.models import AuditLog, User, Area, House, db
 from app.utils.cors import cors_preflight
@@ -30,7 +32,12 @@ def login():
     password = request.json.get('password', None)
     token = request.json.get('token', None)
     
-    user_data, error = authenticate_user(username, password, token)
+    try:
+        # Bounded across workers so a login storm can't occupy every worker
+        with login_slot():
+            user_data, error = authenticate_user(username, password, token)
+    except LoginBusyError as e:
+        return jsonify({"error": e.message}), 503, {'Retry-After': str(e.retry_after)}
     
     if error:
         return jsonify({"error": error}), 401
@@ -278,7 +285,9 @@ def create_user():
         action='create_user_api',
         details=f"Created user {data['username']} via API",
         ip_address=ip_address,
-        user_agent=user_agent
+        user_agent=user_agent,
+        target_type='user',
+        target_ids=[user.id]
     )
     
     return jsonify(user.to_dict()), 201
@@ -393,7 +402,9 @@ def setup_2fa(user_id):
         action='setup_2fa',
         details=f"Set up 2FA for user {user.username}",
         ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent', '')
+        user_agent=request.headers.get('User-Agent', ''),
+        target_type='user',
+        target_ids=[user.id]
     )
     
     return jsonify({
@@ -432,7 +443,9 @@ def verify_2fa_endpoint(user_id):
         action='enable_2fa',
         details=f"Enabled 2FA for user {user.username}",
         ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent', '')
+        user_agent=request.headers.get('User-Agent', ''),
+        target_type='user',
+        target_ids=[user.id]
     )
     
     return jsonify({
@@ -475,7 +488,9 @@ def change_password():
         action='change_password',
         details=f"User {current_user.username} changed their password",
         ip_address=ip_address,
-        user_agent=user_agent
+        user_agent=user_agent,
+        target_type='user',
+        target_ids=[current_user.id]
     )
     
     return jsonify({
@@ -494,7 +509,12 @@ def verify_2fa_login():
     password = data.get('password')
     token = data.get('token')
     
-    user_data, error = authenticate_user(username, password, token)
+    try:
+        # Bounded across workers so a login storm can't occupy every worker
+        with login_slot():
+            user_data, error = authenticate_user(username, password, token)
+    except LoginBusyError as e:
+        return jsonify({"error": e.message}), 503, {'Retry-After': str(e.retry_after)}
     
     if error:
         return jsonify({"error": error}), 401
@@ -536,13 +556,15 @@ def add_area():
         
         new_area = Area(name=data['name'])
         db.session.add(new_area)
-        db.session.commit()
+        db.session.flush()
         
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Created new area: {data['name']}"
+            action=f"Created new area: {data['name']}",
+            target_type='area',
+            target_ids=[new_area.id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify(new_area.to_dict()), 201
@@ -580,14 +602,14 @@ def update_area(area_id):
         
         # Update area
         area.name = data['name']
-        db.session.commit()
         
-        # Log the action
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Updated area: {old_name} -> {data['name']}"
+            action=f"Updated area: {old_name} -> {data['name']}",
+            target_type='area',
+            target_ids=[area_id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify(area.to_dict()), 200
@@ -623,14 +645,14 @@ def delete_area(area_id):
         # Delete area
         area_name = area.name
         db.session.delete(area)
-        db.session.commit()
         
-        # Log the action
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Deleted area: {area_name}"
+            action=f"Deleted area: {area_name}",
+            target_type='area',
+            target_ids=[area_id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify({"message": f"Area '{area_name}' deleted successfully"}), 200
@@ -678,14 +700,15 @@ def add_house():
         # Create new house
         new_house = House(name=data['name'], area_id=data['areaId'])
         db.session.add(new_house)
-        db.session.commit()
+        db.session.flush()
         
-        # Log the action
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Created new house: {data['name']} in area {area.name}"
+            action=f"Created new house: {data['name']} in area {area.name}",
+            target_type='house',
+            target_ids=[new_house.id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify(new_house.to_dict()), 201
@@ -725,14 +748,14 @@ def update_house(house_id):
         # Update house
         house.name = data['name']
         house.area_id = data['areaId']
-        db.session.commit()
         
-        # Log the action
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Updated house: {old_name} (Area: {old_area}) -> {house.name} (Area: {area.name})"
+            action=f"Updated house: {old_name} (Area: {old_area}) -> {house.name} (Area: {area.name})",
+            target_type='house',
+            target_ids=[house_id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify(house.to_dict()), 200
@@ -765,14 +788,14 @@ def delete_house(house_id):
         # Delete house
         house_name = house.name
         db.session.delete(house)
-        db.session.commit()
         
-        # Log the action
-        log = AuditLog(
+        # Log the action in the same transaction
+        AuditLog.add(
             user_id=current_user.id,
-            action=f"Deleted house: {house_name} from area {area_name}"
+            action=f"Deleted house: {house_name} from area {area_name}",
+            target_type='house',
+            target_ids=[house_id]
         )
-        db.session.add(log)
         db.session.commit()
         
         return jsonify({"message": f"House '{house_name}' deleted successfully"}), 200
@@ -791,41 +814,58 @@ def import_users():
         if not current_user or not (current_user.role in ['admin', 'root']):
             return jsonify({"error": "Admin privileges required"}), 403
         
-        # Check if file is in request
-        if 'file' not in request.files:
-            return jsonify({"error": "No file provided"}), 400
-            
-        file = request.files['file']
+        upload_id = request.form.get('uploadId')
+        logger = logging.getLogger(__name__)
         
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
+        if upload_id:
+            # Chunked upload - the importer reads the spooled file from disk,
+            # so the size limit for direct uploads does not apply
+            from app.services.chunked_upload import UploadError, get_completed_upload
+            try:
+                file_data, filename = get_completed_upload(upload_id, current_user.id)
+            except UploadError as e:
+                return jsonify({"error": e.message}), e.status_code
             
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            return jsonify({"error": "Only Excel files (.xlsx or .xls) are supported"}), 400
-        
-        # Check file size - improved error message for large files
-        MAX_FILE_SIZE_MB = 10  # 10 MB limit
-        file_size_mb = 0
-        
-        # Get file size without reading entire file into memory
-        file.seek(0, os.SEEK_END)
-        file_size_bytes = file.tell()
-        file_size_mb = file_size_bytes / (1024 * 1024)
-        file.seek(0)  # Reset file pointer to beginning
-        
-        if file_size_mb > MAX_FILE_SIZE_MB:
-            return jsonify({
-                "error": f"File too large. Maximum size is {MAX_FILE_SIZE_MB} MB, but received {file_size_mb:.2f} MB",
-                "success": 0,
-                "error_count": 1
-            }), 400
-        
-        # Process file data - read in chunks for efficiency
-        file_data = file.read()
+            if not filename.endswith(('.xlsx', '.xls')):
+                return jsonify({"error": "Only Excel files (.xlsx or .xls) are supported"}), 400
+            
+            file_size_mb = os.path.getsize(file_data) / (1024 * 1024)
+        else:
+            # Check if file is in request
+            if 'file' not in request.files:
+                return jsonify({"error": "No file provided"}), 400
+                
+            file = request.files['file']
+            filename = file.filename
+            
+            if file.filename == '':
+                return jsonify({"error": "No file selected"}), 400
+                
+            if not file.filename.endswith(('.xlsx', '.xls')):
+                return jsonify({"error": "Only Excel files (.xlsx or .xls) are supported"}), 400
+            
+            # Check file size - improved error message for large files
+            MAX_FILE_SIZE_MB = 10  # 10 MB limit for direct uploads (use /uploads for larger files)
+            file_size_mb = 0
+            
+            # Get file size without reading entire file into memory
+            file.seek(0, os.SEEK_END)
+            file_size_bytes = file.tell()
+            file_size_mb = file_size_bytes / (1024 * 1024)
+            file.seek(0)  # Reset file pointer to beginning
+            
+            if file_size_mb > MAX_FILE_SIZE_MB:
+                return jsonify({
+                    "error": f"File too large. Maximum size is {MAX_FILE_SIZE_MB} MB, but received {file_size_mb:.2f} MB. Use the chunked upload API for larger files.",
+                    "success": 0,
+                    "error_count": 1
+                }), 400
+            
+            # Process file data
+            file_data = file.read()
         
         # Log start of import operation
-        logger = logging.getLogger(__name__)
-        logger.info(f"Starting import of Excel file: {file.filename}, size: {file_size_mb:.2f} MB")
+        logger.info(f"Starting import of Excel file: {filename}, size: {file_size_mb:.2f} MB")
         
         # Check for additional import options from frontend
         auto_generate_username = request.form.get('auto_generate_username') == 'true'
@@ -847,11 +887,18 @@ def import_users():
         AuditLog.log(
             user_id=current_user.id,
             action='import_users',
-            details=f"Imported users from Excel: {result['success']} successful, {result['error']} failed, file: {file.filename}",
+            details=f"Imported users from Excel: {result['success']} successful, {result['error']} failed, file: {filename}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='user',
+            counts={'success': result['success'], 'error': result['error']}
         )
         
+        # Spooled uploads are single-use
+        if upload_id:
+            from app.services.chunked_upload import discard_upload
+            discard_upload(upload_id, current_user.id)
+        
         # Log completion
         logger.info(f"Completed import: {result['success']} successful, {result['error']} failed")
         
@@ -925,22 +972,33 @@ def bulk_delete_users_endpoint():
         from app.services.bulk_user_operations import bulk_delete_users
         from app.models.models import AuditLog
         
-        # Add explicit security log entry for this operation
-        AuditLog.log(
-            user_id=current_user.id,
-            action='bulk_delete_security',
-            details=f"Bulk delete operation initiated with mode={mode}. Root users are protected.",
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
-        )
+        def run(operation):
+            # Add explicit security log entry for this operation
+            AuditLog.log(
+                user_id=current_user.id,
+                action='bulk_delete_security',
+                details=f"Bulk delete operation initiated with mode={mode}. Root users are protected.",
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='user',
+                target_ids=user_ids if mode == 'selected' else None,
+                filters={'mode': mode}
+            )
+            
+            # Perform bulk delete with root users always excluded
+            result = bulk_delete_users(mode, user_ids, current_user.id, operation=operation)
+            
+            if 'error' in result:
+                return {"error": result['error']}, 400
+            
+            return result, 200
         
-        # Perform bulk delete with root users always excluded
-        result = bulk_delete_users(mode, user_ids, current_user.id)
+        # A retry with the same Idempotency-Key gets the first response back instead of running again
+        response_data, status_code, headers = run_bulk_request('delete_users', current_user.id, {'mode': mode, 'userIds': user_ids}, run)
+        return jsonify(response_data), status_code, headers
         
-        if 'error' in result:
-            return jsonify({"error": result['error']}), 400
-        
-        return jsonify(result), 200
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
         
     except Exception as e:
         import traceback
@@ -982,22 +1040,33 @@ def bulk_change_status_endpoint():
         from app.services.bulk_user_operations import bulk_change_status
         from app.models.models import AuditLog
         
-        # Add explicit security log entry for this operation
-        AuditLog.log(
-            user_id=current_user.id,
-            action='bulk_status_change_security',
-            details=f"Bulk status change operation initiated with mode={mode}, action={action}. Root users are protected.",
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
-        )
-        
-        # Perform bulk status change with root users always excluded
-        result = bulk_change_status(mode, user_ids, action, current_user.id)
+        def run(operation):
+            # Add explicit security log entry for this operation
+            AuditLog.log(
+                user_id=current_user.id,
+                action='bulk_status_change_security',
+                details=f"Bulk status change operation initiated with mode={mode}, action={action}. Root users are protected.",
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='user',
+                target_ids=user_ids if mode == 'selected' else None,
+                filters={'mode': mode, 'action': action}
+            )
+            
+            # Perform bulk status change with root users always excluded
+            result = bulk_change_status(mode, user_ids, action, current_user.id, operation=operation)
+            
+            if 'error' in result:
+                return {"error": result['error']}, 400
+            
+            return result, 200
         
-        if 'error' in result:
-            return jsonify({"error": result['error']}), 400
+        # A retry with the same Idempotency-Key gets the first response back instead of running again
+        response_data, status_code, headers = run_bulk_request('change_user_status', current_user.id, {'mode': mode, 'userIds': user_ids, 'action': action}, run)
+        return jsonify(response_data), status_code, headers
         
-        return jsonify(result), 200
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
         
     except Exception as e:
         import traceback
@@ -1008,7 +1077,7 @@ def bulk_change_status_endpoint():
 @api.route('/users/export', methods=['GET'])
 @jwt_required()
 def export_users():
-    """Export users to Excel or CSV format (protected, admin only)"""
+    """Export users to Excel, CSV, Parquet or Arrow format (protected, admin only)"""
     try:
         # Check if user is admin
         current_user = get_current_user()
@@ -1022,8 +1091,8 @@ def export_users():
             return jsonify({"error": "Invalid mode. Must be 'all' or 'selected'"}), 400
             
         format = request.args.get('format', 'excel')
-        if format not in ['excel', 'csv']:
-            return jsonify({"error": "Invalid format. Must be 'excel' or 'csv'"}), 400
+        if format not in ['excel', 'csv', 'parquet', 'arrow']:
+            return jsonify({"error": "Invalid format. Must be 'excel', 'csv', 'parquet' or 'arrow'"}), 400
             
         # Parse user IDs for selected mode
         user_ids = []
@@ -1037,10 +1106,27 @@ def export_users():
                 return jsonify({"error": "Invalid user IDs format"}), 400
         
         # Import export service
-        from app.services.export import generate_export_file
-        
-        # Generate the export file
-        result = generate_export_file(mode, format, user_ids)
+        from app.services.columnar_export import COLUMNAR_FORMATS, columnar_export_available, generate_columnar_export
+        from app.services.export import EXPORT_FORMATS, generate_export_file, user_export_file_info
+        from app.services.export_cache import cached_export_response
+        
+        if format in COLUMNAR_FORMATS:
+            if not columnar_export_available():
+                return jsonify({"error": "Parquet/Arrow export requires the pyarrow package on the server"}), 501
+            build = lambda: generate_columnar_export('users', format, mode, user_ids)
+        else:
+            build = lambda: generate_export_file(mode, format, user_ids)
+        
+        # Serve the export from the cache, generating it if the users table changed
+        filename, mimetype = user_export_file_info(format)
+        response = cached_export_response(
+            'users',
+            {'mode': mode, 'user_ids': sorted(user_ids)},
+            EXPORT_FORMATS[format][0],
+            filename,
+            mimetype,
+            build
+        )
         
         # Log the export action
         details = f"Exported {mode} users to {format} format"
@@ -1052,16 +1138,14 @@ def export_users():
             action='export_users',
             details=details,
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='user',
+            target_ids=user_ids if mode == 'selected' else None,
+            filters={'mode': mode, 'format': format}
         )
         
-        # Return file download response
-        return send_file(
-            result['file_obj'],
-            mimetype=result['mimetype'],
-            as_attachment=True,
-            download_name=result['filename']
-        )
+        # Return file download response (CSV misses are streamed from the database cursor)
+        return response
         
     except Exception as e:
         import traceback
@@ -1069,6 +1153,99 @@ def export_users():
         print(traceback.format_exc())
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@api.route('/audit-logs', methods=['GET'])
+@jwt_required()
+def get_audit_logs():
+    """Page through the audit log, newest first (protected, root only)"""
+    try:
+        current_user = get_current_user()
+        
+        if not current_user or current_user.role != 'root':
+            return jsonify({"error": "Root privileges required"}), 403
+        
+        from app.services.audit_log import DEFAULT_PAGE_SIZE, query_audit_logs
+        
+        filters = {}
+        try:
+            user_id = request.args.get('userId')
+            if user_id:
+                filters['user_id'] = int(user_id)
+            
+            action = request.args.get('action')
+            if action:
+                filters['actions'] = [name.strip() for name in action.split(',') if name.strip()]
+            
+            since = request.args.get('from')
+            if since:
+                filters['since'] = datetime.fromisoformat(since)
+            
+            until = request.args.get('to')
+            if until:
+                filters['until'] = datetime.fromisoformat(until)
+            
+            target_type = request.args.get('targetType')
+            if target_type:
+                filters['target_type'] = target_type
+            
+            target_id = request.args.get('targetId')
+            if target_id:
+                filters['target_id'] = int(target_id)
+            
+            result = query_audit_logs(
+                filters=filters,
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+            )
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+        
+        return jsonify(result), 200
+    
+    except Exception as e:
+        print(f"Error reading audit logs: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@api.route('/audit-logs/export', methods=['GET'])
+@jwt_required()
+def export_audit_logs():
+    """Export the audit log as Parquet or Arrow for analytics (protected, root only)"""
+    try:
+        current_user = get_current_user()
+        
+        if not current_user or current_user.role != 'root':
+            return jsonify({"error": "Root privileges required"}), 403
+        
+        format = request.args.get('format', 'parquet')
+        if format not in ['parquet', 'arrow']:
+            return jsonify({"error": "Invalid format. Must be 'parquet' or 'arrow'"}), 400
+        
+        from app.services.columnar_export import columnar_export_available, generate_columnar_export
+        from app.services.export import export_file_info, make_export_response
+        
+        if not columnar_export_available():
+            return jsonify({"error": "Parquet/Arrow export requires the pyarrow package on the server"}), 501
+        
+        result = generate_columnar_export('audit_log', format)
+        result['filename'], result['mimetype'] = export_file_info('audit-log-export', format)
+        
+        AuditLog.log(
+            user_id=current_user.id,
+            action='export_audit_logs',
+            details=f"Exported audit log to {format} format",
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='audit_log',
+            filters={'format': format}
+        )
+        
+        return make_export_response(result)
+        
+    except Exception as e:
+        print(f"Error exporting audit logs: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 @api.route('/users/<int:user_id>/reset-password', methods=['POST'])
 @jwt_required()
 def reset_user_password(user_id):
@@ -1099,7 +1276,9 @@ def reset_user_password(user_id):
             action='reset_password',
             details=f"Reset password for user {target_user.username}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='user',
+            target_ids=[target_user.id]
         )
         
         return jsonify({
@@ -1141,22 +1320,33 @@ def bulk_reset_passwords_endpoint():
         # Import the bulk operations module
         from app.services.bulk_reset_passwords import bulk_reset_passwords
         
-        # Log the bulk password reset request
-        AuditLog.log(
-            user_id=current_user.id,
-            action='bulk_reset_passwords_security',
-            details=f"Bulk password reset operation initiated with mode={mode}. Root users are protected.",
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
-        )
-        
-        # Perform bulk password reset with root users always excluded
-        result = bulk_reset_passwords(mode, user_ids, current_user.id)
+        def run(operation):
+            # Log the bulk password reset request
+            AuditLog.log(
+                user_id=current_user.id,
+                action='bulk_reset_passwords_security',
+                details=f"Bulk password reset operation initiated with mode={mode}. Root users are protected.",
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='user',
+                target_ids=user_ids if mode == 'selected' else None,
+                filters={'mode': mode}
+            )
+            
+            # Perform bulk password reset with root users always excluded
+            result = bulk_reset_passwords(mode, user_ids, current_user.id, operation=operation)
+            
+            if 'error' in result:
+                return {"error": result['error']}, 400
+            
+            return result, 200
         
-        if 'error' in result:
-            return jsonify({"error": result['error']}), 400
+        # A retry with the same Idempotency-Key gets the first response back instead of running again
+        response_data, status_code, headers = run_bulk_request('reset_passwords', current_user.id, {'mode': mode, 'userIds': user_ids}, run)
+        return jsonify(response_data), status_code, headers
         
-        return jsonify(result), 200
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
         
     except Exception as e:
         import traceback
@@ -1164,6 +1354,31 @@ def bulk_reset_passwords_endpoint():
         print(traceback.format_exc())
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@api.route('/bulk-operations/<int:operation_id>', methods=['GET'])
+@api.route('/bulk-operations', methods=['GET'])
+@jwt_required()
+def get_bulk_operation_endpoint(operation_id=None):
+    """Progress of a bulk operation, by id or by the caller's ?idempotencyKey= (owner or root)"""
+    try:
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        idempotency_key = request.args.get('idempotencyKey')
+        if operation_id is None and not idempotency_key:
+            return jsonify({"error": "Missing operation id or idempotencyKey"}), 400
+        
+        operation = get_bulk_operation(operation_id, user_id=current_user.id, idempotency_key=idempotency_key)
+        if not operation or (operation.user_id != current_user.id and current_user.role != 'root'):
+            return jsonify({"error": "Bulk operation not found"}), 404
+        
+        return jsonify(operation.to_dict()), 200
+        
+    except Exception as e:
+        print(f"Error getting bulk operation: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 # Route bị vô hiệu hóa - sử dụng student_routes.py thay thế
 # @api.route('/students', methods=['GET'])
 @jwt_required()
@@ -1381,7 +1596,9 @@ def create_student():
             action='create_student',
             details=f"Created student {data.get('studentId')}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[new_student['id']]
         )
         
         return jsonify(new_student), 201
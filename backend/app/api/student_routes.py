@@ -1,5 +1,4 @@
-import sys
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request, send_file, after_this_request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.auth import get_current_user
 from app.models.models import AuditLog, User
@@ -9,13 +8,78 @@ import pandas as pd
 import io
 from datetime import datetime
 import time
+from werkzeug.datastructures import FileStorage
 
-from app.services.student import create_student, delete_student, get_all_students, import_students_from_file, map_student_to_user, toggle_student_status, update_student, unmap_student
+from app.services.columnar_export import COLUMNAR_FORMATS, columnar_export_available, generate_columnar_export
+from app.services.export import (
+    CSV_MIMETYPE, EXPORT_FORMATS, STUDENT_EXPORT_COLUMNS, XLSX_MIMETYPE, build_brosis_students_export_statement,
+    build_student_export_statement, export_file_info, export_headers, iter_export_rows, stream_csv, write_xlsx
+)
+from app.services.export_cache import cached_export_response
+from app.services.roster_export import RosterExportError, get_roster_export, get_roster_export_file, start_roster_export
+from app.services.bulk_operations import BulkOperationError, run_bulk_request
+from app.services.chunked_upload import UploadError, discard_upload, get_completed_upload
+from app.services.import_file import PREVIEW_ROWS, count_data_rows, read_import_head
+from app.services.student import MAPPING_COLUMNS, bulk_assign_students, bulk_delete_students, bulk_unassign_students, bulk_update_students, create_student, delete_student, get_all_students, import_brosis_mapping, import_students_from_file, map_student_to_user, toggle_student_status, update_student, unmap_student, upsert_students_from_file
 
 # Create blueprint with a different name
 student_api = Blueprint('student_routes', __name__)
 logger = logging.getLogger(__name__)
 
+def _student_filters_from_request(current_user):
+    """
+    Build student list filters from the query string, applying role restrictions:
+    brosis users only see their own students, other non-root users only their area.
+    """
+    filters = {}
+    
+    # Search term filter
+    search = request.args.get('search')
+    if search:
+        filters['search'] = search
+    
+    # Status filter
+    status = request.args.get('status')
+    if status:
+        filters['status'] = status
+        
+    # Matched filter
+    matched = request.args.get('matched')
+    if matched:
+        filters['matched'] = matched
+    
+    # Has House filter - check if house field is set or not
+    has_house = request.args.get('hasHouse')
+    if has_house is not None:
+        filters['has_house'] = has_house.lower() == 'true'
+    
+    # Brosis name filter
+    brosis_filter = request.args.get('brosisFilter')
+    if brosis_filter:
+        filters['brosisFilter'] = brosis_filter
+    
+    # Brosis users can only see students assigned to them
+    if current_user.role == 'brosis':
+        filters['user_id'] = current_user.id
+        filters['matched'] = 'true'
+        logger.info(f"Brosis user restriction applied: only showing students assigned to {current_user.username}")
+    # Area filter - apply area restriction for non-root users
+    elif current_user.role != 'root':
+        filters['area'] = current_user.area
+        logger.info(f"Area restriction applied for {current_user.username}: {current_user.area}")
+    else:
+        # Root users can filter by area
+        area = request.args.get('area')
+        if area:
+            filters['area'] = area
+    
+    # House filter
+    house = request.args.get('house')
+    if house:
+        filters['house'] = house
+    
+    return filters
+
 @student_api.route('/students', methods=['GET'])
 @jwt_required()
 def get_students():
@@ -39,52 +103,8 @@ def get_students():
         elif per_page > 10000:
             per_page = 10000
             
-        # Get filter parameters from query string
-        filters = {}
-        
-        # Search term filter
-        search = request.args.get('search')
-        if search:
-            filters['search'] = search
-        
-        # Status filter
-        status = request.args.get('status')
-        if status:
-            filters['status'] = status
-            
-        # Matched filter
-        matched = request.args.get('matched')
-        if matched:
-            filters['matched'] = matched
-        
-        # Has House filter - new filter to check if house field is set or not
-        has_house = request.args.get('hasHouse')
-        if has_house is not None:
-            # Convert string to boolean: 'true' -> True, 'false' -> False
-            has_house_bool = has_house.lower() == 'true'
-            filters['has_house'] = has_house_bool
-        
-        # Brosis users can only see students assigned to them
-        if current_user.role == 'brosis':
-            # Brosis users can only see their assigned students
-            filters['user_id'] = current_user.id
-            filters['matched'] = 'true'
-            logger.info(f"Brosis user restriction applied: only showing students assigned to {current_user.username}")
-        # Area filter - apply area restriction for non-root users
-        elif current_user.role != 'root':
-            # Non-root, non-brosis users can only see students from their area
-            filters['area'] = current_user.area
-            logger.info(f"Area restriction applied for {current_user.username}: {current_user.area}")
-        else:
-            # Root users can filter by area
-            area = request.args.get('area')
-            if area:
-                filters['area'] = area
-        
-        # House filter
-        house = request.args.get('house')
-        if house:
-            filters['house'] = house
+        # Get filter parameters from query string (with role/area restrictions)
+        filters = _student_filters_from_request(current_user)
         
         # Log the filters for debugging
         logger.info(f"Student filters applied: {filters}")
@@ -206,7 +226,9 @@ def create_student_endpoint():
             action='create_student',
             details=f"Created student {data.get('studentId')}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student.id]
         )
         
         return jsonify(student.to_dict()), 201
@@ -275,7 +297,9 @@ def update_student_endpoint(student_id):
             action='update_student',
             details=f"Updated student {student.student_id}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id]
         )
         
         return jsonify(updated_student.to_dict()), 200
@@ -284,6 +308,66 @@ def update_student_endpoint(student_id):
         logger.error(f"Error updating student: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
         
+@student_api.route('/students/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_update_students_endpoint():
+    """Update many students at once (protected)"""
+    try:
+        # Check if user is authenticated and authorized
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+            
+        # Same roles as PUT /students/<id>; per-student restrictions are checked row by row
+        if current_user.role not in ['admin', 'root', 'brosis']:
+            return jsonify({"error": "Permission denied"}), 403
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+            
+        # Either per-student changes, or one change set applied to a selection
+        if 'items' in data:
+            items = data['items']
+            if not isinstance(items, list) or len(items) == 0:
+                return jsonify({"error": "items must be a non-empty list"}), 400
+        elif 'studentIds' in data and 'changes' in data:
+            student_ids = data['studentIds']
+            if not isinstance(student_ids, list) or len(student_ids) == 0:
+                return jsonify({"error": "studentIds must be a non-empty list"}), 400
+            if not isinstance(data['changes'], dict) or not data['changes']:
+                return jsonify({"error": "changes must be a non-empty object"}), 400
+            items = [{"id": student_id, "changes": data['changes']} for student_id in student_ids]
+        else:
+            return jsonify({"error": "Missing required fields: items, or studentIds and changes"}), 400
+            
+        all_or_nothing = bool(data.get('allOrNothing', False))
+        
+        result = bulk_update_students(
+            items,
+            current_user,
+            all_or_nothing=all_or_nothing,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', '')
+        )
+        results = result['results']
+        
+        if all_or_nothing and not result['applied'] and results['failed']:
+            return jsonify({
+                "error": f"No students were updated: {len(results['failed'])} rows failed validation",
+                "results": results
+            }), 400
+            
+        return jsonify({
+            "message": f"Successfully updated {len(results['success'])} students",
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error in bulk update students: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 @student_api.route('/students/<int:student_id>', methods=['DELETE'])
 @jwt_required()
 def delete_student_endpoint(student_id):
@@ -320,7 +404,9 @@ def delete_student_endpoint(student_id):
             action='delete_student',
             details=f"Deleted student {student.student_id}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id]
         )
         
         return jsonify(result), 200
@@ -365,7 +451,9 @@ def toggle_student_status_endpoint(student_id):
             action='toggle_student_status',
             details=f"Toggled status for student {student.student_id} to {updated_student.status}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id]
         )
         
         return jsonify(updated_student.to_dict()), 200
@@ -420,7 +508,10 @@ def map_student_to_user_endpoint(student_id):
             action='map_student_to_user',
             details=f"Mapped student {student.student_id} to user {user.username}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id],
+            filters={'brosis_user_id': user.id}
         )
         
         return jsonify(mapped_student.to_dict()), 200
@@ -429,6 +520,42 @@ def map_student_to_user_endpoint(student_id):
         logger.error(f"Error mapping student to user: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+def _import_file_from_request(current_user):
+    """
+    The uploaded import file: the `file` form field, or a completed chunked upload (`uploadId`)
+    
+    Returns:
+        tuple: (FileStorage, upload id or None, error response or None)
+    """
+    upload_id = request.form.get('uploadId')
+    if upload_id:
+        # Chunked upload - read the spooled file from disk instead of the request body
+        try:
+            upload_path, upload_filename = get_completed_upload(upload_id, current_user.id)
+        except UploadError as e:
+            return None, None, (jsonify({"error": e.message}), e.status_code)
+            
+        file = FileStorage(stream=open(upload_path, 'rb'), filename=upload_filename)
+        
+        @after_this_request
+        def close_spooled_upload(response):
+            file.close()
+            return response
+    else:
+        # Check if file is present in the request
+        if 'file' not in request.files:
+            return None, None, (jsonify({"error": "No file provided"}), 400)
+            
+        file = request.files['file']
+        if not file.filename:
+            return None, None, (jsonify({"error": "No file selected"}), 400)
+            
+    # Check file extension
+    if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
+        return None, None, (jsonify({"error": "Unsupported file format. Please upload an Excel or CSV file."}), 400)
+        
+    return file, upload_id, None
+
 @student_api.route('/students/import', methods=['POST'])
 @jwt_required()
 def import_students_endpoint():
@@ -443,26 +570,26 @@ def import_students_endpoint():
         if not (current_user.role in ['admin', 'root']):
             return jsonify({"error": "Admin privileges required"}), 403
         
-        # Check if file is present in the request
-        if 'file' not in request.files:
-            return jsonify({"error": "No file provided"}), 400
-        
-        file = request.files['file']
-        if not file.filename:
-            return jsonify({"error": "No file selected"}), 400
-        
-        # Check file extension
-        if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
-            return jsonify({"error": "Unsupported file format. Please upload an Excel or CSV file."}), 400
+        file, upload_id, error_response = _import_file_from_request(current_user)
+        if error_response:
+            return error_response
         
         # Determine if preview mode or actual import
         preview_mode = request.form.get('preview', 'false').lower() == 'true'
-        
+
+        # Import mode: 'insert' (default, rejects existing studentIds) or 'upsert'
+        import_mode = request.form.get('mode', 'insert').lower()
+        if import_mode not in ['insert', 'upsert']:
+            return jsonify({"error": "Invalid mode. Must be 'insert' or 'upsert'"}), 400
+
         # Read file based on extension
         try:
             file_extension = file.filename.lower().split('.')[-1]
             
-            if file_extension in ['xlsx', 'xls']:
+            if preview_mode:
+                # Preview only parses the header and the first rows of the file
+                df = read_import_head(file.stream, file_extension, limit=PREVIEW_ROWS)
+            elif file_extension in ['xlsx', 'xls']:
                 df = pd.read_excel(file)
             else:  # csv
                 df = pd.read_csv(file)
@@ -501,13 +628,13 @@ def import_students_endpoint():
                 for record in data:
                     record['status'] = 'pending'
                 
-                # Return only the first 10 rows for preview
-                preview_data = data[:10]
+                # Count the remaining rows without parsing them
+                total_rows = count_data_rows(file.stream, file_extension)
                 
                 # Add note about automatic house assignment
                 return jsonify({
-                    "preview": preview_data,
-                    "totalRows": len(data),
+                    "preview": data,
+                    "totalRows": max(total_rows, len(data)),
                     "areaInherited": current_user.role == 'admin' and current_user.area is not None,
                     "autoHouseDistribution": True,
                     "autoHouseDistributionNote": "Students will be automatically and evenly distributed among houses in their area."
@@ -517,20 +644,64 @@ def import_students_endpoint():
             admin_area = None
             if current_user.role == 'admin' and current_user.area:
                 admin_area = current_user.area
-                
+
+            # Optionally assign new students to the least-loaded BroSis of their house
+            assign_brosis = request.form.get('assign_brosis', 'false').lower() == 'true'
+
+            # Upsert mode - apply the file as a diff against the stored roster
+            if import_mode == 'upsert':
+                deactivate_missing = request.form.get('deactivate_missing', 'false').lower() == 'true'
+                dry_run = request.form.get('dry_run', 'false').lower() == 'true'
+
+                diff, errors = upsert_students_from_file(
+                    data,
+                    admin_area=admin_area,
+                    deactivate_missing=deactivate_missing,
+                    dry_run=dry_run,
+                    assign_brosis=assign_brosis
+                )
+
+                if not dry_run:
+                    if upload_id:
+                        discard_upload(upload_id, current_user.id)
+                    
+                    AuditLog.log(
+                        user_id=current_user.id,
+                        action='upsert_students',
+                        details=f"Upserted students: {diff['inserted']} inserted, {diff['updated']} updated, {diff['unchanged']} unchanged, {diff['deactivated']} deactivated, {diff['failed']} failed",
+                        ip_address=request.remote_addr,
+                        user_agent=request.headers.get('User-Agent', ''),
+                        target_type='student',
+                        counts={key: diff[key] for key in ('inserted', 'updated', 'unchanged', 'deactivated', 'failed')}
+                    )
+
+                return jsonify({
+                    "message": f"{'Dry run' if dry_run else 'Upsert'} completed. {diff['inserted']} new, {diff['updated']} changed, {diff['unchanged']} unchanged, {diff['deactivated']} deactivated.",
+                    "diff": diff,
+                    "errors": errors[:100]
+                }), 200 if 'error' not in diff else 400
+
             # For large imports, we need special handling
             is_large_import = len(data) > 200
             
             # Import students with optimized batch processing
-            imported_students, errors, summary = import_students_from_file(data, admin_area=admin_area)
+            imported_students, errors, summary = import_students_from_file(data, admin_area=admin_area, assign_brosis=assign_brosis)
+            
+            # Spooled uploads are single-use once imported
+            if upload_id:
+                discard_upload(upload_id, current_user.id)
             
             # Log import
             AuditLog.log(
                 user_id=current_user.id,
                 action='import_students',
-                details=f"Imported {summary['successful_imports']} students, {summary['failed_imports']} failed",
+                details=f"Imported {summary['successful_imports']} students, {summary['failed_imports']} failed" + (
+                    f", {summary['assigned_to_brosis']} assigned to brosis" if assign_brosis else ""
+                ),
                 ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='student',
+                counts={'success': summary['successful_imports'], 'failed': summary['failed_imports']}
             )
             
             # For very large imports, limit the amount of data returned to improve performance
@@ -563,6 +734,75 @@ def import_students_endpoint():
         return jsonify({"error": f"Server error: {str(e)}"}), 500
         
         
+@student_api.route('/students/import-brosis-mapping', methods=['POST'])
+@jwt_required()
+def import_brosis_mapping_endpoint():
+    """Assign students to BroSis users from a mapping file (studentId, brosisUsername) (protected, admin only)"""
+    try:
+        # Check if user is authenticated and authorized
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+            
+        if not (current_user.role in ['admin', 'root']):
+            return jsonify({"error": "Admin privileges required"}), 403
+            
+        file, upload_id, error_response = _import_file_from_request(current_user)
+        if error_response:
+            return error_response
+            
+        dry_run = request.form.get('dry_run', 'false').lower() == 'true'
+        
+        try:
+            # Read every column as text so student IDs keep their leading zeros
+            if file.filename.lower().endswith('.csv'):
+                df = pd.read_csv(file, dtype=str)
+            else:
+                df = pd.read_excel(file, dtype=str)
+        except Exception as e:
+            logger.error(f"Error reading BroSis mapping file: {str(e)}")
+            return jsonify({"error": f"Error processing file: {str(e)}"}), 400
+            
+        if df.empty:
+            return jsonify({"error": "The uploaded file is empty"}), 400
+            
+        missing_columns = [col for col in MAPPING_COLUMNS if col not in df.columns]
+        if missing_columns:
+            return jsonify({"error": f"The file is missing required columns: {', '.join(missing_columns)}"}), 400
+            
+        data = df[MAPPING_COLUMNS].to_dict('records')
+        
+        # Non-root users can only assign students and BroSis of their own area
+        admin_area = current_user.area if current_user.role != 'root' else None
+        
+        summary, errors = import_brosis_mapping(
+            data,
+            admin_area=admin_area,
+            dry_run=dry_run,
+            current_user_id=current_user.id,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', '')
+        )
+        
+        if 'error' in summary:
+            return jsonify({"error": f"Failed to apply mapping: {summary['error']}", "summary": summary, "errors": errors}), 500
+            
+        # Spooled uploads are single-use once applied
+        if upload_id and not dry_run:
+            discard_upload(upload_id, current_user.id)
+            
+        assigned = f"{summary['wouldAssign']} students would be assigned" if dry_run else f"{summary['assigned']} students assigned"
+        return jsonify({
+            "message": f"{'Dry run' if dry_run else 'Mapping'} completed. {assigned}, {summary['unchanged']} unchanged, {summary['failed']} failed.",
+            "summary": summary,
+            "errors": errors
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error importing BroSis mapping: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 @student_api.route('/students/import-template', methods=['GET'])
 @jwt_required()
 def get_import_template():
@@ -769,62 +1009,61 @@ def bulk_delete_students_endpoint():
         if mode == 'selected' and not student_ids:
             return jsonify({"error": "No student IDs provided for deletion"}), 400
         
-        # Track operation statistics
-        success_count = 0
-        failed_count = 0
-        skipped_count = 0
-        
-        # Handle 'all' mode - get all students matching user's area restrictions
+        # Non-root users can only delete students in their area; 'all' also honours the list filters in the query string
         if mode == 'all':
-            # For non-root users, restrict to their area
-            area_filter = None
-            if current_user.role.lower() != 'root' and current_user.area:
-                area_filter = current_user.area
-                
-            # Get IDs of all students that the user can access
-            filters = {'area': area_filter} if area_filter else {}
-            result = get_all_students(page=1, per_page=sys.maxsize, filters=filters)
-            student_ids = [student.id for student in result.get('students', [])]
-        
-        # Log the bulk delete action
-        AuditLog.log(
-            user_id=current_user.id,
-            action='bulk_delete_students',
-            details=f"Bulk delete initiated for {len(student_ids)} students using mode: {mode}",
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
-        )
-        
-        # Process each student ID
-        for student_id in student_ids:
-            try:
-                # Delete the student - function returns tuple (success_message, error_message)
-                success, error = delete_student(student_id)
-                if success:
-                    success_count += 1
-                else:
-                    # Log the error and continue with other students
-                    logger.error(f"Error deleting student {student_id}: {error}")
-                    failed_count += 1
-            except Exception as e:
-                # Log the error and continue with other students
-                logger.error(f"Exception deleting student {student_id}: {str(e)}")
-                failed_count += 1
-                
-        # Return success response with counts
-        response_data = {
-            "success": success_count,
-            "failed": failed_count,
-            "skipped": skipped_count,
-            "message": f"{success_count} students deleted successfully" if success_count > 0 else "No students were deleted"
-        }
+            filters = _student_filters_from_request(current_user)
+            student_ids = None
+        else:
+            filters = {'area': current_user.area} if current_user.role.lower() != 'root' else {}
         
-        # If there were failures, include error message in response
-        if failed_count > 0:
-            response_data["error"] = f"Failed to delete {failed_count} students"
+        def run(operation):
+            # Log the bulk delete action
+            AuditLog.log(
+                user_id=current_user.id,
+                action='bulk_delete_students',
+                details=f"Bulk delete initiated for {len(student_ids) if student_ids is not None else 'all matching'} students using mode: {mode}",
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='student',
+                target_ids=student_ids,
+                filters=dict(filters, mode=mode)
+            )
+            
+            # Chunked set-based DELETE statements instead of one lookup and commit per student
+            result = bulk_delete_students(
+                filters=filters,
+                student_ids=student_ids,
+                current_user_id=current_user.id,
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                operation=operation
+            )
+            success_count = result['success']
+            failed_count = result['failed']
+            skipped_count = result['skipped']
             
-        return jsonify(response_data), 200 if success_count > 0 else 400
+            # Return success response with counts
+            response_data = {
+                "success": success_count,
+                "failed": failed_count,
+                "skipped": skipped_count,
+                "message": f"{success_count} students deleted successfully" if success_count > 0 else "No students were deleted"
+            }
             
+            # If there were failures, include error message in response
+            if failed_count > 0:
+                response_data["error"] = f"Failed to delete {failed_count} students"
+                
+            return response_data, 200 if success_count > 0 else 400
+            
+        # A retry with the same Idempotency-Key gets the first response back instead of deleting again
+        response_data, status_code, headers = run_bulk_request(
+            'delete_students', current_user.id, {'mode': mode, 'studentIds': student_ids, 'filters': filters}, run
+        )
+        return jsonify(response_data), status_code, headers
+        
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
     except Exception as e:
         logger.error(f"Error in bulk delete students: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
@@ -840,39 +1079,8 @@ def get_student_ids():
         if not current_user:
             return jsonify({"error": "Authentication required"}), 401
         
-        # Get filter parameters from query string
-        filters = {}
-        
-        # Search term filter
-        search = request.args.get('search')
-        if search:
-            filters['search'] = search
-        
-        # Status filter
-        status = request.args.get('status')
-        if status:
-            filters['status'] = status
-            
-        # Matched filter
-        matched = request.args.get('matched')
-        if matched:
-            filters['matched'] = matched
-        
-        # Area filter - apply area restriction for non-root users
-        if current_user.role != 'root':
-            # Non-root users can only see students from their area
-            filters['area'] = current_user.area
-            logger.info(f"Area restriction applied for {current_user.username}: {current_user.area}")
-        else:
-            # Root users can filter by area
-            area = request.args.get('area')
-            if area:
-                filters['area'] = area
-        
-        # House filter
-        house = request.args.get('house')
-        if house:
-            filters['house'] = house
+        # Same filters (and restrictions) as the student list
+        filters = _student_filters_from_request(current_user)
         
         # Log the filters for debugging
         logger.info(f"Student ID filters applied: {filters}")
@@ -937,7 +1145,10 @@ def unmap_student_endpoint(student_id):
             action='unmap_student',
             details=f"Unmapped student {student.student_id} from user {previous_username}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id],
+            filters={'brosis_user_id': previous_user_id}
         )
         
         return jsonify(unmapped_student.to_dict()), 200
@@ -983,75 +1194,28 @@ def assign_students_to_brosis():
         if current_user.role != 'root' and current_user.area != brosis_user.area:
             return jsonify({"error": "You can only assign students to BroSis users in your area"}), 403
         
-        # Process each student
-        results = {
-            "success": [],
-            "failed": []
-        }
-        
-        for student_id in student_ids:
-            try:
-                student = Student.query.get(student_id)
-                
-                if not student:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "Student not found"
-                    })
-                    continue
-                
-                # Check if student is in the same area as the BroSis
-                if student.area != brosis_user.area:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "Student not in the same area as BroSis"
-                    })
-                    continue
-                
-                # Check if student is in the same house as the BroSis (if the BroSis has a house)
-                if brosis_user.house and student.house != brosis_user.house:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "Student not in the same house as BroSis"
-                    })
-                    continue
-                
-                # Assign student to the BroSis
-                student.user_id = brosis_user.id
-                student.matched = True
-                
-                # Add to success list
-                results["success"].append({
-                    "id": student_id,
-                    "studentId": student.student_id,
-                    "fullName": student.full_name
-                })
-                
-            except Exception as e:
-                logger.error(f"Error assigning student {student_id} to BroSis: {str(e)}")
-                results["failed"].append({
-                    "id": student_id,
-                    "reason": str(e)
-                })
-        
-        # Commit changes if any successful assignments
-        if results["success"]:
-            db.session.commit()
-            
-            # Log the assignment
-            AuditLog.log(
-                user_id=current_user.id,
-                action='assign_students_to_brosis',
-                details=f"Assigned {len(results['success'])} students to BroSis {brosis_user.username}",
+        def run(operation):
+            # Chunked set-based UPDATE statements; the area and house rules are checked per chunk
+            results = bulk_assign_students(
+                student_ids,
+                brosis_user,
+                current_user_id=current_user.id,
                 ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                user_agent=request.headers.get('User-Agent', ''),
+                operation=operation
             )
+            return {
+                "message": f"Successfully assigned {len(results['success'])} students to BroSis {brosis_user.username}",
+                "results": results
+            }, 200
+            
+        response_data, status_code, headers = run_bulk_request(
+            'assign_students', current_user.id, {'brosisId': brosis_user.id, 'studentIds': student_ids}, run
+        )
+        return jsonify(response_data), status_code, headers
         
-        return jsonify({
-            "message": f"Successfully assigned {len(results['success'])} students to BroSis {brosis_user.username}",
-            "results": results
-        })
-        
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
     except Exception as e:
         logger.error(f"Error in assign_students_to_brosis: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -1080,85 +1244,95 @@ def unassign_students_from_brosis():
         if not isinstance(student_ids, list) or len(student_ids) == 0:
             return jsonify({"error": "studentIds must be a non-empty list"}), 400
         
-        # Process each student
-        results = {
-            "success": [],
-            "failed": []
-        }
-        
-        for student_id in student_ids:
-            try:
-                student = Student.query.get(student_id)
-                
-                if not student:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "Student not found"
-                    })
-                    continue
-                
-                # Check if the student is actually assigned to a BroSis
-                if not student.matched or not student.user_id:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "Student is not assigned to any BroSis"
-                    })
-                    continue
-                
-                # Non-root users can only unassign students in their area
-                if current_user.role != 'root' and student.area != current_user.area:
-                    results["failed"].append({
-                        "id": student_id,
-                        "reason": "You can only unassign students in your area"
-                    })
-                    continue
-                
-                # Record the previous BroSis for logging
-                previous_user_id = student.user_id
-                previous_user = User.query.get(previous_user_id)
-                previous_username = previous_user.username if previous_user else "unknown"
-                
-                # Unassign student
-                student.user_id = None
-                student.matched = False
-                
-                # Add to success list
-                results["success"].append({
-                    "id": student_id,
-                    "studentId": student.student_id,
-                    "fullName": student.full_name,
-                    "previousBroSis": previous_username
-                })
-                
-            except Exception as e:
-                logger.error(f"Error unassigning student {student_id}: {str(e)}")
-                results["failed"].append({
-                    "id": student_id,
-                    "reason": str(e)
-                })
-        
-        # Commit changes if any successful unassignments
-        if results["success"]:
-            db.session.commit()
-            
-            # Log the unassignment
-            AuditLog.log(
-                user_id=current_user.id,
-                action='unassign_students_from_brosis',
-                details=f"Unassigned {len(results['success'])} students",
+        def run(operation):
+            # Chunked set-based UPDATE statements; non-root callers stay within their area
+            results = bulk_unassign_students(
+                student_ids,
+                current_user,
                 ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                user_agent=request.headers.get('User-Agent', ''),
+                operation=operation
             )
+            return {
+                "message": f"Successfully unassigned {len(results['success'])} students",
+                "results": results
+            }, 200
+            
+        response_data, status_code, headers = run_bulk_request(
+            'unassign_students', current_user.id, {'studentIds': student_ids}, run
+        )
+        return jsonify(response_data), status_code, headers
         
-        return jsonify({
-            "message": f"Successfully unassigned {len(results['success'])} students",
-            "results": results
-        })
-        
+    except BulkOperationError as e:
+        return jsonify({"error": e.message, "operation": e.operation}), e.status_code
     except Exception as e:
         logger.error(f"Error in unassign_students_from_brosis: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@student_api.route('/students/export', methods=['GET'])
+@jwt_required()
+def export_students():
+    """
+    Export students matching the student list filters (search, status, matched, hasHouse,
+    brosisFilter, area, house) to Excel, CSV, Parquet or Arrow. CSV streams from the cursor.
+    """
+    try:
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        if current_user.role not in ['admin', 'root']:
+            return jsonify({"error": "Admin privileges required"}), 403
+        
+        format_type = request.args.get('format', 'excel').lower()
+        if format_type not in EXPORT_FORMATS:
+            return jsonify({"error": f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        if current_user.role == 'admin' and not current_user.area:
+            return jsonify({"error": "Admin user has no assigned area"}), 403
+        
+        # Exactly the filters of the student list (admins are limited to their area)
+        filters = _student_filters_from_request(current_user)
+        
+        if format_type in COLUMNAR_FORMATS:
+            if not columnar_export_available():
+                return jsonify({"error": "Parquet/Arrow export requires the pyarrow package on the server"}), 501
+            build = lambda: generate_columnar_export('students', format_type, filters=filters)
+        else:
+            statement = build_student_export_statement(filters)
+            headers = export_headers(STUDENT_EXPORT_COLUMNS)
+            if format_type == 'csv':
+                build = lambda: {'stream': stream_csv(headers, iter_export_rows(STUDENT_EXPORT_COLUMNS, statement))}
+            else:
+                build = lambda: {'file_obj': write_xlsx(headers, iter_export_rows(STUDENT_EXPORT_COLUMNS, statement), sheet_name='Students')}
+        
+        filename, mimetype = export_file_info('students-export', format_type)
+        response = cached_export_response(
+            'students',
+            filters,
+            EXPORT_FORMATS[format_type][0],
+            filename,
+            mimetype,
+            build
+        )
+        
+        AuditLog.log(
+            user_id=current_user.id,
+            action='export_students',
+            details=f"Exported students to {format_type} format with filters: {filters}",
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            filters={'format': format_type, **filters}
+        )
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in export_students: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 @student_api.route('/students/export-brosis-students', methods=['GET'])
 @jwt_required()
 def export_brosis_students():
@@ -1194,94 +1368,138 @@ def export_brosis_students():
         if current_user.role not in ['root', 'admin'] and current_user.id != brosis_id:
             return jsonify({"error": "You can only export your own students"}), 403
         
-        # Get all students assigned to this BroSis
-        students = Student.query.filter_by(user_id=brosis_id, matched=True).all()
+        # Check there is something to export without loading the students
+        has_students = db.session.query(Student.id).filter_by(user_id=brosis_id, matched=True).first()
         
-        if not students:
+        if not has_students:
             return jsonify({"error": "No students assigned to this BroSis"}), 404
         
-        # Prepare data for export
-        student_data = []
-        for student in students:
-            student_data.append({
-                'Student ID': student.student_id,
-                'Full Name': student.full_name,
-                'Email': student.email,
-                'Phone': student.phone or '',
-                'Area': student.area or '',
-                'House': student.house or '',
-                'Status': student.status or '',
-                'Matched': 'Yes' if student.matched else 'No',
-                'Registration Date': student.registration_date.strftime('%Y-%m-%d') if student.registration_date else '',
-                'Notes': student.notes or ''
-            })
-        
-        # Create pandas DataFrame
-        df = pd.DataFrame(student_data)
+        statement = build_brosis_students_export_statement(brosis_id)
         
         # Generate filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         brosis_name = brosis_user.fullName.replace(' ', '_') if brosis_user.fullName else f'brosis_{brosis_id}'
         
-        # Export based on format
+        headers = export_headers(STUDENT_EXPORT_COLUMNS)
+        
+        # Export based on format (served from the export cache until students change)
         if format_type == 'csv':
-            # Export as CSV
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            mem_value = output.getvalue()
-            
-            filename = f"{brosis_name}_students_{timestamp}.csv"
-            
-            return send_file(
-                io.BytesIO(mem_value.encode()),
-                mimetype='text/csv',
-                download_name=filename,
-                as_attachment=True
+            # CSV misses are streamed straight from the database cursor
+            return cached_export_response(
+                'brosis_students',
+                {'brosis_id': brosis_id},
+                'csv',
+                f"{brosis_name}_students_{timestamp}.csv",
+                CSV_MIMETYPE,
+                lambda: {'stream': stream_csv(headers, iter_export_rows(STUDENT_EXPORT_COLUMNS, statement), bom=False)}
             )
         else:
-            # Export as Excel
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='Students', index=False)
-                
-                # Get the workbook and the worksheet
-                workbook = writer.book
-                worksheet = writer.sheets['Students']
-                
-                # Add some formatting
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
-                
-                # Write the column headers with the defined format
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-                    
-                # Set column widths
-                for i, column in enumerate(df.columns):
-                    column_width = max(df[column].astype(str).map(len).max(), len(column) + 2)
-                    worksheet.set_column(i, i, column_width)
-            
-            # Get the value from the BytesIO object
-            output.seek(0)
-            
-            filename = f"{brosis_name}_students_{timestamp}.xlsx"
-            
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                download_name=filename,
-                as_attachment=True
+            # Excel uses the constant-memory writer fed from the database cursor
+            return cached_export_response(
+                'brosis_students',
+                {'brosis_id': brosis_id},
+                'xlsx',
+                f"{brosis_name}_students_{timestamp}.xlsx",
+                XLSX_MIMETYPE,
+                lambda: {'file_obj': write_xlsx(headers, iter_export_rows(STUDENT_EXPORT_COLUMNS, statement), sheet_name='Students')}
             )
         
     except Exception as e:
         logger.error(f"Error in export_brosis_students: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@student_api.route('/students/export-rosters', methods=['POST'])
+@jwt_required()
+def start_roster_export_endpoint():
+    """
+    Start a background export of all rosters as a ZIP
+    Body: {groupBy: 'brosis'|'house', format: 'excel'|'csv', area (root only)}
+    """
+    try:
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        if current_user.role not in ['admin', 'root']:
+            return jsonify({"error": "Admin privileges required"}), 403
+        
+        data = request.get_json(silent=True) or {}
+        
+        # Admins are limited to their own area
+        area = data.get('area') if current_user.role == 'root' else current_user.area
+        if current_user.role == 'admin' and not area:
+            return jsonify({"error": "Admin user has no assigned area"}), 403
+        
+        status = start_roster_export(
+            current_user.id,
+            group_by=data.get('groupBy', 'brosis'),
+            file_format=data.get('format', 'excel').lower(),
+            area=area
+        )
+        
+        AuditLog.log(
+            user_id=current_user.id,
+            action='export_rosters',
+            details=f"Started roster export {status['jobId']} by {status['groupBy']} ({status['format']}, area: {area or 'all'})",
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            filters={'group_by': status['groupBy'], 'format': status['format'], 'area': area}
+        )
+        
+        return jsonify(status), 202
+        
+    except RosterExportError as e:
+        return jsonify({"error": e.message}), e.status_code
+    except Exception as e:
+        logger.error(f"Error starting roster export: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@student_api.route('/students/export-rosters/<job_id>', methods=['GET'])
+@jwt_required()
+def get_roster_export_endpoint(job_id):
+    """Get the progress of a roster export job"""
+    try:
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        return jsonify(get_roster_export(job_id, current_user.id)), 200
+        
+    except RosterExportError as e:
+        return jsonify({"error": e.message}), e.status_code
+    except Exception as e:
+        logger.error(f"Error getting roster export status: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@student_api.route('/students/export-rosters/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_roster_export_endpoint(job_id):
+    """Download the ZIP of a completed roster export job (supports Range requests)"""
+    try:
+        current_user = get_current_user()
+        
+        if not current_user:
+            return jsonify({"error": "Authentication required"}), 401
+        
+        path, filename = get_roster_export_file(job_id, current_user.id)
+        
+        return send_file(
+            path,
+            mimetype='application/zip',
+            download_name=filename,
+            as_attachment=True,
+            conditional=True
+        )
+        
+    except RosterExportError as e:
+        return jsonify({"error": e.message}), e.status_code
+    except Exception as e:
+        logger.error(f"Error downloading roster export: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
 @student_api.route('/students/distribute-to-brosis', methods=['POST'])
 @jwt_required()
 def distribute_students_to_brosis():
@@ -1441,7 +1659,10 @@ def distribute_students_to_brosis():
                 action='distribute_students_to_brosis',
                 details=f"Distributed {len(results['success'])} students evenly among brosis users (took {elapsed_time:.2f}s)",
                 ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                user_agent=request.headers.get('User-Agent', ''),
+                target_type='student',
+                target_ids=[item['id'] for item in results['success']],
+                counts={'success': len(results['success'])}
             )
         
         return jsonify({
@@ -53,7 +53,10 @@ def unmap_student_endpoint(student_id):
             action='unmap_student',
             details=f"Unmapped student {student.student_id} from user {previous_username}",
             ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent', '')
+            user_agent=request.headers.get('User-Agent', ''),
+            target_type='student',
+            target_ids=[student_id],
+            filters={'brosis_user_id': previous_user_id}
         )
         
         return jsonify(unmapped_student.to_dict()), 200
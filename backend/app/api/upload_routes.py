@@ -0,0 +1,140 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
+from app.services.auth import get_current_user
+from app.services.chunked_upload import (
+    UploadError, append_chunk, complete_upload, discard_upload, get_upload, init_upload
+)
+import logging
+
+# Chunked upload protocol for large import files
+upload_api = Blueprint('upload_routes', __name__)
+logger = logging.getLogger(__name__)
+
+# File types accepted by the import endpoints
+IMPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+
+def _upload_error_response(error):
+    body = {"error": error.message}
+    body.update(error.extra)
+    return jsonify(body), error.status_code
+
+
+def _require_admin():
+    current_user = get_current_user()
+    if not current_user:
+        return None, (jsonify({"error": "Authentication required"}), 401)
+    if current_user.role not in ['admin', 'root']:
+        return None, (jsonify({"error": "Admin privileges required"}), 403)
+    return current_user, None
+
+
+@upload_api.route('/uploads', methods=['POST'])
+@jwt_required()
+def init_upload_endpoint():
+    """Start a chunked upload: {filename, totalSize} -> {uploadId, offset, chunkSize}"""
+    try:
+        current_user, error_response = _require_admin()
+        if error_response:
+            return error_response
+
+        data = request.json
+        if not data or 'filename' not in data or 'totalSize' not in data:
+            return jsonify({"error": "Missing required fields: filename, totalSize"}), 400
+
+        status = init_upload(data['filename'], data['totalSize'], current_user.id, IMPORT_EXTENSIONS)
+        return jsonify(status), 201
+
+    except UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error initializing upload: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@upload_api.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_endpoint(upload_id):
+    """Get upload status - clients resume from the returned offset"""
+    try:
+        current_user, error_response = _require_admin()
+        if error_response:
+            return error_response
+
+        return jsonify(get_upload(upload_id, current_user.id)), 200
+
+    except UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error getting upload status: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@upload_api.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def append_chunk_endpoint(upload_id):
+    """
+    Append a chunk: raw body, ?offset=<bytes already received>, X-Chunk-Checksum: <sha256 hex>
+    """
+    try:
+        current_user, error_response = _require_admin()
+        if error_response:
+            return error_response
+
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({"error": "offset query parameter is required"}), 400
+
+        status = append_chunk(
+            upload_id,
+            current_user.id,
+            offset,
+            request.stream,
+            request.headers.get('X-Chunk-Checksum')
+        )
+        return jsonify(status), 200
+
+    except UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error appending upload chunk: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@upload_api.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload_endpoint(upload_id):
+    """Finish an upload: optional {checksum: <sha256 hex of the whole file>}"""
+    try:
+        current_user, error_response = _require_admin()
+        if error_response:
+            return error_response
+
+        data = request.get_json(silent=True) or {}
+        status = complete_upload(upload_id, current_user.id, data.get('checksum'))
+        return jsonify(status), 200
+
+    except UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error completing upload: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+@upload_api.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def discard_upload_endpoint(upload_id):
+    """Cancel an upload and remove its spooled data"""
+    try:
+        current_user, error_response = _require_admin()
+        if error_response:
+            return error_response
+
+        discard_upload(upload_id, current_user.id)
+        return jsonify({"message": "Upload discarded"}), 200
+
+    except UploadError as e:
+        return _upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error discarding upload: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
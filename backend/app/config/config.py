@@ -20,3 +20,63 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-for-development-only'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    
+    # Chunked upload settings (large import files are spooled to disk)
+    UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'uploads')
+    UPLOAD_MAX_SIZE_MB = int(os.environ.get('UPLOAD_MAX_SIZE_MB', 500))
+    UPLOAD_CHUNK_SIZE_MB = int(os.environ.get('UPLOAD_CHUNK_SIZE_MB', 8))
+    UPLOAD_EXPIRY_HOURS = int(os.environ.get('UPLOAD_EXPIRY_HOURS', 24))
+    
+    # Export cache (generated export files are reused until the underlying tables change)
+    EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'export_cache')
+    EXPORT_CACHE_MAX_SIZE_MB = int(os.environ.get('EXPORT_CACHE_MAX_SIZE_MB', 1024))
+    
+    # Background roster exports (ZIP of one file per BroSis / house)
+    EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'export_jobs')
+    EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', min(4, os.cpu_count() or 1)))
+    EXPORT_JOB_EXPIRY_HOURS = int(os.environ.get('EXPORT_JOB_EXPIRY_HOURS', 24))
+    EXPORT_JOB_STALE_SECONDS = int(os.environ.get('EXPORT_JOB_STALE_SECONDS', 300))
+    
+    # Password hashing (argon2id) - tune with `database_tool.py benchmark-password` so login stays within budget
+    PASSWORD_HASH_TIME_COST = int(os.environ.get('PASSWORD_HASH_TIME_COST', 3))
+    PASSWORD_HASH_MEMORY_COST = int(os.environ.get('PASSWORD_HASH_MEMORY_COST', 65536))  # KiB
+    PASSWORD_HASH_PARALLELISM = int(os.environ.get('PASSWORD_HASH_PARALLELISM', 4))
+    PASSWORD_HASH_BUDGET_MS = int(os.environ.get('PASSWORD_HASH_BUDGET_MS', 250))  # p99 verification time per login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))  # bulk reset / import
+    
+    # Login concurrency across all workers (argon2id verification is CPU and memory heavy)
+    LOGIN_LOCK_DIR = os.environ.get('LOGIN_LOCK_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'login_slots')
+    LOGIN_MAX_CONCURRENCY = int(os.environ.get('LOGIN_MAX_CONCURRENCY', os.cpu_count() or 1))
+    LOGIN_QUEUE_SIZE = int(os.environ.get('LOGIN_QUEUE_SIZE', max(1, (os.cpu_count() or 1) // 2)))
+    LOGIN_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LOGIN_QUEUE_TIMEOUT_SECONDS', 5))
+    LOGIN_RETRY_AFTER_SECONDS = int(os.environ.get('LOGIN_RETRY_AFTER_SECONDS', 2))
+    
+    # Per-worker cache of authenticated users (id, role, area, house, status) used by get_current_user
+    PRINCIPAL_CACHE_TTL_SECONDS = int(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', 60))  # 0 disables the cache
+    PRINCIPAL_CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_VERSION_CHECK_SECONDS', 2))
+    PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', 10000))
+    
+    # Buffered audit log writer (entries are written in batches outside the request transaction)
+    AUDIT_LOG_BUFFER_SIZE = int(os.environ.get('AUDIT_LOG_BUFFER_SIZE', 200))  # 0 or 1 writes every entry right away
+    AUDIT_LOG_FLUSH_INTERVAL_SECONDS = float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL_SECONDS', 1.0))
+    AUDIT_LOG_MAX_PENDING = int(os.environ.get('AUDIT_LOG_MAX_PENDING', 50000))
+    
+    # Monthly audit_log partitions (PostgreSQL): created ahead of time, detached once older than the hot window
+    AUDIT_LOG_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_LOG_PARTITIONS_AHEAD', 3))
+    AUDIT_LOG_HOT_MONTHS = int(os.environ.get('AUDIT_LOG_HOT_MONTHS', 12))
+    
+    # Chunked bulk operations (user/student bulk delete, status change, password reset, BroSis assign/unassign)
+    BULK_OPERATION_CHUNK_SIZE = int(os.environ.get('BULK_OPERATION_CHUNK_SIZE', 1000))  # ids per statement and commit
+    BULK_OPERATION_STALE_SECONDS = int(os.environ.get('BULK_OPERATION_STALE_SECONDS', 300))  # a running operation without progress for this long may be retried
+    BULK_OPERATION_KEY_EXPIRY_HOURS = int(os.environ.get('BULK_OPERATION_KEY_EXPIRY_HOURS', 24))  # Idempotency-Key retention
+    
+    # Audit retention (`database_tool.py audit-compact` / `audit-archive` / `audit-scan`)
+    AUDIT_LOG_COMPACT_AFTER_DAYS = int(os.environ.get('AUDIT_LOG_COMPACT_AFTER_DAYS', 30))
+    AUDIT_LOG_COMPACT_GAP_SECONDS = int(os.environ.get('AUDIT_LOG_COMPACT_GAP_SECONDS', 300))
+    AUDIT_LOG_ARCHIVE_DIR = os.environ.get('AUDIT_LOG_ARCHIVE_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'audit_archive')
+    AUDIT_LOG_ARCHIVE_COMPRESSION = os.environ.get('AUDIT_LOG_ARCHIVE_COMPRESSION', 'zstd')  # gzip if zstandard is not installed
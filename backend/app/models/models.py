@@ -1,11 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
-import hashlib
-import os
-import argon2
 from datetime import datetime
+import logging
 import pyotp
+from sqlalchemy import event, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+from app.utils.password import ARGON2ID, hash_password, needs_rehash, verify_password
 
 db = SQLAlchemy()
+logger = logging.getLogger(__name__)
 
 class Area(db.Model):
     """Area model for representing geographical locations like cities"""
@@ -59,58 +63,28 @@ class User(db.Model):
     two_factor_secret = db.Column(db.String(32), nullable=True)
     two_factor_enabled = db.Column(db.Boolean, nullable=True)
     password_change_required = db.Column(db.Boolean, default=True)  # Default to True so normal users must change initial password
+
+    # Functional indexes for case-insensitive duplicate lookups (used by bulk import)
+    __table_args__ = (
+        db.Index('ix_user_username_lower', db.func.lower(username)),
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+    )
+
+    # Usernames that are always treated as root accounts (see is_protected_user)
+    PROTECTED_USERNAMES = ['root', 'admin', 'superadmin', 'administrator']
     
-    def set_password(self, password, hash_type="sha256"):
-        """
-        Set the password using the specified hashing algorithm
-        - sha256: Default hashing (backward compatible)
-        - argon2id: Advanced hashing for root user
-        """
-        self.hash_type = hash_type
-        
-        if hash_type == "argon2id":
-            # Use Argon2id for stronger security (for root user)
-            hasher = argon2.PasswordHasher(
-                time_cost=3,  # Number of iterations
-                memory_cost=65536,  # Memory usage in kibibytes
-                parallelism=4,  # Number of parallel threads
-                hash_len=32,  # Length of the hash in bytes
-                salt_len=16,  # Length of the salt in bytes
-                encoding='utf-8',  # The encoding of the password
-                type=argon2.Type.ID  # The Argon2 variant to use
-            )
-            self.password_hash = hasher.hash(password)
-        else:
-            # Simple password hashing using sha256 (default for backward compatibility)
-            salt = os.urandom(32)
-            self.password_hash = hashlib.sha256(salt + password.encode()).hexdigest() + ':' + salt.hex()
+    def set_password(self, password):
+        """Hash the password with the shared argon2id hasher (see app.utils.password)"""
+        self.hash_type = ARGON2ID
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        if not self.password_hash:
-            return False
-        
-        # Check which hashing algorithm was used
-        hash_type = getattr(self, 'hash_type', 'sha256')  # Default to sha256 if attribute doesn't exist
-        
-        if hash_type == "argon2id":
-            # Argon2id verification
-            try:
-                hasher = argon2.PasswordHasher()
-                hasher.verify(self.password_hash, password)
-                return True
-            except argon2.exceptions.VerifyMismatchError:
-                return False
-            except Exception:
-                return False
-        else:
-            # Simple password verification with SHA-256 (default)
-            try:
-                stored_hash, salt_hex = self.password_hash.split(':')
-                salt = bytes.fromhex(salt_hex)
-                calculated_hash = hashlib.sha256(salt + password.encode()).hexdigest()
-                return stored_hash == calculated_hash
-            except Exception:
-                return False
+        """Verify a password against the argon2id or legacy salted SHA-256 hash"""
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Whether the stored hash should be upgraded on the next successful login"""
+        return needs_rehash(self.password_hash)
     
     def setup_2fa(self):
         """Set up 2FA for the user"""
@@ -167,11 +141,24 @@ class User(db.Model):
             return True
             
         # Fallback check: for very old databases that might not have proper role fields
-        if self.username and self.username.lower() in ['root', 'admin', 'superadmin', 'administrator']:
+        if self.username and self.username.lower() in self.PROTECTED_USERNAMES:
             return True
             
         return False
     
+    @classmethod
+    def protected_user_clause(cls):
+        """
+        SQL counterpart of is_protected_user, for bulk statements that filter protected users in the WHERE clause
+        
+        NULL role / is_root count as not set, exactly like the property.
+        """
+        return db.or_(
+            db.func.coalesce(cls.role, '') == 'root',
+            db.func.coalesce(cls.is_root, False) == True,
+            db.func.lower(cls.username).in_(cls.PROTECTED_USERNAMES)
+        )
+    
     def to_dict(self):
         """Convert user object to dictionary for API responses"""
         # Use the new role field if available, otherwise calculate from is_root/is_admin for compatibility
@@ -204,35 +191,261 @@ class User(db.Model):
 
 
 class AuditLog(db.Model):
-    """Model for tracking user actions for audit purposes"""
+    """
+    Model for tracking user actions for audit purposes
+    
+    On PostgreSQL the table is partitioned by month on timestamp (see
+    app.services.audit_log); the indexes below are created on every partition.
+    
+    `details` is the human-readable description; `payload` holds the same
+    facts in structured form ({"target_type": "student", "target_ids": [..],
+    "counts": {..}, "filters": {..}}) so containment queries such as "every
+    event that involved student 123" use the GIN index instead of LIKE.
+    """
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     action = db.Column(db.String(100), nullable=False)  # e.g., "create_user", "delete_user"
     details = db.Column(db.Text, nullable=True)  # JSON or text description of the action
     ip_address = db.Column(db.String(50), nullable=True)
     user_agent = db.Column(db.String(255), nullable=True)
+    payload = db.Column(db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql'), nullable=True)
     
     # Create relationship with User model
     user = db.relationship('User', backref=db.backref('audit_logs', lazy=True))
     
+    __table_args__ = (
+        # Time-range scans; tiny because rows arrive in timestamp order
+        db.Index('ix_audit_log_timestamp_brin', 'timestamp', postgresql_using='brin'),
+        # Keyset pagination (newest first), unfiltered and per user / per action
+        db.Index('ix_audit_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_audit_log_user_id_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_audit_log_action_timestamp', 'action', 'timestamp', 'id'),
+        # payload @> '{...}' containment lookups
+        db.Index('ix_audit_log_payload', 'payload', postgresql_using='gin', postgresql_ops={'payload': 'jsonb_path_ops'}),
+    )
+    
+    def to_dict(self, username=None):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'user_id': self.user_id,
+            'username': username,
+            'action': self.action,
+            'details': self.details,
+            'ip_address': self.ip_address,
+            'user_agent': self.user_agent,
+            'payload': self.payload
+        }
+    
+    @staticmethod
+    def build_payload(target_type=None, target_ids=None, counts=None, filters=None):
+        """
+        Structured payload of an entry, or None when there is nothing to record
+        
+        Args:
+            target_type (str): Kind of record acted on, e.g. 'user', 'student', 'area'
+            target_ids (iterable): IDs of the records acted on
+            counts (dict): Outcome counters, e.g. {'success': 10, 'failed': 1}
+            filters (dict): Selection criteria of an operation on "all" records
+        """
+        payload = {}
+        if target_type:
+            payload['target_type'] = target_type
+        if target_ids is not None:
+            payload['target_ids'] = [int(target_id) for target_id in target_ids]
+        if counts:
+            payload['counts'] = counts
+        if filters:
+            payload['filters'] = filters
+        return payload or None
+    
+    @classmethod
+    def log(cls, user_id, action, details=None, ip_address=None, user_agent=None,
+            target_type=None, target_ids=None, counts=None, filters=None):
+        """
+        Queue an audit log entry for the buffered writer (app.services.audit_writer)
+        
+        The entry is written with other buffered entries on a separate connection;
+        the caller's session is neither flushed nor committed. target_type,
+        target_ids, counts and filters make up the structured payload.
+        """
+        from app.services.audit_writer import enqueue_audit_entry
+        enqueue_audit_entry({
+            'timestamp': datetime.utcnow(),
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'payload': cls.build_payload(target_type, target_ids, counts, filters)
+        })
+    
     @classmethod
-    def log(cls, user_id, action, details=None, ip_address=None, user_agent=None):
-        """Create an audit log entry"""
+    def add(cls, user_id, action, details=None, ip_address=None, user_agent=None,
+            target_type=None, target_ids=None, counts=None, filters=None):
+        """Add an audit log entry to the current session; it is written by the caller's commit"""
         log_entry = cls(
             user_id=user_id,
             action=action,
             details=details,
             ip_address=ip_address,
-            user_agent=user_agent
+            user_agent=user_agent,
+            payload=cls.build_payload(target_type, target_ids, counts, filters)
         )
         db.session.add(log_entry)
-        db.session.commit()
         return log_entry
     
     def __repr__(self):
         return f'<AuditLog {self.id} - {self.action}>'
 
+
+@event.listens_for(AuditLog.__table__, 'after_create')
+def _partition_created_audit_log(target, connection, **kw):
+    """create_all makes a plain table; convert it to monthly partitions on PostgreSQL"""
+    from app.services.audit_log import partition_audit_log
+    partition_audit_log(connection)
+
+class DataVersion(db.Model):
+    """Change counter per table, bumped right after every committed write to it"""
+    __tablename__ = 'data_version'
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @classmethod
+    def get_versions(cls, table_names):
+        """Return {table_name: version} for the given tables (0 if never written)"""
+        rows = db.session.query(cls.table_name, cls.version).filter(cls.table_name.in_(table_names)).all()
+        versions = {name: 0 for name in table_names}
+        versions.update(dict(rows))
+        return versions
+    
+    def __repr__(self):
+        return f'<DataVersion {self.table_name}={self.version}>'
+
+
+# Tables whose writes bump DataVersion (export caches are keyed on these versions)
+VERSIONED_TABLES = ('user', 'student')
+
+
+def _mark_tables_changed(session, table_names):
+    changed = {name for name in table_names if name in VERSIONED_TABLES}
+    if changed:
+        session.info.setdefault('changed_tables', set()).update(changed)
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_flushed_tables(session, flush_context, instances):
+    """Record tables touched by ORM inserts, updates and deletes"""
+    _mark_tables_changed(session, {
+        obj.__table__.name
+        for collection in (session.new, session.dirty, session.deleted)
+        for obj in collection
+        if hasattr(obj, '__table__')
+    })
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    """Record tables touched by bulk insert/update/delete statements"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _mark_tables_changed(orm_execute_state.session, {mapper.local_table.name})
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_data_versions(session):
+    """
+    Bump the versions of changed tables once their writes are committed
+    
+    The bump is a short transaction of its own instead of part of the writing
+    transaction, so writers do not hold the data_version row lock until they
+    commit and concurrent commits only contend for one single-row UPDATE.
+    A reader can briefly see the new rows under the old version; the bump that
+    follows moves every cache key past whatever it built from them.
+    """
+    changed = session.info.pop('changed_tables', None)
+    if not changed:
+        return
+    
+    table = DataVersion.__table__
+    try:
+        with session.get_bind().connect() as connection:
+            for table_name in sorted(changed):
+                values = {'updated_at': datetime.utcnow()}
+                result = connection.execute(
+                    update(table).where(table.c.table_name == table_name).values(version=table.c.version + 1, **values)
+                )
+                if result.rowcount == 0:
+                    try:
+                        connection.execute(insert(table).values(table_name=table_name, version=1, **values))
+                    except IntegrityError:
+                        # Created concurrently by another writer: bump that row instead
+                        connection.rollback()
+                        connection.execute(
+                            update(table).where(table.c.table_name == table_name).values(version=table.c.version + 1, **values)
+                        )
+                connection.commit()
+    except Exception as e:
+        # The writes are already committed; a missed bump only delays cache invalidation until the next write
+        logger.error(f"Failed to bump data versions of {sorted(changed)}: {str(e)}")
+
+
+class BulkOperation(db.Model):
+    """Progress and result of one chunked bulk operation (see app.services.bulk_operations)"""
+    __tablename__ = 'bulk_operation'
+    id = db.Column(db.Integer, primary_key=True)
+    operation = db.Column(db.String(50), nullable=False)  # e.g. 'delete_users', 'assign_students'
+    # Not a foreign key: the record (and its idempotency key) outlives users deleted by the operation itself
+    user_id = db.Column(db.Integer, nullable=False)
+    idempotency_key = db.Column(db.String(100), nullable=True)
+    request_hash = db.Column(db.String(64), nullable=False)  # Fingerprint of the request parameters
+    status = db.Column(db.String(20), nullable=False, default='running')  # 'running', 'completed' or 'failed'
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    success = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql'))  # Response body, replayed for the same key
+    status_code = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Idempotency keys are scoped to the user that sent them
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_bulk_operation_user_key'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'operation': self.operation,
+            'idempotencyKey': self.idempotency_key,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'success': self.success,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'error': self.error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+            'completedAt': self.completed_at.isoformat() if self.completed_at else None
+        }
+        
+    def __repr__(self):
+        return f'<BulkOperation {self.id} {self.operation} {self.status}>'
+
+
 class Group(db.Model):
     """Model for mentor-managed student groups"""
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,436 @@
+"""
+Audit log retention: compaction, compressed archives and archive scans
+
+Bulk operations write one audit row per affected record. Once those rows are
+older than AUDIT_LOG_COMPACT_AFTER_DAYS, compact_audit_log() collapses each
+burst of per-item rows (same actor and action, no gap longer than
+AUDIT_LOG_COMPACT_GAP_SECONDS) into one summary row whose payload lists every
+target id.
+
+Months older than AUDIT_LOG_HOT_MONTHS are moved out of the database by
+archive_audit_month(): the month's rows are written as NDJSON, compressed in
+independent blocks (zstd frames when the optional zstandard package is
+installed, gzip members otherwise, so `zstd -dc` / `zcat` read the whole
+file), recorded in index.json with per-block time range, actions, users and
+byte offsets, and then dropped from the database (the whole partition on
+PostgreSQL). scan_audit_archives() uses the block index to decompress only
+blocks that can match.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import column, delete, func, insert, select, table, text, tuple_
+
+from app.models.models import AuditLog, db
+from app.services.audit_log import (
+    add_months, audit_partition_name, detach_audit_partition, is_audit_log_partitioned,
+    list_audit_partitions, month_start
+)
+from app.services.export import iter_export_batches
+
+# Per-item actions written once per affected record by bulk operations
+COMPACTABLE_AUDIT_ACTIONS = (
+    'delete_user_in_bulk',
+    'change_user_status_in_bulk',
+    'reset_password_in_bulk',
+    'root_user_protection',
+)
+
+# Rows read per keyset page while compacting
+COMPACT_PAGE_SIZE = 5000
+
+# Maximum number of ids per DELETE ... IN (...) list
+COMPACT_DELETE_CHUNK_SIZE = 1000
+
+# Rows per independently compressed archive block
+ARCHIVE_BLOCK_ROWS = 5000
+
+ARCHIVE_INDEX_FILE = 'index.json'
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+# Entries written before structured payloads name their target as "(ID: 123)"
+DETAILS_ID_PATTERN = re.compile(r'\(ID: (\d+)\)')
+
+AUDIT_COLUMNS = ('id', 'timestamp', 'user_id', 'action', 'details', 'ip_address', 'user_agent', 'payload')
+
+
+def zstd_available():
+    """Whether the zstandard package is installed"""
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def archive_compression(preferred):
+    """The compression actually used: zstd falls back to gzip without zstandard"""
+    if preferred == 'zstd' and zstd_available():
+        return 'zstd'
+    return 'gzip'
+
+
+def _compress(data, compression):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(data, compression):
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def entry_target_ids(payload, details):
+    """Target ids of an entry: from its payload, or parsed from legacy details text"""
+    if payload and payload.get('target_ids') is not None:
+        return payload['target_ids']
+    return [int(match) for match in DETAILS_ID_PATTERN.findall(details or '')]
+
+
+# === Compaction ===
+
+class _CompactionGroup:
+    """Consecutive per-item rows of one actor and action"""
+
+    def __init__(self, row):
+        self.first = row
+        self.last_timestamp = row.timestamp
+        self.keys = []
+        self.target_ids = []
+        self.target_type = None
+        self.add(row)
+
+    def add(self, row):
+        self.keys.append((row.id, row.timestamp))
+        self.last_timestamp = row.timestamp
+        self.target_ids.extend(entry_target_ids(row.payload, row.details))
+        if row.payload and row.payload.get('target_type'):
+            self.target_type = row.payload['target_type']
+
+    def summary(self):
+        first = self.first
+        count = len(self.keys)
+        payload = AuditLog.build_payload(
+            self.target_type or 'user',
+            sorted(set(self.target_ids)),
+            counts={'entries': count}
+        )
+        payload['compacted'] = {'first': first.timestamp.isoformat(), 'last': self.last_timestamp.isoformat()}
+        return {
+            'timestamp': first.timestamp,
+            'user_id': first.user_id,
+            'action': first.action,
+            'details': f"Compacted {count} '{first.action}' entries from {first.timestamp:%Y-%m-%d %H:%M:%S} "
+                       f"to {self.last_timestamp:%Y-%m-%d %H:%M:%S}",
+            'ip_address': first.ip_address,
+            'user_agent': first.user_agent,
+            'payload': payload
+        }
+
+
+def _write_compacted(engine, groups):
+    """Insert one summary per group and delete the rows it replaces (one transaction)"""
+    with engine.begin() as connection:
+        connection.execute(insert(AuditLog.__table__), [group.summary() for group in groups])
+        for group in groups:
+            # The timestamp range lets PostgreSQL prune to the group's partition(s)
+            for start in range(0, len(group.keys), COMPACT_DELETE_CHUNK_SIZE):
+                ids = [log_id for log_id, _ in group.keys[start:start + COMPACT_DELETE_CHUNK_SIZE]]
+                connection.execute(delete(AuditLog.__table__).where(
+                    AuditLog.id.in_(ids),
+                    AuditLog.timestamp.between(group.first.timestamp, group.last_timestamp)
+                ))
+
+
+def compact_audit_log(older_than_days, gap_seconds, actions=COMPACTABLE_AUDIT_ACTIONS):
+    """
+    Collapse old per-item bulk audit rows into per-operation summaries
+
+    Rows are read oldest first in keyset pages. A group closes when its actor
+    logs the same action after more than `gap_seconds`, or once the scan is
+    more than `gap_seconds` past it; closed groups of two or more rows are
+    replaced by their summary after every page.
+
+    Args:
+        older_than_days (int): Only rows older than this are compacted
+        gap_seconds (int): Longest pause between rows of one operation
+        actions (tuple): Per-item actions to compact
+
+    Returns:
+        dict: scanned rows, groups written and rows removed
+    """
+    engine = db.engine
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    gap = timedelta(seconds=gap_seconds)
+    stats = {'scanned': 0, 'groups': 0, 'removed': 0}
+
+    open_groups = {}
+    last_key = None
+    while True:
+        statement = (
+            select(AuditLog.id, AuditLog.timestamp, AuditLog.user_id, AuditLog.action, AuditLog.details,
+                   AuditLog.ip_address, AuditLog.user_agent, AuditLog.payload)
+            .where(AuditLog.action.in_(actions), AuditLog.timestamp < cutoff)
+            .order_by(AuditLog.timestamp, AuditLog.id)
+            .limit(COMPACT_PAGE_SIZE)
+        )
+        if last_key is not None:
+            statement = statement.where(tuple_(AuditLog.timestamp, AuditLog.id) > tuple_(*last_key))
+        with engine.connect() as connection:
+            rows = connection.execute(statement).all()
+
+        closed = []
+        for row in rows:
+            if row.payload and 'compacted' in row.payload:
+                # Summary written by an earlier run
+                continue
+            key = (row.user_id, row.action)
+            group = open_groups.get(key)
+            if group is not None and row.timestamp - group.last_timestamp <= gap:
+                group.add(row)
+            else:
+                if group is not None:
+                    closed.append(group)
+                open_groups[key] = _CompactionGroup(row)
+        stats['scanned'] += len(rows)
+
+        if rows:
+            last_key = (rows[-1].timestamp, rows[-1].id)
+            # Groups the scan has moved well past cannot grow any more
+            for key, group in list(open_groups.items()):
+                if last_key[0] - group.last_timestamp > gap:
+                    closed.append(open_groups.pop(key))
+        else:
+            closed.extend(open_groups.values())
+            open_groups.clear()
+
+        closed = [group for group in closed if len(group.keys) > 1]
+        if closed:
+            _write_compacted(engine, closed)
+            stats['groups'] += len(closed)
+            stats['removed'] += sum(len(group.keys) for group in closed)
+
+        if not rows:
+            return stats
+
+
+# === Archives ===
+
+def _index_path(archive_dir):
+    return os.path.join(archive_dir, ARCHIVE_INDEX_FILE)
+
+
+def load_archive_index(archive_dir):
+    """The archive index ({'archives': {name: entry}}), empty if there is none yet"""
+    try:
+        with open(_index_path(archive_dir), encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except FileNotFoundError:
+        return {'version': 1, 'archives': {}}
+
+
+def _save_archive_index(archive_dir, index):
+    path = _index_path(archive_dir)
+    with open(path + '.tmp', 'w', encoding='utf-8') as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _serialize_entry(row):
+    entry = dict(zip(AUDIT_COLUMNS, row))
+    entry['timestamp'] = entry['timestamp'].isoformat() if entry['timestamp'] else None
+    return entry
+
+
+def archivable_audit_months(hot_months):
+    """
+    Months older than the hot window that are still in the database
+
+    Returns:
+        list: Month start datetimes, oldest first
+    """
+    oldest_hot = add_months(month_start(datetime.utcnow()), 1 - hot_months)
+
+    with db.engine.connect() as connection:
+        if is_audit_log_partitioned(connection):
+            # Attached and already detached partitions alike
+            return [partition['month'] for partition in list_audit_partitions(connection)
+                    if partition['month'] < oldest_hot]
+
+        oldest = connection.execute(select(func.min(AuditLog.timestamp))).scalar()
+        months = []
+        month = month_start(oldest) if oldest is not None else oldest_hot
+        while month < oldest_hot:
+            # Months without rows are skipped (one index probe each)
+            has_rows = connection.execute(
+                select(AuditLog.id)
+                .where(AuditLog.timestamp >= month, AuditLog.timestamp < add_months(month, 1))
+                .limit(1)
+            ).first()
+            if has_rows:
+                months.append(month)
+            month = add_months(month, 1)
+    return months
+
+
+def archive_audit_month(month, archive_dir, compression='zstd'):
+    """
+    Export one month of audit rows to a compressed NDJSON archive and drop them
+
+    On a partitioned table the month's partition is detached concurrently
+    first (if still attached), read, and dropped; otherwise the month's rows
+    are read from audit_log and deleted. The database is only changed after
+    the archive file and its index entry are written.
+
+    Returns:
+        dict: The index entry of the archive (None if the month had no rows)
+    """
+    engine = db.engine
+    os.makedirs(archive_dir, exist_ok=True)
+    name = audit_partition_name(month)
+    compression = archive_compression(compression)
+    next_month = add_months(month, 1)
+
+    with engine.connect() as connection:
+        partitioned = is_audit_log_partitioned(connection)
+        partition = None
+        if partitioned:
+            partition = next((p for p in list_audit_partitions(connection) if p['name'] == name), None)
+    if partitioned:
+        if partition is None:
+            return None
+        if partition['attached']:
+            detach_audit_partition(engine, name)
+        source = table(name, *[column(column_name) for column_name in AUDIT_COLUMNS])
+        statement = select(*source.c).order_by(source.c.timestamp, source.c.id)
+    else:
+        source = AuditLog.__table__
+        statement = (
+            select(*[source.c[column_name] for column_name in AUDIT_COLUMNS])
+            .where(source.c.timestamp >= month, source.c.timestamp < next_month)
+            .order_by(source.c.timestamp, source.c.id)
+        )
+
+    filename = f"{name}.ndjson.{'zst' if compression == 'zstd' else 'gz'}"
+    path = os.path.join(archive_dir, filename)
+    digest = hashlib.sha256()
+    blocks = []
+    total_rows = 0
+
+    with open(path + '.tmp', 'wb') as archive_file, engine.connect() as connection:
+        for batch in iter_export_batches(statement, ARCHIVE_BLOCK_ROWS, connection):
+            entries = [_serialize_entry(row) for row in batch]
+            data = _compress(''.join(json.dumps(entry, default=str) + '\n' for entry in entries).encode('utf-8'), compression)
+            blocks.append({
+                'offset': archive_file.tell(),
+                'length': len(data),
+                'rows': len(entries),
+                'first_timestamp': entries[0]['timestamp'],
+                'last_timestamp': entries[-1]['timestamp'],
+                'min_id': min(entry['id'] for entry in entries),
+                'max_id': max(entry['id'] for entry in entries),
+                'actions': sorted({entry['action'] for entry in entries}),
+                'user_ids': sorted({entry['user_id'] for entry in entries if entry['user_id'] is not None}),
+            })
+            archive_file.write(data)
+            digest.update(data)
+            total_rows += len(entries)
+
+    if not total_rows and not partitioned:
+        os.remove(path + '.tmp')
+        return None
+    os.replace(path + '.tmp', path)
+
+    entry = {
+        'file': filename,
+        'month': f"{month:%Y-%m}",
+        'compression': compression,
+        'rows': total_rows,
+        'bytes': os.path.getsize(path),
+        'sha256': digest.hexdigest(),
+        'archived_at': datetime.utcnow().isoformat(),
+        'blocks': blocks,
+    }
+    index = load_archive_index(archive_dir)
+    index['archives'][name] = entry
+    _save_archive_index(archive_dir, index)
+
+    with engine.begin() as connection:
+        if partitioned:
+            connection.execute(text(f"DROP TABLE {name}"))
+        else:
+            connection.execute(delete(source).where(source.c.timestamp >= month, source.c.timestamp < next_month))
+
+    return entry
+
+
+# === Scans ===
+
+def _block_matches(block, filters):
+    if filters.get('since') and block['last_timestamp'] < filters['since'].isoformat():
+        return False
+    if filters.get('until') and block['first_timestamp'] >= filters['until'].isoformat():
+        return False
+    if filters.get('actions') and not set(filters['actions']) & set(block['actions']):
+        return False
+    if filters.get('user_id') is not None and filters['user_id'] not in block['user_ids']:
+        return False
+    return True
+
+
+def _entry_matches(entry, filters):
+    timestamp = entry['timestamp'] or ''
+    if filters.get('since') and timestamp < filters['since'].isoformat():
+        return False
+    if filters.get('until') and timestamp >= filters['until'].isoformat():
+        return False
+    if filters.get('actions') and entry['action'] not in filters['actions']:
+        return False
+    if filters.get('user_id') is not None and entry['user_id'] != filters['user_id']:
+        return False
+    payload = entry.get('payload') or {}
+    if filters.get('target_type') and payload.get('target_type', filters['target_type']) != filters['target_type']:
+        return False
+    if filters.get('target_id') is not None and filters['target_id'] not in entry_target_ids(payload, entry['details']):
+        return False
+    return True
+
+
+def scan_audit_archives(archive_dir, filters=None):
+    """
+    Yield archived audit entries matching the filters, oldest first
+
+    Only blocks whose indexed time range, actions and users can match are read
+    and decompressed.
+
+    Args:
+        archive_dir (str): Directory holding the archives and index.json
+        filters (dict): Optional user_id, actions, since, until, target_type, target_id
+            (same meaning as for query_audit_logs)
+
+    Yields:
+        dict: One audit entry
+    """
+    filters = filters or {}
+    archives = sorted(load_archive_index(archive_dir)['archives'].values(), key=lambda entry: entry['month'])
+    for archive in archives:
+        blocks = [block for block in archive['blocks'] if _block_matches(block, filters)]
+        if not blocks:
+            continue
+        with open(os.path.join(archive_dir, archive['file']), 'rb') as archive_file:
+            for block in blocks:
+                archive_file.seek(block['offset'])
+                data = _decompress(archive_file.read(block['length']), archive['compression'])
+                for line in data.decode('utf-8').splitlines():
+                    entry = json.loads(line)
+                    if _entry_matches(entry, filters):
+                        yield entry
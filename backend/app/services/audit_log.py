@@ -0,0 +1,297 @@
+"""
+Audit log storage and queries
+
+On PostgreSQL audit_log is range-partitioned by month on timestamp
+(audit_log_y2025m06 holds June 2025). Partitions are created ahead of time
+(by the migration, by create_all, by the audit writer when it sees a new
+month, and by `database_tool.py audit-partitions`). Old partitions are
+detached with DETACH PARTITION ... CONCURRENTLY, which only takes a
+SHARE UPDATE EXCLUSIVE lock, so writes to the current month carry on; the
+detached table stays in the database as an archive until it is exported or
+dropped.
+
+Reads page through the log newest first with a keyset cursor on
+(timestamp, id), which the (x, timestamp, id) indexes serve without OFFSET.
+Filters on what an entry touched ("every event involving student 123") are
+payload @> containment tests served by the GIN index on payload.
+"""
+import base64
+import re
+from datetime import datetime
+
+from sqlalchemy import select, text, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.models.models import AuditLog, User, db
+
+AUDIT_LOG_TABLE = 'audit_log'
+
+# audit_log_y2025m06
+PARTITION_NAME_PATTERN = re.compile(r'^audit_log_y(\d{4})m(\d{2})$')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def month_start(value):
+    """First instant of the month containing a datetime"""
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def audit_partition_name(month):
+    return f"{AUDIT_LOG_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name):
+    """Month covered by a partition name, or None if it is not one"""
+    match = PARTITION_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def is_audit_log_partitioned(connection):
+    """Whether audit_log is a partitioned table (always False off PostgreSQL)"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"
+    ), {'table': AUDIT_LOG_TABLE}).scalar()
+    return relkind == 'p'
+
+
+def attached_audit_partitions(connection):
+    """Names of the partitions currently attached to audit_log"""
+    rows = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass(:table)"
+    ), {'table': AUDIT_LOG_TABLE})
+    return {row[0] for row in rows}
+
+
+def ensure_audit_partitions(connection, months):
+    """
+    Create the monthly partitions that do not exist yet
+
+    Creating a partition locks audit_log briefly, so existing ones are looked
+    up first and only missing months are created.
+
+    Args:
+        connection: Connection inside a transaction
+        months (iterable): Datetimes; the partition of each one's month is ensured
+
+    Returns:
+        list: Names of the partitions created
+    """
+    if not is_audit_log_partitioned(connection):
+        return []
+
+    existing = attached_audit_partitions(connection)
+    created = []
+    for month in sorted({month_start(value) for value in months}):
+        name = audit_partition_name(month)
+        if name in existing:
+            continue
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {AUDIT_LOG_TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        ))
+        created.append(name)
+    return created
+
+
+def upcoming_months(months_ahead, now=None):
+    """The current month and the `months_ahead` months after it"""
+    current = month_start(now or datetime.utcnow())
+    return [add_months(current, offset) for offset in range(months_ahead + 1)]
+
+
+def partition_audit_log(connection, months_ahead=3):
+    """
+    Turn a plain audit_log table into a monthly partitioned one (PostgreSQL)
+
+    Used right after create_all creates the table; databases upgraded through
+    migrations are converted by the audit_log_partitioning migration instead.
+    Rows already in the table are copied into their partitions.
+    """
+    if connection.dialect.name != 'postgresql' or is_audit_log_partitioned(connection):
+        return
+
+    connection.execute(text("ALTER TABLE audit_log RENAME TO audit_log_unpartitioned"))
+    for index in AuditLog.__table__.indexes:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    connection.execute(text("ALTER TABLE audit_log_unpartitioned RENAME CONSTRAINT audit_log_pkey TO audit_log_unpartitioned_pkey"))
+    connection.execute(text("ALTER SEQUENCE audit_log_id_seq OWNED BY NONE"))
+    connection.execute(text(
+        "CREATE TABLE audit_log ("
+        " id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),"
+        " timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),"
+        " user_id INTEGER REFERENCES \"user\" (id),"
+        " action VARCHAR(100) NOT NULL,"
+        " details TEXT,"
+        " ip_address VARCHAR(50),"
+        " user_agent VARCHAR(255),"
+        " payload JSONB,"
+        " CONSTRAINT audit_log_pkey PRIMARY KEY (id, timestamp)"
+        ") PARTITION BY RANGE (timestamp)"
+    ))
+    connection.execute(text("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id"))
+
+    oldest = connection.execute(text("SELECT min(timestamp) FROM audit_log_unpartitioned")).scalar()
+    months = upcoming_months(months_ahead)
+    if oldest is not None:
+        month = month_start(oldest)
+        while month < months[0]:
+            months.append(month)
+            month = add_months(month, 1)
+    ensure_audit_partitions(connection, months)
+
+    connection.execute(text(
+        "INSERT INTO audit_log (id, timestamp, user_id, action, details, ip_address, user_agent, payload) "
+        "SELECT id, COALESCE(timestamp, now() AT TIME ZONE 'utc'), user_id, action, details, ip_address, user_agent, payload "
+        "FROM audit_log_unpartitioned"
+    ))
+    connection.execute(text("DROP TABLE audit_log_unpartitioned"))
+
+    # Index definitions come from the model; created on the parent they cascade to every partition
+    for index in AuditLog.__table__.indexes:
+        index.create(connection)
+
+
+def list_audit_partitions(connection):
+    """
+    Monthly partitions of audit_log, attached and detached (archived)
+
+    Returns:
+        list: Dicts with name, month, attached and estimated_rows, oldest first
+    """
+    attached = attached_audit_partitions(connection)
+    rows = connection.execute(text(
+        "SELECT relname, reltuples::bigint FROM pg_class "
+        "WHERE relkind IN ('r', 'p') AND relname LIKE 'audit\\_log\\_y%' "
+        "AND relnamespace = current_schema()::regnamespace"
+    ))
+    partitions = []
+    for name, estimated_rows in rows:
+        month = partition_month(name)
+        if month is None:
+            continue
+        partitions.append({
+            'name': name,
+            'month': month,
+            'attached': name in attached,
+            'estimated_rows': max(estimated_rows, 0)
+        })
+    return sorted(partitions, key=lambda partition: partition['month'])
+
+
+def detach_audit_partition(engine, name):
+    """
+    Detach one monthly partition without blocking writes to the others
+
+    DETACH PARTITION ... CONCURRENTLY cannot run inside a transaction block,
+    so it runs on an autocommit connection. A detach that was interrupted
+    half-way is completed with FINALIZE.
+
+    Raises:
+        ValueError: The name is not an audit log partition, or its month has not ended
+    """
+    month = partition_month(name)
+    if month is None:
+        raise ValueError(f"Not an audit log partition: {name}")
+    if add_months(month, 1) > month_start(datetime.utcnow()):
+        raise ValueError(f"Partition {name} is still being written to")
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        pending = connection.execute(text(
+            "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(:name)"
+        ), {'name': name}).scalar()
+        if pending is None:
+            raise ValueError(f"Partition {name} is not attached to {AUDIT_LOG_TABLE}")
+        if pending:
+            connection.execute(text(f"ALTER TABLE {AUDIT_LOG_TABLE} DETACH PARTITION {name} FINALIZE"))
+        else:
+            connection.execute(text(f"ALTER TABLE {AUDIT_LOG_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+
+
+def encode_audit_cursor(timestamp, log_id):
+    raw = f"{timestamp.isoformat()}|{log_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_audit_cursor(cursor):
+    """
+    Raises:
+        ValueError: The cursor was not produced by encode_audit_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, log_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def query_audit_logs(filters=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of audit log entries, newest first
+
+    Args:
+        filters (dict): Optional user_id, actions (list), since (inclusive), until (exclusive),
+            target_type and target_id (matched against the structured payload; PostgreSQL only)
+        cursor (str): next_cursor of the previous page
+        limit (int): Page size (capped at MAX_PAGE_SIZE)
+
+    Returns:
+        dict: items and next_cursor (None on the last page)
+
+    Raises:
+        ValueError: Bad cursor, or target filters on a database without JSONB
+    """
+    filters = filters or {}
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    statement = (
+        select(AuditLog, User.username)
+        .outerjoin(User, User.id == AuditLog.user_id)
+    )
+    if filters.get('user_id') is not None:
+        statement = statement.where(AuditLog.user_id == filters['user_id'])
+    if filters.get('actions'):
+        statement = statement.where(AuditLog.action.in_(filters['actions']))
+    if filters.get('since'):
+        statement = statement.where(AuditLog.timestamp >= filters['since'])
+    if filters.get('until'):
+        statement = statement.where(AuditLog.timestamp < filters['until'])
+
+    target = {}
+    if filters.get('target_type'):
+        target['target_type'] = filters['target_type']
+    if filters.get('target_id') is not None:
+        target['target_ids'] = [filters['target_id']]
+    if target:
+        if db.engine.dialect.name != 'postgresql':
+            raise ValueError("targetType and targetId filters require PostgreSQL")
+        statement = statement.where(AuditLog.payload.op('@>')(type_coerce(target, JSONB)))
+
+    if cursor:
+        statement = statement.where(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(*decode_audit_cursor(cursor)))
+
+    # One extra row tells whether there is a next page
+    rows = db.session.execute(
+        statement.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1)
+    ).all()
+
+    items = [entry.to_dict(username=username) for entry, username in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_audit_cursor(last.timestamp, last.id)
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,207 @@
+"""
+Buffered audit log writer
+
+AuditLog.log() does not touch the caller's session. Entries are queued in a
+per-process buffer and written with multi-row INSERTs on a connection of
+their own by a background thread, as soon as AUDIT_LOG_BUFFER_SIZE entries
+are waiting or AUDIT_LOG_FLUSH_INTERVAL_SECONDS after the oldest one was
+queued. Whatever is still buffered is written when the process exits
+(atexit, and the gunicorn worker_exit hook). Before writing into a month it
+has not seen yet, the writer makes sure that month's partition and the next
+one exist (PostgreSQL).
+
+AuditLog.add() is the transactional variant: the entry joins the caller's
+session and is written by the caller's commit.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from app.models.models import AuditLog, db
+from app.services.audit_log import add_months, ensure_audit_partitions, month_start
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT ... VALUES statement
+INSERT_CHUNK_SIZE = 500
+
+# Writers of this process, keyed by engine (one per app)
+_writers = {}
+_writers_pid = None
+_writers_lock = threading.Lock()
+
+
+def _is_unavailable(error):
+    """Whether a write failed because of the database rather than the rows"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+class AuditWriter:
+    """Buffers audit rows for one engine and writes them in batches"""
+
+    def __init__(self, engine, buffer_size, flush_interval, max_pending):
+        self.engine = engine
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._entries = []
+        self._oldest_queued_at = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._partition_months = set()
+
+    def enqueue(self, entry):
+        """Queue one audit row (a dict of AuditLog column values)"""
+        with self._lock:
+            if not self._entries:
+                self._oldest_queued_at = time.monotonic()
+            self._entries.append(entry)
+
+            if self.buffer_size > 1:
+                if len(self._entries) >= self.buffer_size:
+                    self._wakeup.notify()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                    self._thread.start()
+
+        # Buffering disabled: write right away (still outside the caller's transaction)
+        if self.buffer_size <= 1:
+            self.flush()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    if len(self._entries) >= self.buffer_size:
+                        break
+                    if self._entries:
+                        remaining = self.flush_interval - (time.monotonic() - self._oldest_queued_at)
+                        if remaining <= 0:
+                            break
+                        self._wakeup.wait(remaining)
+                    else:
+                        self._wakeup.wait()
+            self.flush()
+
+    def flush(self):
+        """
+        Write every buffered row
+
+        If the database cannot be reached, the rows are put back for the next
+        attempt (up to max_pending rows; the oldest are dropped beyond that).
+        If a batch is rejected, it is split in halves and retried, so only the
+        rows the database refuses on their own are dropped (and logged).
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries, self._entries = self._entries, []
+                self._oldest_queued_at = None
+            if not entries:
+                return 0
+
+            try:
+                self._ensure_partitions(entries)
+            except Exception as e:
+                logger.error(f"Failed to create audit log partitions: {str(e)}")
+                self._requeue(entries)
+                return 0
+
+            written = 0
+            batches = [entries]
+            while batches:
+                batch = batches.pop()
+                try:
+                    self._insert(batch)
+                    written += len(batch)
+                except Exception as e:
+                    if _is_unavailable(e):
+                        unwritten = batch + [entry for pending in reversed(batches) for entry in pending]
+                        logger.error(f"Failed to write {len(unwritten)} audit log entries: {str(e)}")
+                        self._requeue(unwritten)
+                        break
+                    if len(batch) == 1:
+                        logger.error(f"Dropped audit log entry {batch[0]!r}: {str(e)}")
+                        continue
+                    # Retry each half on its own (first half first)
+                    middle = len(batch) // 2
+                    batches.append(batch[middle:])
+                    batches.append(batch[:middle])
+
+            return written
+
+    def _insert(self, entries):
+        with self.engine.begin() as connection:
+            for start in range(0, len(entries), INSERT_CHUNK_SIZE):
+                connection.execute(insert(AuditLog.__table__).values(entries[start:start + INSERT_CHUNK_SIZE]))
+
+    def _requeue(self, entries):
+        """Put unwritten rows back in front of the buffer"""
+        with self._lock:
+            self._entries[:0] = entries
+            overflow = len(self._entries) - self.max_pending
+            if overflow > 0:
+                del self._entries[:overflow]
+                logger.error(f"Dropped {overflow} audit log entries (buffer limit {self.max_pending})")
+            if self._entries and self._oldest_queued_at is None:
+                self._oldest_queued_at = time.monotonic()
+
+    def _ensure_partitions(self, entries):
+        """Create missing monthly partitions for the entries (once per month per process)"""
+        if self.engine.dialect.name != 'postgresql':
+            return
+        months = {month_start(entry['timestamp']) for entry in entries} - self._partition_months
+        if not months:
+            return
+
+        # Separate short transaction: creating a partition briefly locks audit_log
+        with self.engine.begin() as connection:
+            ensure_audit_partitions(connection, months | {add_months(month, 1) for month in months})
+        self._partition_months.update(months)
+
+
+def get_audit_writer():
+    """The writer for the current app's database (created on first use)"""
+    global _writers_pid
+    engine = db.engine
+    with _writers_lock:
+        if _writers_pid != os.getpid():
+            # Forked: the parent's buffers and threads are not ours
+            _writers.clear()
+            _writers_pid = os.getpid()
+
+        writer = _writers.get(engine)
+        if writer is None:
+            config = current_app.config
+            writer = _writers[engine] = AuditWriter(
+                engine,
+                config['AUDIT_LOG_BUFFER_SIZE'],
+                config['AUDIT_LOG_FLUSH_INTERVAL_SECONDS'],
+                config['AUDIT_LOG_MAX_PENDING']
+            )
+        return writer
+
+
+def enqueue_audit_entry(entry):
+    """Queue one audit row for the current app's writer"""
+    get_audit_writer().enqueue(entry)
+
+
+@atexit.register
+def flush_audit_writers():
+    """Write everything buffered in this process (called on shutdown)"""
+    if _writers_pid != os.getpid():
+        return 0
+    return sum(writer.flush() for writer in list(_writers.values()))
@@ -1,7 +1,141 @@
 
+import time
+from collections import OrderedDict
 from flask_jwt_extended import create_access_token, get_jwt_identity
-from flask import request
-from app.models.models import User, AuditLog
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models.models import User, AuditLog, DataVersion, db
+from app.utils.password import burn_password_verification
+
+# Per-worker cache of authenticated principals: user id -> (Principal fields, expiry)
+_principal_cache = OrderedDict()
+
+# Last seen DataVersion of the user table and when it was checked
+_principal_cache_user_version = None
+_principal_cache_checked_at = 0.0
+
+class Principal:
+    """
+    The authenticated user as needed for authorization checks
+    
+    id, username, role, area, house and status come from the principal cache.
+    Any other attribute (or assignment) loads the User row on first use, so
+    code written against the User model keeps working unchanged.
+    """
+    __slots__ = ('id', 'username', 'role', 'area', 'house', 'status', '_user')
+    FIELDS = ('id', 'username', 'role', 'area', 'house', 'status')
+    
+    def __init__(self, id, username, role, area, house, status):
+        for name, value in zip(self.FIELDS, (id, username, role, area, house, status)):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_user', None)
+    
+    @property
+    def user(self):
+        """The full User row (loaded on first access)"""
+        user = object.__getattribute__(self, '_user')
+        if user is None:
+            user = db.session.get(User, self.id)
+            object.__setattr__(self, '_user', user)
+        return user
+    
+    def __getattr__(self, name):
+        return getattr(self.user, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+        if name in self.FIELDS:
+            object.__setattr__(self, name, value)
+    
+    def __repr__(self):
+        return f'<Principal {self.id} {self.username} ({self.role})>'
+
+def _check_user_table_version():
+    """
+    Drop the whole cache when another worker changed the user table
+    
+    Checked at most every PRINCIPAL_CACHE_VERSION_CHECK_SECONDS, so deactivations
+    and deletions made elsewhere take effect within that interval.
+    """
+    global _principal_cache_user_version, _principal_cache_checked_at
+    now = time.monotonic()
+    if now - _principal_cache_checked_at < current_app.config['PRINCIPAL_CACHE_VERSION_CHECK_SECONDS']:
+        return
+    
+    version = DataVersion.get_versions(('user',))['user']
+    if version != _principal_cache_user_version:
+        _principal_cache.clear()
+        _principal_cache_user_version = version
+    _principal_cache_checked_at = now
+
+def get_principal(user_id):
+    """
+    Get the cached principal of a user, loading it on a miss
+    
+    Args:
+        user_id (int): User ID
+    
+    Returns:
+        Principal: The principal, or None if the user does not exist
+    """
+    ttl = current_app.config['PRINCIPAL_CACHE_TTL_SECONDS']
+    if ttl <= 0:
+        user = db.session.get(User, user_id)
+        return Principal(*(getattr(user, name) for name in Principal.FIELDS)) if user else None
+    
+    _check_user_table_version()
+    
+    now = time.monotonic()
+    entry = _principal_cache.get(user_id)
+    if entry is not None and entry[1] > now:
+        _principal_cache.move_to_end(user_id)
+        return Principal(*entry[0])
+    
+    row = db.session.query(*(getattr(User, name) for name in Principal.FIELDS)).filter(User.id == user_id).first()
+    if row is None:
+        _principal_cache.pop(user_id, None)
+        return None
+    
+    _principal_cache[user_id] = (tuple(row), now + ttl)
+    _principal_cache.move_to_end(user_id)
+    while len(_principal_cache) > current_app.config['PRINCIPAL_CACHE_MAX_ENTRIES']:
+        _principal_cache.popitem(last=False)
+    return Principal(*row)
+
+def invalidate_principal(user_id=None):
+    """Drop one user (or everyone, when user_id is None) from this worker's principal cache"""
+    if user_id is None:
+        _principal_cache.clear()
+    else:
+        _principal_cache.pop(user_id, None)
+
+@event.listens_for(Session, 'before_flush')
+def _track_changed_principals(session, flush_context, instances):
+    """Remember users updated or deleted in this transaction"""
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User) and obj.id}
+    if changed:
+        session.info.setdefault('changed_principals', set()).update(changed)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_principal_changes(orm_execute_state):
+    """Bulk UPDATE / DELETE statements on the user table may touch any user"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table is User.__table__:
+            orm_execute_state.session.info['changed_principals_all'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_principals(session):
+    if session.info.pop('changed_principals_all', False):
+        invalidate_principal()
+    for user_id in session.info.pop('changed_principals', ()):
+        invalidate_principal(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_principal_changes(session):
+    session.info.pop('changed_principals_all', None)
+    session.info.pop('changed_principals', None)
 
 def authenticate_user(username, password, token=None):
     """
@@ -13,8 +147,18 @@ def authenticate_user(username, password, token=None):
     
     user = User.query.filter_by(username=username).first()
     
-    if not user or not user.check_password(password):
+    if not user:
+        # Take as long as a real check so unknown usernames can't be told apart by timing
+        burn_password_verification(password)
         return None, "Invalid username or password"
+    
+    if not user.check_password(password):
+        return None, "Invalid username or password"
+    
+    # Upgrade legacy SHA-256 hashes (and outdated argon2id parameters) while the password is known
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
         
     # Check if user is active
     if user.status != 'active':
@@ -28,7 +172,6 @@ def authenticate_user(username, password, token=None):
             secret = user.setup_2fa()
             # Auto-enable 2FA for root
             user.two_factor_enabled = True
-            from app.models.models import db
             db.session.commit()
             # Notify that 2FA setup is required
             return {
@@ -71,7 +214,9 @@ def authenticate_user(username, password, token=None):
         action='user_login',
         details=f"User {username} logged in",
         ip_address=ip,
-        user_agent=user_agent
+        user_agent=user_agent,
+        target_type='user',
+        target_ids=[user.id]
     )
     
     return {
@@ -82,13 +227,20 @@ def authenticate_user(username, password, token=None):
 def get_current_user():
     """
     Get the current authenticated user
+    
+    Returns the cached Principal (see get_principal), so authorization checks
+    need no query; other User attributes load the row on first access.
+    Tokens of deleted or deactivated users are rejected (None).
     """
     try:
         current_user_id = get_jwt_identity()
+        if current_user_id is None:
+            return None
         # Convert string ID back to integer for database lookup
-        user_id = int(current_user_id) if current_user_id is not None else None
-        user = User.query.get(user_id)
-        return user
+        principal = get_principal(int(current_user_id))
+        if principal is None or principal.status != 'active':
+            return None
+        return principal
     except Exception as e:
         import traceback
         print(f"Exception in get_current_user: {str(e)}")
@@ -0,0 +1,262 @@
+"""
+Chunked bulk operations with progress and idempotency keys
+
+A bulk endpoint resolves the ids it works on up front and hands them to
+run_in_chunks together with a set-based operation for one chunk of ids.
+Chunks of BULK_OPERATION_CHUNK_SIZE ids are applied and committed one at a
+time; a chunk that raises is rolled back and counted as failed without
+stopping the others. The chunk operation re-checks its rules in SQL, so a row
+that changed after the ids were resolved is skipped rather than overwritten.
+
+Every run is recorded in bulk_operation. Progress (processed, success, failed,
+skipped) is written in the same commit as each chunk, so
+GET /api/bulk-operations/<id> reports it from any worker while the request is
+still running.
+
+A client that sends an Idempotency-Key header gets the stored response back
+when it retries the same request, instead of running the operation again.
+Keys are scoped to the user and kept for BULK_OPERATION_KEY_EXPIRY_HOURS.
+Reusing a key for a different request is rejected (422); retrying while the
+first attempt is still running returns 409 with its progress. An attempt that
+ended with an error response, or stopped reporting progress for
+BULK_OPERATION_STALE_SECONDS, is run again under the same key.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import BulkOperation, db
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+# Set on responses served from a stored result
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class BulkOperationError(Exception):
+    """Raised when a bulk request cannot be started; carries an HTTP status code"""
+
+    def __init__(self, message, status_code=400, operation=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.operation = operation
+
+
+def request_fingerprint(operation_name, params):
+    """SHA-256 of the operation name and its JSON-serialisable parameters"""
+    raw = json.dumps({'operation': operation_name, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def start_bulk_operation(operation_name, user_id, params, idempotency_key=None):
+    """
+    Record a new bulk operation, or find the earlier run of the same request
+
+    Args:
+        operation_name (str): e.g. 'delete_users'
+        user_id (int): ID of the user sending the request
+        params (dict): Request parameters; a retry under the same key must send the same ones
+        idempotency_key (str): Value of the Idempotency-Key header, or None
+
+    Returns:
+        tuple: (BulkOperation, None) for a run that should start, or
+            (BulkOperation, completed earlier run) when the stored response should be replayed
+
+    Raises:
+        BulkOperationError: Invalid key (400), key used for another request (422)
+            or an earlier run still in progress (409)
+    """
+    fingerprint = request_fingerprint(operation_name, params)
+    now = datetime.utcnow()
+
+    if idempotency_key is not None:
+        idempotency_key = idempotency_key.strip()
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise BulkOperationError(f"{IDEMPOTENCY_KEY_HEADER} must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+        config = current_app.config
+        existing = BulkOperation.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+        if existing and existing.created_at < now - timedelta(hours=config['BULK_OPERATION_KEY_EXPIRY_HOURS']):
+            # Expired: the key starts over
+            db.session.execute(
+                delete(BulkOperation)
+                .where(BulkOperation.id == existing.id, BulkOperation.created_at == existing.created_at)
+            )
+            db.session.commit()
+            existing = None
+
+        if existing:
+            if existing.request_hash != fingerprint:
+                raise BulkOperationError(f"{IDEMPOTENCY_KEY_HEADER} was already used for a different request", 422)
+            if existing.status == 'completed':
+                return existing, existing
+
+            # Failed or abandoned: claim it to run again under the same key (chunks skip
+            # rows that are already done). The claim is a single conditional UPDATE, so of
+            # two retries racing for the same row only one gets it back.
+            stale_before = now - timedelta(seconds=config['BULK_OPERATION_STALE_SECONDS'])
+            claimed = db.session.execute(
+                update(BulkOperation)
+                .where(
+                    BulkOperation.id == existing.id,
+                    or_(
+                        BulkOperation.status == 'failed',
+                        and_(BulkOperation.status == 'running', BulkOperation.updated_at < stale_before)
+                    )
+                )
+                .values(
+                    status='running',
+                    total=0, processed=0, success=0, failed=0, skipped=0,
+                    result=None, status_code=None, error=None, completed_at=None,
+                    updated_at=now
+                )
+                .returning(BulkOperation.id)
+                .execution_options(synchronize_session=False)
+            ).first()
+            db.session.commit()
+
+            if claimed is None:
+                current = db.session.get(BulkOperation, existing.id)
+                if current is not None and current.status == 'completed':
+                    return current, current
+                raise BulkOperationError(
+                    f"A request with this {IDEMPOTENCY_KEY_HEADER} is still running", 409,
+                    operation=current.to_dict() if current is not None else None
+                )
+            db.session.refresh(existing)
+            return existing, None
+
+    operation = BulkOperation(
+        operation=operation_name,
+        user_id=user_id,
+        idempotency_key=idempotency_key,
+        request_hash=fingerprint,
+        status='running',
+        total=0, processed=0, success=0, failed=0, skipped=0,
+        created_at=now,
+        updated_at=now
+    )
+    db.session.add(operation)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request with the same key got in first
+        db.session.rollback()
+        raise BulkOperationError(f"A request with this {IDEMPOTENCY_KEY_HEADER} is still running", 409)
+    return operation, None
+
+
+def _record_progress(operation, processed, counts):
+    if operation is None:
+        return
+    operation.processed += processed
+    operation.success += counts.get('success', 0)
+    operation.failed += counts.get('failed', 0)
+    operation.skipped += counts.get('skipped', 0)
+    operation.updated_at = datetime.utcnow()
+
+
+def run_in_chunks(ids, apply_chunk, operation=None, chunk_size=None, on_error=None):
+    """
+    Apply a set-based operation to ids in chunks, committing after each chunk
+
+    Args:
+        ids (list): Resolved ids, in processing order
+        apply_chunk (callable): apply_chunk(chunk) -> dict with success, failed and
+            skipped counts for the chunk; adds its writes to the session without committing
+        operation (BulkOperation): Record that receives the progress, or None
+        chunk_size (int): Ids per chunk (defaults to BULK_OPERATION_CHUNK_SIZE)
+        on_error (callable): on_error(chunk, exception), called after a failing chunk was rolled back
+
+    Returns:
+        dict: success, failed and skipped totals
+    """
+    chunk_size = chunk_size or current_app.config['BULK_OPERATION_CHUNK_SIZE']
+    totals = {'success': 0, 'failed': 0, 'skipped': 0}
+
+    if operation is not None:
+        operation.total = len(ids)
+        operation.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        try:
+            counts = apply_chunk(chunk)
+            _record_progress(operation, len(chunk), counts)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Bulk operation chunk of {len(chunk)} ids failed: {str(e)}")
+            counts = {'failed': len(chunk)}
+            if on_error:
+                on_error(chunk, e)
+            _record_progress(operation, len(chunk), counts)
+            db.session.commit()
+
+        for key in totals:
+            totals[key] += counts.get(key, 0)
+
+    return totals
+
+
+def finish_bulk_operation(operation, body, status_code=200, error=None):
+    """Store the response of a finished run (replayed for retries with the same key)"""
+    operation.status = 'failed' if error else 'completed'
+    operation.result = body
+    operation.status_code = status_code
+    operation.error = error
+    operation.completed_at = operation.updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def get_bulk_operation(operation_id=None, user_id=None, idempotency_key=None):
+    """A bulk operation by id, or by the user's idempotency key; None if there is none"""
+    if operation_id is not None:
+        return db.session.get(BulkOperation, operation_id)
+    return BulkOperation.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+
+
+def run_bulk_request(operation_name, user_id, params, run):
+    """
+    Run the work of a bulk endpoint once per Idempotency-Key
+
+    Args:
+        operation_name (str): e.g. 'delete_users'
+        user_id (int): ID of the user sending the request
+        params (dict): Request parameters (compared on retries)
+        run (callable): run(operation) -> (response body dict, HTTP status code)
+
+    Returns:
+        tuple: (response body, status code, headers); the body carries operationId
+
+    Raises:
+        BulkOperationError: The request cannot be started (see start_bulk_operation)
+    """
+    operation, earlier = start_bulk_operation(
+        operation_name, user_id, params, request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    )
+    if earlier is not None:
+        return earlier.result, earlier.status_code, {REPLAYED_HEADER: 'true'}
+
+    try:
+        body, status_code = run(operation)
+    except Exception as e:
+        db.session.rollback()
+        finish_bulk_operation(operation, None, 500, error=str(e))
+        raise
+
+    body = dict(body, operationId=operation.id)
+    # Error responses are not replayed: a retry runs the operation again
+    error = body.get('error', f"HTTP {status_code}") if status_code >= 400 else None
+    finish_bulk_operation(operation, body, status_code, error=error)
+    return body, status_code, {}
@@ -1,28 +1,76 @@
 """
 Bulk password reset for multiple users at once
 """
+import time
 from app.models.models import db, User, AuditLog
-from flask import request
+from app.services.auth import get_principal
+from app.services.bulk_operations import run_in_chunks
+from app.utils.password import ARGON2ID, hash_passwords, hashing_throughput
+from flask import current_app, request
+from sqlalchemy import select, update
 
-def bulk_reset_passwords(mode, user_ids, current_user_id):
+# Users written back per executemany UPDATE
+RESET_UPDATE_BATCH_SIZE = 1000
+
+def _write_password_hashes(users, password_hashes):
+    """Write new hashes back with batched UPDATE ... WHERE id = ? statements (no commit)"""
+    for start in range(0, len(users), RESET_UPDATE_BATCH_SIZE):
+        db.session.execute(update(User), [
+            {
+                "id": user_id,
+                "password_hash": password_hash,
+                "hash_type": ARGON2ID,
+                "password_change_required": True
+            }
+            for (user_id, _), password_hash in zip(
+                users[start:start + RESET_UPDATE_BATCH_SIZE],
+                password_hashes[start:start + RESET_UPDATE_BATCH_SIZE]
+            )
+        ])
+
+def _reset_to_username(users):
+    """
+    Reset passwords to the usernames of (id, username) pairs
+    
+    Hashing runs on the password hash pool before anything is written, then all
+    hashes are written back (committed by the caller).
+    
+    Returns:
+        float: Seconds spent hashing
+    """
+    started = time.perf_counter()
+    password_hashes = hash_passwords([username for _, username in users], current_app.config['PASSWORD_HASH_WORKERS'])
+    hash_seconds = time.perf_counter() - started
+    
+    _write_password_hashes(users, password_hashes)
+    return hash_seconds
+
+def bulk_reset_passwords(mode, user_ids, current_user_id, operation=None):
     """
     Reset passwords for multiple users at once
     
+    The users to reset are resolved up front; run_in_chunks then hashes and
+    writes one chunk at a time, and every chunk commits together with one
+    audit entry listing the users it reset.
+    
     Args:
         mode (str): 'all' to reset all non-protected users or 'selected' to reset specific users
         user_ids (list): List of user IDs to reset when mode is 'selected'
         current_user_id (int): ID of the current user performing the operation
+        operation (BulkOperation): Record that receives the progress, if any
         
     Returns:
-        dict: Results with success, failed, and skipped counts
+        dict: Results with success, failed, and skipped counts, plus hashing throughput
     """
     success_count = 0
     failed_count = 0
     skipped_count = 0
+    hash_seconds = 0.0
+    started = time.perf_counter()
     
     try:
         # Get current user for protection checks
-        current_user = User.query.get(current_user_id)
+        current_user = get_principal(current_user_id)
         if not current_user:
             return {
                 "success": 0,
@@ -30,139 +78,129 @@ def bulk_reset_passwords(mode, user_ids, current_user_id):
                 "skipped": 0,
                 "error": "Current user not found"
             }
+            
+        user_agent = request.headers.get('User-Agent', '')
+        ip = request.remote_addr
         
+        conditions = []
         if mode == 'all':
-            # Reset all non-protected users
-            query = User.query
-            
             # CRITICAL SECURITY: ALWAYS exclude root users from bulk operations, regardless of current user's role
-            # Since is_protected_user is a Python property and not a column, we need to use individual filters
-            query = query.filter(User.role != 'root')  # Exclude by role (main method)
-            query = query.filter(User.is_root != True)  # Exclude by is_root flag (legacy backup)
-            
-            # Additional protection: filter out common admin usernames as a last resort
-            query = query.filter(~User.username.in_(['root', 'admin', 'superadmin', 'administrator']))
+            conditions = [
+                User.role != 'root',  # Exclude by role (main method)
+                User.is_root != True,  # Exclude by is_root flag (legacy backup)
+                ~User.protected_user_clause()  # Reserved admin usernames as a last resort
+            ]
             
             # Log this protection for audit purposes
             AuditLog.log(
                 user_id=current_user_id,
                 action='root_user_protection',
                 details=f"Bulk password reset automatically excluded all root users",
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                ip_address=ip,
+                user_agent=user_agent,
+                target_type='user',
+                filters={'mode': 'all'}
             )
             
-            # Reset passwords in a batch for efficiency
-            try:
-                users_to_reset = query.all()
-                for user in users_to_reset:
-                    # Reset password to username
-                    user.set_password(user.username)
-                    # Set flag to require password change on next login
-                    user.password_change_required = True
-                
-                db.session.commit()
-                success_count = len(users_to_reset)
-                
-                # Create audit log entry
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
-                
+            target_ids = db.session.execute(
+                select(User.id).where(*conditions).order_by(User.id)
+            ).scalars().all()
+        else:
+            target_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+            # Duplicate ids in the request count as skipped
+            skipped_count += len(user_ids) - len(target_ids)
+            
+        def reset_chunk(chunk):
+            nonlocal hash_seconds
+            rows = db.session.execute(
+                select(User.id, User.username, User.protected_user_clause().label('protected'))
+                .where(User.id.in_(chunk), *conditions)
+                .order_by(User.id)
+            ).all()
+            
+            # CRITICAL SECURITY: ALWAYS skip root users regardless of selection
+            protected = [row for row in rows if row.protected]
+            if protected:
                 AuditLog.log(
                     user_id=current_user_id,
-                    action='bulk_reset_passwords',
-                    details=f"Bulk reset passwords for {success_count} users with mode 'all'",
+                    action='root_user_protection',
+                    details="Protected root users from bulk password reset: "
+                            + ", ".join(f"{row.username} (ID: {row.id})" for row in protected),
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[row.id for row in protected]
                 )
-            except Exception as e:
-                db.session.rollback()
-                failed_count = query.count()
-                
-                # Log the error
-                print(f"Error during bulk password reset: {str(e)}")
-                
-                # Create audit log entry for failed operation
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
                 
-                AuditLog.log(
+            users = [(row.id, row.username) for row in rows if not row.protected]
+            if users:
+                hash_seconds += _reset_to_username(users)
+                AuditLog.add(
                     user_id=current_user_id,
-                    action='bulk_reset_passwords_failed',
-                    details=f"Failed to bulk reset passwords for {failed_count} users with error: {str(e)}",
+                    action='bulk_reset_passwords' if mode == 'all' else 'reset_password_in_bulk',
+                    details=f"Reset passwords for {len(users)} users as part of bulk operation: "
+                            + ", ".join(f"{username} (ID: {user_id})" for user_id, username in users),
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[user_id for user_id, _ in users],
+                    counts={'success': len(users)},
+                    filters={'mode': mode}
                 )
-        else:
-            # Reset passwords only for selected users
-            for user_id in user_ids:
-                try:
-                    user = User.query.get(user_id)
-                    
-                    if not user:
-                        skipped_count += 1
-                        continue
-                    
-                    # CRITICAL SECURITY: ALWAYS skip root users regardless of selection
-                    if user.is_protected_user:
-                        skipped_count += 1
-                        # Log this skipped operation for security audit 
-                        AuditLog.log(
-                            user_id=current_user_id,
-                            action='root_user_protection',
-                            details=f"Protected root user {user.username} (ID: {user.id}) from bulk password reset",
-                            ip_address=request.remote_addr,
-                            user_agent=request.headers.get('User-Agent', '')
-                        )
-                        continue
-                    
-                    # Reset the password to username
-                    user.set_password(user.username)
-                    # Set flag to require password change on next login
-                    user.password_change_required = True
-                    db.session.commit()
-                    success_count += 1
-                    
-                    # Create individual audit log entry
-                    user_agent = request.headers.get('User-Agent', '')
-                    ip = request.remote_addr
-                    
-                    AuditLog.log(
-                        user_id=current_user_id,
-                        action='reset_password_in_bulk',
-                        details=f"Reset password for {user.username} (ID: {user_id}) as part of bulk operation",
-                        ip_address=ip,
-                        user_agent=user_agent
-                    )
-                    
-                except Exception as e:
-                    db.session.rollback()
-                    failed_count += 1
-                    print(f"Error resetting password for user ID {user_id}: {str(e)}")
+                
+            # Missing or protected
+            return {'success': len(users), 'skipped': len(chunk) - len(users)}
+            
+        def chunk_failed(chunk, error):
+            # Log the error
+            print(f"Error during bulk password reset: {str(error)}")
+            
+            # Create audit log entry for failed chunk
+            AuditLog.log(
+                user_id=current_user_id,
+                action='bulk_reset_passwords_failed',
+                details=f"Failed to bulk reset passwords for {len(chunk)} users with error: {str(error)}",
+                ip_address=ip,
+                user_agent=user_agent,
+                target_type='user',
+                target_ids=chunk,
+                counts={'failed': len(chunk)},
+                filters={'mode': mode}
+            )
+            
+        totals = run_in_chunks(target_ids, reset_chunk, operation=operation, on_error=chunk_failed)
+        success_count = totals['success']
+        failed_count = totals['failed']
+        skipped_count += totals['skipped']
         
-        # Create a summary audit log
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.remote_addr
+        throughput = hashing_throughput(success_count + failed_count, hash_seconds, time.perf_counter() - started)
         
+        # Create a summary audit log
         AuditLog.log(
             user_id=current_user_id,
             action='bulk_reset_passwords_summary',
-            details=f"Bulk password reset operation completed: {success_count} successful, {failed_count} failed, {skipped_count} skipped",
+            details=f"Bulk password reset operation completed: {success_count} successful, {failed_count} failed, {skipped_count} skipped "
+                    f"({throughput['passwords_per_second']} hashes/s)",
             ip_address=ip,
-            user_agent=user_agent
+            user_agent=user_agent,
+            target_type='user',
+            counts={'success': success_count, 'failed': failed_count, 'skipped': skipped_count},
+            filters={'mode': mode}
         )
         
         return {
             "success": success_count,
             "failed": failed_count,
-            "skipped": skipped_count
+            "skipped": skipped_count,
+            "throughput": throughput
         }
         
     except Exception as e:
+        db.session.rollback()
         print(f"Unexpected error in bulk_reset_passwords: {str(e)}")
         return {
             "success": success_count,
             "failed": failed_count + (len(user_ids) - success_count - skipped_count if mode == 'selected' else 0),
             "skipped": skipped_count,
             "error": str(e)
-        }
+        }
\ No newline at end of file
@@ -2,20 +2,72 @@
 Bulk operations for users management
 """
 
-from app.models.models import db, User, AuditLog
+from app.models.models import db, User, AuditLog, Group, GroupMember
+from app.models.student import Student
+from app.services.auth import get_principal
+from app.services.bulk_operations import run_in_chunks
 from flask import request
+from sqlalchemy import delete, exists, select, update
 
 # Import the bulk reset passwords function
 from app.services.bulk_reset_passwords import bulk_reset_passwords
 
-def bulk_delete_users(mode, user_ids, current_user_id):
+def _delete_user_chunk(user_ids):
+    """
+    Delete users and detach the rows that point at them, set-based (no commit)
+    
+    Students assigned to the users are unassigned, group memberships removed,
+    group leaderships and audit log actors cleared; then the users themselves
+    are deleted.
+    
+    Returns:
+        list: (id, username) rows of the deleted users
+    """
+    db.session.execute(
+        update(Student)
+        .where(Student.user_id.in_(user_ids))
+        .values(user_id=None, matched=False)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(GroupMember)
+        .where(GroupMember.user_id.in_(user_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Group)
+        .where(Group.leader_id.in_(user_ids))
+        .values(leader_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(AuditLog)
+        .where(AuditLog.user_id.in_(user_ids))
+        .values(user_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(
+        delete(User)
+        .where(User.id.in_(user_ids))
+        .returning(User.id, User.username)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def bulk_delete_users(mode, user_ids, current_user_id, operation=None):
     """
     Delete multiple users at once
     
+    The users to delete are resolved up front, then locked, re-checked and
+    deleted chunk by chunk by run_in_chunks; every chunk commits together with
+    one audit entry listing the users it deleted. Protected (root) users, the
+    current user and, for non-root callers, admins are never deleted. Users
+    that still own groups cannot be deleted and count as failed.
+    
     Args:
         mode (str): 'all' to delete all non-protected users or 'selected' to delete specific users
         user_ids (list): List of user IDs to delete when mode is 'selected'
         current_user_id (int): ID of the current user performing the operation
+        operation (BulkOperation): Record that receives the progress, if any
         
     Returns:
         dict: Results with success, failed, and skipped counts
@@ -26,7 +78,7 @@ def bulk_delete_users(mode, user_ids, current_user_id):
     
     try:
         # Get current user for protection checks
-        current_user = User.query.get(current_user_id)
+        current_user = get_principal(current_user_id)
         if not current_user:
             return {
                 "success": 0,
@@ -34,145 +86,127 @@ def bulk_delete_users(mode, user_ids, current_user_id):
                 "skipped": 0,
                 "error": "Current user not found"
             }
-        
-        if mode == 'all':
-            # Delete all non-protected users
-            # Protected users: root users, the current user, and any other admin users if the current user is not root
-            
-            # CRITICAL SECURITY: ALWAYS exclude root users by BOTH role and is_root flag
-            query = User.query
-            
-            # First priority exclusion - filter out root users
-            query = query.filter(User.role != 'root')  # Exclude by role
-            query = query.filter(User.is_root != True)  # Exclude by is_root flag for backwards compatibility
-            
-            # Secondary exclusions
-            query = query.filter(User.id != current_user_id)  # Exclude current user
-            
-            # If current user is not root, also exclude admin users
-            if current_user.role != 'root':
-                query = query.filter(User.role != 'admin')
-                
-            # Get total count for logging
-            total_to_delete = query.count()
             
-            # Get user IDs for deletion
-            users_to_delete = query.all()
-            user_ids_to_delete = [user.id for user in users_to_delete]
+        user_agent = request.headers.get('User-Agent', '')
+        ip = request.remote_addr
+        
+        # Secondary exclusions: the current user, and admins unless the current user is root
+        conditions = [User.id != current_user_id]
+        if current_user.role != 'root':
+            conditions.append(User.role != 'admin')
             
-            # Log all users being deleted for audit purposes
-            usernames_to_delete = [user.username for user in users_to_delete]
+        if mode == 'all':
+            # CRITICAL SECURITY: ALWAYS exclude root users by role, is_root flag and reserved usernames
+            conditions += [
+                User.role != 'root',
+                User.is_root != True,  # Also excludes NULL, as the previous filter did
+                ~User.protected_user_clause()
+            ]
+            target_ids = db.session.execute(
+                select(User.id).where(*conditions).order_by(User.id)
+            ).scalars().all()
+        else:
+            target_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+            # Duplicate ids in the request count as skipped
+            skipped_count += len(user_ids) - len(target_ids)
             
-            # Use a batch approach for efficient deletion
-            user_details = []
-            for user in users_to_delete:
-                user_details.append(f"{user.username} (ID: {user.id})")
+        candidates = select(
+            User.id,
+            User.username,
+            User.protected_user_clause().label('protected'),
+            exists().where(Group.mentor_id == User.id).label('owns_groups')
+        ).where(*conditions).order_by(User.id).with_for_update(of=User)
+        
+        def delete_chunk(chunk):
+            # Locked and re-checked: users may have changed since the ids were resolved
+            rows = db.session.execute(candidates.where(User.id.in_(chunk))).all()
+            protected = [row for row in rows if row.protected]
+            blocked = [row for row in rows if not row.protected and row.owns_groups]
+            deletable_ids = [row.id for row in rows if not row.protected and not row.owns_groups]
             
-            # Delete users in batches
-            try:
-                for user in users_to_delete:
-                    db.session.delete(user)
-                db.session.commit()
-                success_count = len(user_ids_to_delete)
-                
-                # Create audit log entry for bulk deletion
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
-                
+            # CRITICAL SECURITY: root users are skipped regardless of selection
+            if protected:
                 AuditLog.log(
                     user_id=current_user_id,
-                    action='bulk_delete_users',
-                    details=f"Bulk deleted {success_count} users with mode 'all'",
+                    action='root_user_protection',
+                    details="Protected root users from bulk deletion: "
+                            + ", ".join(f"{row.username} (ID: {row.id})" for row in protected),
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[row.id for row in protected]
                 )
-            except Exception as e:
-                db.session.rollback()
-                failed_count = len(user_ids_to_delete)
-                
-                # Log the error
-                print(f"Error during bulk delete: {str(e)}")
-                
-                # Create audit log entry for failed operation
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
                 
+            # Group mentors cannot be deleted until their groups are reassigned
+            if blocked:
                 AuditLog.log(
                     user_id=current_user_id,
                     action='bulk_delete_users_failed',
-                    details=f"Failed to bulk delete {failed_count} users with error: {str(e)}",
+                    details="Cannot delete users who still own groups: "
+                            + ", ".join(f"{row.username} (ID: {row.id})" for row in blocked),
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[row.id for row in blocked],
+                    counts={'failed': len(blocked)},
+                    filters={'mode': mode}
                 )
-        else:
-            # Delete only selected users
-            for user_id in user_ids:
-                try:
-                    user = User.query.get(user_id)
-                    
-                    if not user:
-                        skipped_count += 1
-                        continue
-                    
-                    # CRITICAL SECURITY: ALWAYS skip root users regardless of selection
-                    # Use the comprehensive is_protected_user property for maximum security
-                    if user.is_protected_user:
-                        skipped_count += 1
-                        # Log this skipped operation for security audit 
-                        AuditLog.log(
-                            user_id=current_user_id,
-                            action='root_user_protection',
-                            details=f"Protected root user {user.username} (ID: {user.id}) from bulk deletion",
-                            ip_address=request.remote_addr,
-                            user_agent=request.headers.get('User-Agent', '')
-                        )
-                        continue
-                    
-                    # Skip current user (self)
-                    if str(user.id) == str(current_user_id):
-                        skipped_count += 1
-                        continue
-                    
-                    # Skip admin users if current user is not root
-                    if user.role == 'admin' and current_user.role != 'root':
-                        skipped_count += 1
-                        continue
-                    
-                    # Store username for audit log
-                    username = user.username
-                    
-                    # Delete the user
-                    db.session.delete(user)
-                    db.session.commit()
-                    success_count += 1
-                    
-                    # Create individual audit log entry
-                    user_agent = request.headers.get('User-Agent', '')
-                    ip = request.remote_addr
-                    
-                    AuditLog.log(
-                        user_id=current_user_id,
-                        action='delete_user_in_bulk',
-                        details=f"Deleted user: {username} (ID: {user_id}) as part of bulk operation",
-                        ip_address=ip,
-                        user_agent=user_agent
-                    )
-                    
-                except Exception as e:
-                    db.session.rollback()
-                    failed_count += 1
-                    print(f"Error deleting user ID {user_id}: {str(e)}")
+                
+            deleted = _delete_user_chunk(deletable_ids) if deletable_ids else []
+            if deleted:
+                AuditLog.add(
+                    user_id=current_user_id,
+                    action='bulk_delete_users' if mode == 'all' else 'delete_user_in_bulk',
+                    details=f"Deleted {len(deleted)} users as part of bulk operation: "
+                            + ", ".join(f"{username} (ID: {user_id})" for user_id, username in deleted),
+                    ip_address=ip,
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[user_id for user_id, _ in deleted],
+                    counts={'success': len(deleted)},
+                    filters={'mode': mode}
+                )
+                
+            # Skipped: missing, protected, the current user, (for non-root callers) admins,
+            # and rows locked for the chunk but gone by the time of the DELETE
+            return {
+                'success': len(deleted),
+                'failed': len(blocked),
+                'skipped': len(chunk) - len(deleted) - len(blocked)
+            }
+            
+        def chunk_failed(chunk, error):
+            # Log the error
+            print(f"Error during bulk delete: {str(error)}")
+            
+            # Create audit log entry for failed chunk
+            AuditLog.log(
+                user_id=current_user_id,
+                action='bulk_delete_users_failed',
+                details=f"Failed to bulk delete {len(chunk)} users with error: {str(error)}",
+                ip_address=ip,
+                user_agent=user_agent,
+                target_type='user',
+                target_ids=chunk,
+                counts={'failed': len(chunk)},
+                filters={'mode': mode}
+            )
+            
+        totals = run_in_chunks(target_ids, delete_chunk, operation=operation, on_error=chunk_failed)
+        success_count = totals['success']
+        failed_count = totals['failed']
+        skipped_count += totals['skipped']
         
         # Create a summary audit log
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.remote_addr
-        
         AuditLog.log(
             user_id=current_user_id,
             action='bulk_delete_summary',
             details=f"Bulk delete operation completed: {success_count} successful, {failed_count} failed, {skipped_count} skipped",
             ip_address=ip,
-            user_agent=user_agent
+            user_agent=user_agent,
+            target_type='user',
+            counts={'success': success_count, 'failed': failed_count, 'skipped': skipped_count},
+            filters={'mode': mode}
         )
         
         return {
@@ -182,29 +216,53 @@ def bulk_delete_users(mode, user_ids, current_user_id):
         }
         
     except Exception as e:
+        db.session.rollback()
         print(f"Unexpected error in bulk_delete_users: {str(e)}")
         return {
             "success": success_count,
-            "failed": failed_count + (len(user_ids) - success_count - skipped_count),
+            "failed": failed_count + (len(user_ids) - success_count - skipped_count if mode == 'selected' else 0),
             "skipped": skipped_count,
             "error": str(e)
         }
 
-def bulk_change_status(mode, user_ids, action, current_user_id):
+def _unassign_brosis_students(brosis_ids):
+    """
+    Unassign every student matched to the given BroSis users (no commit)
+    
+    Set-based counterpart of the auto-unassignment update_user performs when a
+    BroSis is deactivated.
+    
+    Returns:
+        list: IDs of the students that were unassigned
+    """
+    return db.session.execute(
+        update(Student)
+        .where(Student.user_id.in_(brosis_ids), Student.matched == True)
+        .values(user_id=None, matched=False)
+        .returning(Student.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+
+def bulk_change_status(mode, user_ids, action, current_user_id, operation=None):
     """
     Change status for multiple users at once
     
+    The users to change are resolved up front; run_in_chunks then applies one
+    UPDATE "user" SET status = ... WHERE ... RETURNING statement per chunk whose
+    WHERE clause excludes protected (root) users and users that already have
+    the target status. Deactivated BroSis users have their students unassigned
+    in the same transaction, and every chunk commits with one audit entry.
+    
     Args:
         mode (str): 'all' to change all non-protected users or 'selected' to change specific users
         user_ids (list): List of user IDs to modify when mode is 'selected'
         action (str): 'activate' or 'deactivate' to set the corresponding status
         current_user_id (int): ID of the current user performing the operation
+        operation (BulkOperation): Record that receives the progress, if any
         
     Returns:
         dict: Results with success, failed, and skipped counts
     """
-    # Implementation for bulk status change
-    # (Similar to bulk_delete_users but updating status instead of deleting)
     success_count = 0
     failed_count = 0
     skipped_count = 0
@@ -213,7 +271,7 @@ def bulk_change_status(mode, user_ids, action, current_user_id):
     
     try:
         # Get current user for protection checks
-        current_user = User.query.get(current_user_id)
+        current_user = get_principal(current_user_id)
         if not current_user:
             return {
                 "success": 0,
@@ -221,136 +279,134 @@ def bulk_change_status(mode, user_ids, action, current_user_id):
                 "skipped": 0,
                 "error": "Current user not found"
             }
+            
+        user_agent = request.headers.get('User-Agent', '')
+        ip = request.remote_addr
+        
+        # CRITICAL SECURITY: ALWAYS exclude root users (role, is_root flag, reserved usernames) in the statement itself
+        conditions = [~User.protected_user_clause()]
         
         if mode == 'all':
-            # Change status for all non-protected users
-            query = User.query
-            
-            # CRITICAL SECURITY: ALWAYS exclude root users from bulk operations, regardless of current user's role
-            # First priority exclusion - filter out root users using multiple checks
-            
-            # Since is_protected_user is a Python property and not a column, we need to use individual filters
-            query = query.filter(User.role != 'root')  # Exclude by role (main method)
-            query = query.filter(User.is_root != True)  # Exclude by is_root flag (legacy backup)
-            
-            # Additional protection: filter out common admin usernames as a last resort
-            query = query.filter(~User.username.in_(['root', 'admin', 'superadmin', 'administrator']))
+            conditions += [
+                User.role != 'root',  # Exclude by role (main method)
+                User.is_root != True,  # Exclude by is_root flag (legacy backup)
+                User.status != new_status  # Skip users that already have the target status
+            ]
             
             # Log this protection for audit purposes
             AuditLog.log(
                 user_id=current_user_id,
                 action='root_user_protection',
                 details=f"Bulk status change automatically excluded all root users",
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent', '')
+                ip_address=ip,
+                user_agent=user_agent,
+                target_type='user',
+                filters={'mode': 'all', 'action': action}
             )
             
-            # Skip users that already have the target status
-            query = query.filter(User.status != new_status)
+            target_ids = db.session.execute(
+                select(User.id).where(*conditions).order_by(User.id)
+            ).scalars().all()
+        else:
+            # Skip users that already have the target status (a NULL status is changed)
+            conditions.append(db.func.coalesce(User.status, '') != new_status)
+            target_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+            # Duplicate ids in the request count as skipped
+            skipped_count += len(user_ids) - len(target_ids)
             
-            # Get total count for logging
-            total_to_change = query.count()
+        def change_chunk(chunk):
+            if mode == 'selected':
+                # CRITICAL SECURITY: ALWAYS skip root users regardless of selection
+                protected = db.session.execute(
+                    select(User.id, User.username).where(User.id.in_(chunk), User.protected_user_clause())
+                ).all()
+                if protected:
+                    AuditLog.log(
+                        user_id=current_user_id,
+                        action='root_user_protection',
+                        details="Protected root users from bulk status change: "
+                                + ", ".join(f"{username} (ID: {user_id})" for user_id, username in protected),
+                        ip_address=ip,
+                        user_agent=user_agent,
+                        target_type='user',
+                        target_ids=[user_id for user_id, _ in protected]
+                    )
+                    
+            changed = db.session.execute(
+                update(User)
+                .where(User.id.in_(chunk), *conditions)
+                .values(status=new_status)
+                .returning(User.id, User.username, User.role)
+                .execution_options(synchronize_session=False)
+            ).all()
             
-            # Update status in a single query for efficiency
-            try:
-                users_to_update = query.all()
-                for user in users_to_update:
-                    user.status = new_status
-                
-                db.session.commit()
-                success_count = total_to_change
+            # Deactivated BroSis users give up their students, as update_user does for a single user
+            unassigned_ids = []
+            brosis_ids = [row.id for row in changed if row.role == 'brosis']
+            if new_status == 'inactive' and brosis_ids:
+                unassigned_ids = _unassign_brosis_students(brosis_ids)
                 
-                # Create audit log entry
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
-                
-                AuditLog.log(
+            if changed:
+                AuditLog.add(
                     user_id=current_user_id,
-                    action=f'bulk_{action}_users',
-                    details=f"Bulk {action}d {success_count} users with mode 'all'",
+                    action=f'bulk_{action}_users' if mode == 'all' else 'change_user_status_in_bulk',
+                    details=f"Changed status to {new_status} for {len(changed)} users as part of bulk operation: "
+                            + ", ".join(f"{row.username} (ID: {row.id})" for row in changed),
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='user',
+                    target_ids=[row.id for row in changed],
+                    counts={'success': len(changed)},
+                    filters={'mode': mode, 'action': action}
                 )
-            except Exception as e:
-                db.session.rollback()
-                failed_count = total_to_change
-                
-                # Log the error
-                print(f"Error during bulk status change: {str(e)}")
-                
-                # Create audit log entry for failed operation
-                user_agent = request.headers.get('User-Agent', '')
-                ip = request.remote_addr
-                
-                AuditLog.log(
+            if unassigned_ids:
+                AuditLog.add(
                     user_id=current_user_id,
-                    action=f'bulk_{action}_users_failed',
-                    details=f"Failed to bulk {action} {failed_count} users with error: {str(e)}",
+                    action='auto_unassign_students',
+                    details=f"Auto-unassigned {len(unassigned_ids)} students from {len(brosis_ids)} BroSis due to: BroSis status changed to inactive",
                     ip_address=ip,
-                    user_agent=user_agent
+                    user_agent=user_agent,
+                    target_type='student',
+                    target_ids=unassigned_ids,
+                    counts={'unassigned': len(unassigned_ids)},
+                    filters={'brosis_user_ids': brosis_ids}
                 )
-        else:
-            # Change status only for selected users
-            for user_id in user_ids:
-                try:
-                    user = User.query.get(user_id)
-                    
-                    if not user:
-                        skipped_count += 1
-                        continue
-                    
-                    # Skip users that already have the target status
-                    if user.status == new_status:
-                        skipped_count += 1
-                        continue
-                    
-                    # CRITICAL SECURITY: ALWAYS skip root users regardless of selection
-                    # Use the comprehensive is_protected_user property for maximum security
-                    if user.is_protected_user:
-                        skipped_count += 1
-                        # Log this skipped operation for security audit 
-                        AuditLog.log(
-                            user_id=current_user_id,
-                            action='root_user_protection',
-                            details=f"Protected root user {user.username} (ID: {user.id}) from bulk status change",
-                            ip_address=request.remote_addr,
-                            user_agent=request.headers.get('User-Agent', '')
-                        )
-                        continue
-                    
-                    # Update the status
-                    old_status = user.status
-                    user.status = new_status
-                    db.session.commit()
-                    success_count += 1
-                    
-                    # Create individual audit log entry
-                    user_agent = request.headers.get('User-Agent', '')
-                    ip = request.remote_addr
-                    
-                    AuditLog.log(
-                        user_id=current_user_id,
-                        action=f'change_user_status_in_bulk',
-                        details=f"Changed {user.username}'s status from {old_status} to {new_status} (ID: {user_id}) as part of bulk operation",
-                        ip_address=ip,
-                        user_agent=user_agent
-                    )
-                    
-                except Exception as e:
-                    db.session.rollback()
-                    failed_count += 1
-                    print(f"Error changing status for user ID {user_id}: {str(e)}")
+                
+            # Missing, protected or already in the target status
+            return {'success': len(changed), 'skipped': len(chunk) - len(changed)}
+            
+        def chunk_failed(chunk, error):
+            # Log the error
+            print(f"Error during bulk status change: {str(error)}")
+            
+            # Create audit log entry for failed chunk
+            AuditLog.log(
+                user_id=current_user_id,
+                action=f'bulk_{action}_users_failed',
+                details=f"Failed to bulk {action} {len(chunk)} users with error: {str(error)}",
+                ip_address=ip,
+                user_agent=user_agent,
+                target_type='user',
+                target_ids=chunk,
+                counts={'failed': len(chunk)},
+                filters={'mode': mode, 'action': action}
+            )
+            
+        totals = run_in_chunks(target_ids, change_chunk, operation=operation, on_error=chunk_failed)
+        success_count = totals['success']
+        failed_count = totals['failed']
+        skipped_count += totals['skipped']
         
         # Create a summary audit log
-        user_agent = request.headers.get('User-Agent', '')
-        ip = request.remote_addr
-        
         AuditLog.log(
             user_id=current_user_id,
             action=f'bulk_{action}_summary',
             details=f"Bulk {action} operation completed: {success_count} successful, {failed_count} failed, {skipped_count} skipped",
             ip_address=ip,
-            user_agent=user_agent
+            user_agent=user_agent,
+            target_type='user',
+            counts={'success': success_count, 'failed': failed_count, 'skipped': skipped_count},
+            filters={'mode': mode, 'action': action}
         )
         
         return {
@@ -360,10 +416,11 @@ def bulk_change_status(mode, user_ids, action, current_user_id):
         }
         
     except Exception as e:
+        db.session.rollback()
         print(f"Unexpected error in bulk_change_status: {str(e)}")
         return {
             "success": success_count,
-            "failed": failed_count + (len(user_ids) - success_count - skipped_count),
+            "failed": failed_count + (len(user_ids) - success_count - skipped_count if mode == 'selected' else 0),
             "skipped": skipped_count,
             "error": str(e)
         }
\ No newline at end of file
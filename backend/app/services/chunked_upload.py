@@ -0,0 +1,288 @@
+"""
+Chunked, resumable uploads spooled to disk
+
+Protocol:
+1. init_upload      -> creates an upload id and an empty spool file
+2. append_chunk     -> streams one chunk (verified by its SHA-256) onto the spool file
+3. get_upload       -> reports the received offset so a dropped client can resume
+4. complete_upload  -> verifies size and whole-file checksum and marks the upload ready
+
+Completed uploads are handed to the import pipeline as a file path, so the
+file is never fully loaded into worker memory.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks copied from the request stream to disk
+COPY_BLOCK_SIZE = 64 * 1024
+
+MANIFEST_NAME = 'manifest.json'
+DATA_NAME = 'data'
+LOCK_NAME = '.lock'
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; carries an HTTP status code"""
+
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.extra = extra
+
+
+def _spool_dir():
+    spool_dir = current_app.config['UPLOAD_SPOOL_DIR']
+    os.makedirs(spool_dir, exist_ok=True)
+    return spool_dir
+
+
+def _upload_dir(upload_id):
+    # Upload ids are uuid4 hex strings; reject anything else to avoid path traversal
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except (TypeError, ValueError):
+        raise UploadError("Invalid upload ID", 404)
+    return os.path.join(_spool_dir(), upload_id)
+
+
+def _read_manifest(upload_dir):
+    manifest_path = os.path.join(upload_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise UploadError("Upload not found", 404)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(upload_dir, manifest):
+    tmp_path = os.path.join(upload_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(upload_dir, MANIFEST_NAME))
+
+
+@contextmanager
+def _locked(upload_dir):
+    """Serialize writers of one upload across gunicorn workers"""
+    with open(os.path.join(upload_dir, LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_owned(upload_id, owner_id):
+    upload_dir = _upload_dir(upload_id)
+    manifest = _read_manifest(upload_dir)
+    if str(manifest['owner_id']) != str(owner_id):
+        raise UploadError("Upload not found", 404)
+    return upload_dir, manifest
+
+
+def _status(upload_dir, manifest):
+    return {
+        "uploadId": manifest['upload_id'],
+        "filename": manifest['filename'],
+        "totalSize": manifest['total_size'],
+        "offset": os.path.getsize(os.path.join(upload_dir, DATA_NAME)),
+        "chunkSize": current_app.config['UPLOAD_CHUNK_SIZE_MB'] * 1024 * 1024,
+        "completed": manifest['completed']
+    }
+
+
+def cleanup_expired_uploads():
+    """Remove spooled uploads older than UPLOAD_EXPIRY_HOURS"""
+    expiry = current_app.config['UPLOAD_EXPIRY_HOURS'] * 3600
+    now = time.time()
+    spool_dir = _spool_dir()
+
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > expiry:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Removed expired upload {name}")
+        except OSError as e:
+            logger.warning(f"Could not clean up upload {name}: {str(e)}")
+
+
+def init_upload(filename, total_size, owner_id, allowed_extensions):
+    """
+    Start a new chunked upload
+
+    Args:
+        filename (str): Original file name (used for format detection)
+        total_size (int): Total size of the file in bytes
+        owner_id (int): ID of the user performing the upload
+        allowed_extensions (tuple): Accepted file extensions
+
+    Returns:
+        dict: Upload status including uploadId, offset and chunkSize
+    """
+    if not filename or not filename.lower().endswith(allowed_extensions):
+        raise UploadError(f"Unsupported file format. Allowed: {', '.join(allowed_extensions)}")
+
+    max_size = current_app.config['UPLOAD_MAX_SIZE_MB'] * 1024 * 1024
+    if not isinstance(total_size, int) or total_size <= 0:
+        raise UploadError("totalSize must be a positive integer")
+    if total_size > max_size:
+        raise UploadError(f"File too large. Maximum size is {current_app.config['UPLOAD_MAX_SIZE_MB']} MB", 413)
+
+    cleanup_expired_uploads()
+
+    upload_id = uuid.uuid4().hex
+    upload_dir = os.path.join(_spool_dir(), upload_id)
+    os.makedirs(upload_dir)
+    open(os.path.join(upload_dir, DATA_NAME), 'wb').close()
+
+    manifest = {
+        "upload_id": upload_id,
+        "filename": os.path.basename(filename),
+        "total_size": total_size,
+        "owner_id": owner_id,
+        "created_at": time.time(),
+        "completed": False,
+        "sha256": None
+    }
+    _write_manifest(upload_dir, manifest)
+
+    logger.info(f"Initialized upload {upload_id} for {manifest['filename']} ({total_size} bytes)")
+    return _status(upload_dir, manifest)
+
+
+def get_upload(upload_id, owner_id):
+    """Return the status of an upload (the offset tells a client where to resume)"""
+    upload_dir, manifest = _load_owned(upload_id, owner_id)
+    return _status(upload_dir, manifest)
+
+
+def append_chunk(upload_id, owner_id, offset, stream, checksum):
+    """
+    Append one chunk to an upload
+
+    The chunk is streamed to a part file while its SHA-256 is computed, and only
+    appended to the spool file once the checksum matches. A chunk that was cut
+    off mid-transfer therefore never corrupts the upload; the client simply
+    resends it from the last reported offset.
+
+    Args:
+        upload_id (str): Upload ID
+        owner_id (int): ID of the user performing the upload
+        offset (int): Byte offset the chunk starts at (must equal the received size)
+        stream: Readable request body stream
+        checksum (str): Hex SHA-256 of the chunk
+
+    Returns:
+        dict: Updated upload status
+    """
+    upload_dir, manifest = _load_owned(upload_id, owner_id)
+    if manifest['completed']:
+        raise UploadError("Upload already completed", 409)
+    if not checksum:
+        raise UploadError("Chunk checksum required")
+
+    max_chunk = current_app.config['UPLOAD_CHUNK_SIZE_MB'] * 1024 * 1024
+    data_path = os.path.join(upload_dir, DATA_NAME)
+    part_path = os.path.join(upload_dir, f"part-{uuid.uuid4().hex}")
+
+    try:
+        # Stream the chunk to disk before taking the lock
+        digest = hashlib.sha256()
+        received = 0
+        with open(part_path, 'wb') as part:
+            while True:
+                block = stream.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                received += len(block)
+                if received > max_chunk:
+                    raise UploadError(f"Chunk too large. Maximum chunk size is {current_app.config['UPLOAD_CHUNK_SIZE_MB']} MB", 413)
+                digest.update(block)
+                part.write(block)
+
+        if received == 0:
+            raise UploadError("Empty chunk")
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError("Chunk checksum mismatch", 422)
+
+        with _locked(upload_dir):
+            current_offset = os.path.getsize(data_path)
+            if offset != current_offset:
+                raise UploadError("Offset mismatch", 409, offset=current_offset)
+            if current_offset + received > manifest['total_size']:
+                raise UploadError("Chunk exceeds declared file size", 400, offset=current_offset)
+
+            with open(part_path, 'rb') as part, open(data_path, 'ab') as data:
+                shutil.copyfileobj(part, data, COPY_BLOCK_SIZE)
+                data.flush()
+                os.fsync(data.fileno())
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return _status(upload_dir, manifest)
+
+
+def complete_upload(upload_id, owner_id, checksum=None):
+    """
+    Finish an upload after verifying its size and (optionally) whole-file SHA-256
+
+    Returns:
+        dict: Final upload status
+    """
+    upload_dir, manifest = _load_owned(upload_id, owner_id)
+
+    with _locked(upload_dir):
+        if manifest['completed']:
+            return _status(upload_dir, manifest)
+
+        data_path = os.path.join(upload_dir, DATA_NAME)
+        size = os.path.getsize(data_path)
+        if size != manifest['total_size']:
+            raise UploadError(f"Upload incomplete: received {size} of {manifest['total_size']} bytes", 409, offset=size)
+
+        digest = hashlib.sha256()
+        with open(data_path, 'rb') as f:
+            for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        if checksum and digest.hexdigest() != checksum.lower():
+            raise UploadError("File checksum mismatch", 422)
+
+        manifest['completed'] = True
+        manifest['sha256'] = digest.hexdigest()
+        _write_manifest(upload_dir, manifest)
+
+    logger.info(f"Completed upload {upload_id} ({size} bytes)")
+    return _status(upload_dir, manifest)
+
+
+def get_completed_upload(upload_id, owner_id):
+    """
+    Resolve a completed upload for the import pipeline
+
+    Returns:
+        tuple: (file path, original filename)
+    """
+    upload_dir, manifest = _load_owned(upload_id, owner_id)
+    if not manifest['completed']:
+        raise UploadError("Upload is not completed", 409)
+    return os.path.join(upload_dir, DATA_NAME), manifest['filename']
+
+
+def discard_upload(upload_id, owner_id):
+    """Delete an upload and its spooled data"""
+    upload_dir, _ = _load_owned(upload_id, owner_id)
+    shutil.rmtree(upload_dir, ignore_errors=True)
@@ -0,0 +1,185 @@
+"""
+Columnar (Parquet / Arrow IPC) exports for analytics
+
+Rows are read from the export cursor in batches and written as Arrow record
+batches with typed columns, so downstream tools load them without parsing.
+Low-cardinality text columns (area, house, role, ...) are dictionary encoded
+with one dictionary that grows across batches; Arrow streams carry it as
+dictionary deltas.
+
+pyarrow is an optional dependency: without it these formats are reported as
+unavailable and the CSV / Excel exports keep working.
+"""
+import tempfile
+from typing import Dict, List
+
+from sqlalchemy import Text, cast
+
+from app.models.models import AuditLog, User
+from app.models.student import Student
+from app.services.export import (
+    EXPORT_BATCH_SIZE, build_student_export_statement, build_user_export_statement, export_statement, iter_export_batches
+)
+
+# Formats handled by this module (see EXPORT_FORMATS for extensions and mimetypes)
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+# (field name, column, type) - type is 'int64', 'string', 'bool', 'timestamp' or 'dictionary'
+USER_COLUMNAR_COLUMNS = [
+    ('id', User.id, 'int64'),
+    ('username', User.username, 'string'),
+    ('full_name', User.fullName, 'string'),
+    ('email', User.email, 'string'),
+    ('phone', User.phone, 'string'),
+    ('area', User.area, 'dictionary'),
+    ('house', User.house, 'dictionary'),
+    ('role', User.role, 'dictionary'),
+    ('status', User.status, 'dictionary'),
+    ('student_id', User.student_id, 'string'),
+    ('two_factor_enabled', User.two_factor_enabled, 'bool'),
+    ('password_change_required', User.password_change_required, 'bool'),
+]
+
+STUDENT_COLUMNAR_COLUMNS = [
+    ('id', Student.id, 'int64'),
+    ('student_id', Student.student_id, 'string'),
+    ('full_name', Student.full_name, 'string'),
+    ('email', Student.email, 'string'),
+    ('phone', Student.phone, 'string'),
+    ('area', Student.area, 'dictionary'),
+    ('house', Student.house, 'dictionary'),
+    ('status', Student.status, 'dictionary'),
+    ('matched', Student.matched, 'bool'),
+    ('user_id', Student.user_id, 'int64'),
+    ('registration_date', Student.registration_date, 'timestamp'),
+    ('notes', Student.notes, 'string'),
+]
+
+AUDIT_LOG_COLUMNAR_COLUMNS = [
+    ('id', AuditLog.id, 'int64'),
+    ('timestamp', AuditLog.timestamp, 'timestamp'),
+    ('user_id', AuditLog.user_id, 'int64'),
+    ('action', AuditLog.action, 'dictionary'),
+    ('details', AuditLog.details, 'string'),
+    ('ip_address', AuditLog.ip_address, 'dictionary'),
+    ('user_agent', AuditLog.user_agent, 'dictionary'),
+    ('payload', cast(AuditLog.payload, Text), 'string'),  # JSON text
+]
+
+
+def columnar_export_available():
+    """Whether pyarrow is installed"""
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _arrow_type(pa, kind):
+    return {
+        'int64': pa.int64(),
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us'),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+    }[kind]
+
+
+class _DictionaryEncoder:
+    """Dictionary encoder whose dictionary only grows, so every batch extends the previous one"""
+
+    def __init__(self, pa):
+        self.pa = pa
+        self.values = []
+        self.index = {}
+
+    def encode(self, values):
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            position = self.index.get(value)
+            if position is None:
+                position = self.index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(position)
+        return self.pa.DictionaryArray.from_arrays(
+            self.pa.array(indices, type=self.pa.int32()),
+            self.pa.array(self.values, type=self.pa.string())
+        )
+
+
+def write_columnar(columns, statement, file_format, output=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Write a query result as Parquet or an Arrow IPC stream, one record batch per cursor batch
+
+    Args:
+        columns: Columnar column spec the statement was built from
+        statement: SELECT returning the columns in spec order
+        file_format (str): 'parquet' or 'arrow'
+        output: Binary file to write to (defaults to a new temporary file)
+        batch_size (int): Rows per record batch
+
+    Returns:
+        file: The output positioned at the start (a temporary file is deleted when closed)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([pa.field(name, _arrow_type(pa, kind)) for name, _, kind in columns])
+    encoders = {
+        position: _DictionaryEncoder(pa)
+        for position, (_, _, kind) in enumerate(columns)
+        if kind == 'dictionary'
+    }
+
+    file_obj = output if output is not None else tempfile.TemporaryFile()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(file_obj, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(file_obj, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    try:
+        for partition in iter_export_batches(statement, batch_size):
+            column_values = list(zip(*partition))
+            arrays = [
+                encoders[position].encode(values) if position in encoders
+                else pa.array(values, type=schema.field(position).type)
+                for position, values in enumerate(column_values)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+
+    file_obj.seek(0)
+    return file_obj
+
+
+def generate_columnar_export(export_type: str, file_format: str, mode: str = 'all', user_ids: List[int] = None,
+                             filters: Dict = None):
+    """
+    Build a columnar export of users, students or audit logs
+
+    Args:
+        export_type (str): 'users', 'students' or 'audit_log'
+        file_format (str): 'parquet' or 'arrow'
+        mode, user_ids: Same as generate_export_file (users only)
+        filters (dict): User export filters, or student list filters for students
+
+    Returns:
+        dict: {'file_obj': temporary file}
+    """
+    if export_type == 'users':
+        columns = USER_COLUMNAR_COLUMNS
+        statement = build_user_export_statement(mode, user_ids, filters, columns=columns)
+    elif export_type == 'students':
+        columns = STUDENT_COLUMNAR_COLUMNS
+        statement = build_student_export_statement(filters, columns=columns)
+    else:
+        columns = AUDIT_LOG_COLUMNAR_COLUMNS
+        statement = export_statement(columns).order_by(AuditLog.id)
+
+    return {'file_obj': write_columnar(columns, statement, file_format)}
@@ -1,110 +1,349 @@
 from typing import List, Dict, Any
-import pandas as pd
-from io import BytesIO
-from flask import send_file
+import csv
+import io
+import tempfile
+import xlsxwriter
+from urllib.parse import quote
+from flask import Response, send_file, stream_with_context
 from app.models.models import User, db
-from sqlalchemy import or_
+from app.models.student import Student
+from app.services.student import apply_student_filters
+from sqlalchemy import or_, select
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 2000
+
+# Rows buffered before a CSV chunk is sent to the client
+CSV_FLUSH_ROWS = 500
+
+
+def _blank(value):
+    return value or ''
+
+
+# (header, column, formatter) - formatter is applied to the raw column value
+USER_EXPORT_COLUMNS = [
+    ('Username', User.username, None),
+    ('Full Name', User.fullName, None),
+    ('Email', User.email, None),
+    ('Phone', User.phone, _blank),
+    ('Area', User.area, _blank),
+    ('House', User.house, _blank),
+    ('Role', User.role, None),
+    ('Status', User.status, None),
+    ('Student ID', User.student_id, _blank),
+]
+
+STUDENT_EXPORT_COLUMNS = [
+    ('Student ID', Student.student_id, None),
+    ('Full Name', Student.full_name, None),
+    ('Email', Student.email, None),
+    ('Phone', Student.phone, _blank),
+    ('Area', Student.area, _blank),
+    ('House', Student.house, _blank),
+    ('Status', Student.status, _blank),
+    ('Matched', Student.matched, lambda value: 'Yes' if value else 'No'),
+    ('Registration Date', Student.registration_date, lambda value: value.strftime('%Y-%m-%d') if value else ''),
+    ('Notes', Student.notes, _blank),
+]
+
+# Header style shared by all Excel exports
+XLSX_HEADER_FORMAT = {
+    'bold': True,
+    'text_wrap': True,
+    'valign': 'top',
+    'fg_color': '#D7E4BC',
+    'border': 1
+}
+
+# Excel rejects wider columns
+XLSX_MAX_COLUMN_WIDTH = 255
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# format parameter -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    'excel': ('xlsx', XLSX_MIMETYPE),
+    'csv': ('csv', CSV_MIMETYPE),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+
+def export_headers(columns):
+    """Column headers of an export column spec"""
+    return [header for header, _, _ in columns]
+
+
+def export_statement(columns):
+    """SELECT of only the exported columns of an export column spec"""
+    return select(*[column for _, column, _ in columns])
+
+
+def iter_export_batches(statement, batch_size=EXPORT_BATCH_SIZE, connection=None):
+    """
+    Stream raw rows from a server-side cursor in batches
+
+    With psycopg2, stream_results makes SQLAlchemy use a named cursor, so rows are
+    fetched in batches of `batch_size` and never materialized as a whole.
+
+    Args:
+        statement: SELECT to run
+        batch_size (int): Rows fetched per round trip
+        connection: Connection to run on (defaults to the Flask-SQLAlchemy session)
+
+    Yields:
+        list: One batch of rows
+    """
+    executor = connection if connection is not None else db.session
+    result = executor.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def iter_export_rows(columns, statement, batch_size=EXPORT_BATCH_SIZE, connection=None):
+    """
+    Stream formatted export rows from a server-side cursor
+
+    Args:
+        columns: Export column spec the statement was built from
+        statement: SELECT returning the columns in spec order
+        batch_size (int): Rows fetched per round trip
+        connection: Connection to run on (defaults to the Flask-SQLAlchemy session)
+
+    Yields:
+        tuple: One formatted row
+    """
+    formatters = [formatter for _, _, formatter in columns]
+    for partition in iter_export_batches(statement, batch_size, connection):
+        for row in partition:
+            yield tuple(
+                formatter(value) if formatter else value
+                for formatter, value in zip(formatters, row)
+            )
+
+
+def stream_csv(headers, rows, bom=True):
+    """
+    Encode rows as CSV chunks
+
+    The header is sent as the first chunk so the download starts immediately.
+
+    Args:
+        headers (list): Column headers
+        rows: Iterable of row tuples
+        bom (bool): Prefix the output with a UTF-8 BOM (for Excel)
+
+    Yields:
+        bytes: UTF-8 encoded CSV chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def flush():
+        chunk = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    if bom:
+        buffer.write('\ufeff')
+    writer.writerow(headers)
+    yield flush()
+
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_ROWS == 0:
+            yield flush()
+
+    if buffer.tell():
+        yield flush()
+
+
+def write_xlsx(headers, rows, sheet_name='Sheet1', output=None):
+    """
+    Write rows to an XLSX file with constant memory
+
+    xlsxwriter's constant_memory mode flushes each row to disk once the next one
+    starts, and the finished workbook goes to an anonymous temporary file, so
+    memory stays flat regardless of the row count. Column widths are tracked
+    while rows are written instead of in a second pass over the data.
+
+    Args:
+        headers (list): Column headers
+        rows: Iterable of row tuples (written in order)
+        sheet_name (str): Worksheet name
+        output: Binary file to write to (defaults to a new temporary file)
+
+    Returns:
+        file: The output positioned at the start (a temporary file is deleted when closed)
+    """
+    file_obj = output if output is not None else tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(file_obj, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    worksheet.write_row(0, 0, headers, workbook.add_format(XLSX_HEADER_FORMAT))
+    widths = [len(header) + 2 for header in headers]
+
+    for row_num, row in enumerate(rows, start=1):
+        worksheet.write_row(row_num, 0, row)
+        for col_num, value in enumerate(row):
+            if value is not None:
+                length = len(str(value))
+                if length > widths[col_num]:
+                    widths[col_num] = length
+
+    for col_num, width in enumerate(widths):
+        worksheet.set_column(col_num, col_num, min(width, XLSX_MAX_COLUMN_WIDTH))
+
+    workbook.close()
+    file_obj.seek(0)
+    return file_obj
+
+
+def make_export_response(result):
+    """
+    Build the download response for an export result
+
+    Results carrying a 'stream' generator are streamed; results carrying a
+    'file_obj' are sent with send_file.
+    """
+    if 'stream' not in result:
+        return send_file(
+            result['file_obj'],
+            mimetype=result['mimetype'],
+            as_attachment=True,
+            download_name=result['filename']
+        )
+
+    filename = result['filename']
+    try:
+        filename.encode('ascii')
+        disposition = f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        disposition = f"attachment; filename*=UTF-8''{quote(filename)}"
+
+    return Response(
+        stream_with_context(result['stream']),
+        mimetype=result['mimetype'],
+        headers={
+            'Content-Disposition': disposition,
+            'X-Accel-Buffering': 'no'  # Let nginx pass chunks through as they are produced
+        }
+    )
+
+
+def build_user_export_statement(mode: str, user_ids: List[int] = None, filters: Dict = None, columns=USER_EXPORT_COLUMNS):
+    """Build the SELECT for a user export (root users are always excluded)"""
+    statement = export_statement(columns).where(User.role != 'root')
+
+    if mode == 'selected' and user_ids:
+        # Filter for specific user IDs
+        statement = statement.where(User.id.in_(user_ids))
+
+    # Apply additional filters if provided
+    if filters:
+        if filters.get('search'):
+            search_term = f"%{filters['search']}%"
+            statement = statement.where(or_(
+                User.username.ilike(search_term),
+                User.email.ilike(search_term),
+                User.fullName.ilike(search_term),
+                User.phone.ilike(search_term),
+                User.area.ilike(search_term),
+                User.house.ilike(search_term),
+                User.student_id.ilike(search_term)
+            ))
+
+        if filters.get('role'):
+            statement = statement.where(User.role == filters['role'])
+
+        if filters.get('status'):
+            statement = statement.where(User.status == filters['status'])
+
+        if filters.get('area'):
+            statement = statement.where(User.area == filters['area'])
+
+        if filters.get('house'):
+            statement = statement.where(User.house == filters['house'])
+
+    return statement.order_by(User.id)
+
+
+def build_brosis_students_export_statement(brosis_id: int):
+    """Build the SELECT for the students assigned to a BroSis user"""
+    return export_statement(STUDENT_EXPORT_COLUMNS).where(
+        Student.user_id == brosis_id,
+        Student.matched == True
+    ).order_by(Student.id)
+
+
+def build_house_students_export_statement(area: str, house: str):
+    """Build the SELECT for the students of one house"""
+    return export_statement(STUDENT_EXPORT_COLUMNS).where(
+        Student.area == area,
+        Student.house == house
+    ).order_by(Student.id)
+
+
+def build_student_export_statement(filters: Dict = None, columns=STUDENT_EXPORT_COLUMNS):
+    """Build the SELECT for a student export with the student list filters (see apply_student_filters)"""
+    return apply_student_filters(export_statement(columns), filters).order_by(Student.id)
+
+
+def export_file_info(prefix: str, format: str):
+    """Return (download filename, mimetype) for an export"""
+    from datetime import datetime
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    extension, mimetype = EXPORT_FORMATS.get(format.lower(), EXPORT_FORMATS['excel'])
+    return f'{prefix}-{timestamp}.{extension}', mimetype
+
+
+def user_export_file_info(format: str):
+    """Return (download filename, mimetype) for a user export"""
+    return export_file_info('users-export', format)
+
 
 def generate_export_file(mode: str, format: str = 'excel', user_ids: List[int] = None, filters: Dict = None) -> Dict[str, Any]:
     """
     Generate an export file (Excel or CSV) for users based on mode and filters
     Args:
         mode: 'all' or 'selected'
-        format: 'excel' or 'csv' 
+        format: 'excel' or 'csv'
         user_ids: List of user IDs when mode is 'selected'
         filters: Dictionary of filters to apply (search, role, status, area, house)
     Returns:
         Dictionary with:
-        - file_obj: BytesIO object containing the file data
+        - stream (csv): generator of CSV chunks read from a server-side cursor
+        - file_obj (excel): temporary file containing the workbook
         - filename: Suggested filename for the download
         - mimetype: Appropriate mimetype for the response
     """
     try:
-        # Build the query based on mode and filters
-        query = User.query
-        
-        # Always exclude root users from export
-        query = query.filter(User.role != 'root')
-        
-        if mode == 'selected' and user_ids:
-            # Filter for specific user IDs
-            query = query.filter(User.id.in_(user_ids))
-            
-        # Apply additional filters if provided
-        if filters:
-            if filters.get('search'):
-                search_term = f"%{filters['search']}%"
-                query = query.filter(or_(
-                    User.username.ilike(search_term),
-                    User.email.ilike(search_term),
-                    User.fullName.ilike(search_term),
-                    User.phone.ilike(search_term),
-                    User.area.ilike(search_term),
-                    User.house.ilike(search_term),
-                    User.student_id.ilike(search_term)
-                ))
-            
-            if filters.get('role'):
-                query = query.filter(User.role == filters['role'])
-                
-            if filters.get('status'):
-                query = query.filter(User.status == filters['status'])
-                
-            if filters.get('area'):
-                query = query.filter(User.area == filters['area'])
-                
-            if filters.get('house'):
-                query = query.filter(User.house == filters['house'])
-            
-        # Execute query and get users
-        users = query.all()
-        
-        # Prepare data for export
-        data = []
-        for user in users:
-            user_data = {
-                'Username': user.username,
-                'Full Name': user.fullName,
-                'Email': user.email,
-                'Phone': user.phone or '',
-                'Area': user.area or '',
-                'House': user.house or '',
-                'Role': user.role,
-                'Status': user.status,
-                'Student ID': user.student_id or ''
-            }
-            data.append(user_data)
-            
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Create file object
-        file_obj = BytesIO()
-        
-        # Generate export datetime for filename
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-        
+        statement = build_user_export_statement(mode, user_ids, filters)
+        headers = export_headers(USER_EXPORT_COLUMNS)
+
+        filename, mimetype = user_export_file_info(format)
+
         if format.lower() == 'csv':
-            # Export as CSV
-            df.to_csv(file_obj, index=False, encoding='utf-8-sig')
-            mimetype = 'text/csv'
-            filename = f'users-export-{timestamp}.csv'
-        else:
-            # Export as Excel
-            df.to_excel(file_obj, index=False, engine='openpyxl')
-            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            filename = f'users-export-{timestamp}.xlsx'
-            
-        # Reset file pointer to beginning
-        file_obj.seek(0)
-        
+            # Stream CSV straight from the cursor (the generator runs while the response is sent)
+            return {
+                'stream': stream_csv(headers, iter_export_rows(USER_EXPORT_COLUMNS, statement)),
+                'filename': filename,
+                'mimetype': mimetype
+            }
+
+        # Export as Excel
         return {
-            'file_obj': file_obj,
+            'file_obj': write_xlsx(headers, iter_export_rows(USER_EXPORT_COLUMNS, statement)),
             'filename': filename,
             'mimetype': mimetype
         }
-        
+
     except Exception as e:
         import traceback
         print(f"Error generating export file: {str(e)}")
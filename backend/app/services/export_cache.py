@@ -0,0 +1,209 @@
+"""
+On-disk cache for export files
+
+Entries are keyed by export type, export parameters, file format and the
+DataVersion of every table the export reads. Any committed write to one of
+those tables bumps its version, so older entries are never served again; they
+are removed when the entry is regenerated or by the size-bounded LRU eviction.
+
+Cached files are served with send_file(conditional=True), which answers Range
+and If-None-Match requests, so interrupted downloads can resume.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from flask import current_app, request, send_file
+
+from app.models.models import DataVersion
+from app.services.export import make_export_response
+
+logger = logging.getLogger(__name__)
+
+# Tables each export type reads from (student exports join user for the account columns)
+EXPORT_TABLES = {
+    'users': ('user',),
+    'students': ('student', 'user'),
+    'brosis_students': ('student', 'user'),
+}
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+# Age after which an unfinished temporary file is considered abandoned
+STALE_TMP_SECONDS = 3600
+
+
+def _cache_dir():
+    cache_dir = current_app.config['EXPORT_CACHE_DIR']
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _max_size():
+    return current_app.config['EXPORT_CACHE_MAX_SIZE_MB'] * 1024 * 1024
+
+
+def _signature(export_type, params, file_format):
+    payload = json.dumps({"type": export_type, "params": params, "format": file_format}, sort_keys=True, default=str)
+    return f"{export_type}-{hashlib.sha256(payload.encode()).hexdigest()[:32]}"
+
+
+def _entry_name(signature, versions, extension):
+    version_tag = '-'.join(f"{table}{versions[table]}" for table in sorted(versions))
+    return f"{signature}-{version_tag}.{extension}"
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def _remove_stale_versions(cache_dir, signature, keep_name):
+    """Drop entries for the same export that were built from older data"""
+    for name in os.listdir(cache_dir):
+        if name.startswith(signature + '-') and name != keep_name:
+            _remove(os.path.join(cache_dir, name))
+
+
+def _touch(path):
+    """
+    Mark an entry as recently used
+
+    Only the access time is updated: the modification time feeds the ETag that
+    Range requests are validated against, so it must stay stable.
+    """
+    stat = os.stat(path)
+    os.utime(path, (time.time(), stat.st_mtime))
+
+
+def _evict(cache_dir):
+    """Remove least recently used entries until the cache fits its size budget"""
+    entries = []
+    total = 0
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if name.startswith('.tmp-'):
+            # Leftovers of workers that died mid-write
+            if now - stat.st_mtime > STALE_TMP_SECONDS:
+                _remove(path)
+            continue
+        entries.append((stat.st_atime, stat.st_size, path))
+        total += stat.st_size
+
+    max_size = _max_size()
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if _remove(path):
+            total -= size
+            logger.info(f"Evicted export cache entry {os.path.basename(path)}")
+
+
+def _store(cache_dir, signature, entry_name, tmp_path):
+    """Publish a fully written temporary file as a cache entry"""
+    path = os.path.join(cache_dir, entry_name)
+    os.replace(tmp_path, path)
+    _remove_stale_versions(cache_dir, signature, entry_name)
+    _evict(cache_dir)
+    return path
+
+
+def _tee_stream(chunks, cache_dir, signature, entry_name):
+    """Pass chunks through to the client while writing them to the cache"""
+    tmp_path = os.path.join(cache_dir, f".tmp-{uuid.uuid4().hex}")
+    completed = False
+    try:
+        with open(tmp_path, 'wb') as tmp:
+            for chunk in chunks:
+                tmp.write(chunk)
+                yield chunk
+        completed = True
+        _store(cache_dir, signature, entry_name, tmp_path)
+    finally:
+        # Aborted downloads leave no partial entry behind
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _send_entry(path, mimetype, download_name):
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True
+    )
+
+
+def cached_export_response(export_type, params, file_format, download_name, mimetype, build):
+    """
+    Serve an export from the cache, generating and storing it on a miss
+
+    Args:
+        export_type (str): Key of EXPORT_TABLES
+        params (dict): Everything that determines the export content (filters, ids, ...)
+        file_format (str): File extension (see EXPORT_FORMATS)
+        download_name (str): File name sent to the client
+        mimetype (str): Mimetype of the file
+        build (callable): Returns an export result with 'stream' or 'file_obj'
+
+    Returns:
+        Response: File download response
+    """
+    if _max_size() <= 0:
+        result = build()
+        result.update(filename=download_name, mimetype=mimetype)
+        return make_export_response(result)
+
+    cache_dir = _cache_dir()
+    versions = DataVersion.get_versions(EXPORT_TABLES[export_type])
+    signature = _signature(export_type, params, file_format)
+    entry_name = _entry_name(signature, versions, file_format)
+    path = os.path.join(cache_dir, entry_name)
+
+    try:
+        _touch(path)
+        response = _send_entry(path, mimetype, download_name)
+    except FileNotFoundError:
+        # Not cached yet, or evicted by another worker in the meantime
+        pass
+    else:
+        logger.info(f"Export cache hit for {entry_name}")
+        return response
+
+    result = build()
+    result.update(filename=download_name, mimetype=mimetype)
+
+    if 'stream' in result and request.range is None:
+        # Plain download - stream to the client and fill the cache on the way
+        result['stream'] = _tee_stream(result['stream'], cache_dir, signature, entry_name)
+        return make_export_response(result)
+
+    # Write the whole file first so it can be served with Range support
+    tmp_path = os.path.join(cache_dir, f".tmp-{uuid.uuid4().hex}")
+    try:
+        with open(tmp_path, 'wb') as tmp:
+            if 'stream' in result:
+                for chunk in result['stream']:
+                    tmp.write(chunk)
+            else:
+                with result['file_obj'] as file_obj:
+                    shutil.copyfileobj(file_obj, tmp, COPY_BLOCK_SIZE)
+        path = _store(cache_dir, signature, entry_name, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return _send_entry(path, mimetype, download_name)
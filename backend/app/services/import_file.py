@@ -0,0 +1,80 @@
+"""
+Helpers for reading uploaded import files (Excel / CSV) without loading them fully
+"""
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Number of rows returned by import previews
+PREVIEW_ROWS = 10
+
+# Read size used when scanning CSV files for line breaks
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+def read_import_head(file_obj, file_extension, limit=PREVIEW_ROWS):
+    """
+    Parse only the header and the first `limit` data rows of an import file
+
+    Args:
+        file_obj: Seekable binary file object
+        file_extension (str): 'xlsx', 'xls' or 'csv'
+        limit (int): Number of data rows to parse
+
+    Returns:
+        DataFrame: The header and at most `limit` rows
+    """
+    file_obj.seek(0)
+    if file_extension in ['xlsx', 'xls']:
+        return pd.read_excel(file_obj, nrows=limit)
+    return pd.read_csv(file_obj, nrows=limit)
+
+
+def count_data_rows(file_obj, file_extension):
+    """
+    Count the data rows (excluding the header) of an import file cheaply
+
+    - xlsx: uses the sheet dimension metadata from a read-only workbook and only
+      falls back to a row scan when the file has no dimension record
+    - csv: counts line breaks in fixed-size binary chunks without parsing cells
+    - xls: no cheap metadata is available, so the first column is parsed
+
+    Args:
+        file_obj: Seekable binary file object
+        file_extension (str): 'xlsx', 'xls' or 'csv'
+
+    Returns:
+        int: Number of data rows
+    """
+    file_obj.seek(0)
+
+    if file_extension == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_obj, read_only=True)
+        try:
+            worksheet = workbook.worksheets[0]
+            max_row = worksheet.max_row
+            if max_row is None:
+                # No <dimension> record - scan rows without materializing cell values
+                max_row = sum(1 for _ in worksheet.iter_rows(values_only=True))
+            return max(max_row - 1, 0)
+        finally:
+            workbook.close()
+
+    if file_extension == 'xls':
+        return len(pd.read_excel(file_obj, usecols=[0]))
+
+    # CSV - count line breaks, accounting for a missing trailing newline
+    lines = 0
+    last_chunk = b''
+    while True:
+        chunk = file_obj.read(SCAN_CHUNK_SIZE)
+        if not chunk:
+            break
+        lines += chunk.count(b'\n')
+        last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        lines += 1
+    return max(lines - 1, 0)
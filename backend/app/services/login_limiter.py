@@ -0,0 +1,160 @@
+"""
+Bounded login concurrency shared by all gunicorn workers
+
+Gunicorn runs sync workers, so every login holds a whole worker while the
+password (argon2id) and TOTP are verified. To keep a login storm from taking
+every worker, logins run under a semaphore made of lock files:
+
+- LOGIN_MAX_CONCURRENCY slot files: holding one allows a login to run
+- LOGIN_QUEUE_SIZE queue files: holding one allows waiting for a free slot
+
+A login that finds every slot and every queue position taken is rejected
+immediately with LoginBusyError (503 + Retry-After). Locks are flock()s on
+files opened per process, so they are released automatically if a worker dies.
+
+While it holds a file, a login writes its pid into it and blanks it again
+before unlocking. /health counts those markers (skipping pids that no longer
+exist) instead of probing the locks, so it never holds a slot a login needs.
+"""
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# How often a queued login checks for a free slot
+SLOT_POLL_SECONDS = 0.02
+
+# Bytes at the start of a lock file holding the pid of the process that holds it
+MARKER_WIDTH = 10
+
+# Lock file descriptors of this process, keyed by path (reopened after fork)
+_lock_files = {}
+_lock_files_pid = None
+
+
+class LoginBusyError(Exception):
+    """Raised when the login queue is full; carries the Retry-After delay"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _lock_dir():
+    lock_dir = current_app.config['LOGIN_LOCK_DIR']
+    os.makedirs(lock_dir, exist_ok=True)
+    return lock_dir
+
+
+def _lock_file(name):
+    """File descriptor of a lock file, opened once per process"""
+    global _lock_files_pid
+    if _lock_files_pid != os.getpid():
+        # Descriptors inherited through fork share their locks with the parent
+        _lock_files.clear()
+        _lock_files_pid = os.getpid()
+
+    path = os.path.join(_lock_dir(), name)
+    fd = _lock_files.get(path)
+    if fd is None:
+        fd = _lock_files[path] = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    return fd
+
+
+def _try_lock(fd):
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    os.pwrite(fd, str(os.getpid()).rjust(MARKER_WIDTH).encode(), 0)
+    return True
+
+
+def _unlock(fd):
+    os.pwrite(fd, b' ' * MARKER_WIDTH, 0)
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _try_acquire(prefix, count):
+    """Lock the first free file of a group; returns its descriptor or None"""
+    for index in range(count):
+        fd = _lock_file(f"{prefix}-{index}.lock")
+        if _try_lock(fd):
+            return fd
+    return None
+
+
+def _count_held(prefix, count):
+    """Number of files in a group marked as held by a live process (reads the markers, takes no lock)"""
+    held = 0
+    for index in range(count):
+        marker = os.pread(_lock_file(f"{prefix}-{index}.lock"), MARKER_WIDTH, 0).strip()
+        if marker.isdigit() and _pid_alive(int(marker)):
+            held += 1
+    return held
+
+
+@contextmanager
+def login_slot():
+    """
+    Run a login inside one of the LOGIN_MAX_CONCURRENCY slots
+
+    Waits in the bounded queue for at most LOGIN_QUEUE_TIMEOUT_SECONDS.
+
+    Raises:
+        LoginBusyError: No slot and no queue position is free, or the wait timed out
+    """
+    config = current_app.config
+    max_concurrency = config['LOGIN_MAX_CONCURRENCY']
+    queue_size = config['LOGIN_QUEUE_SIZE']
+    retry_after = config['LOGIN_RETRY_AFTER_SECONDS']
+
+    slot = _try_acquire('slot', max_concurrency)
+    if slot is None:
+        position = _try_acquire('queue', queue_size)
+        if position is None:
+            logger.warning(f"Login rejected: {max_concurrency} logins running and queue of {queue_size} full")
+            raise LoginBusyError("Too many logins in progress, please try again shortly", retry_after)
+
+        try:
+            deadline = time.monotonic() + config['LOGIN_QUEUE_TIMEOUT_SECONDS']
+            while slot is None:
+                if time.monotonic() >= deadline:
+                    logger.warning("Login rejected: timed out waiting for a free login slot")
+                    raise LoginBusyError("Too many logins in progress, please try again shortly", retry_after)
+                time.sleep(SLOT_POLL_SECONDS)
+                slot = _try_acquire('slot', max_concurrency)
+        finally:
+            _unlock(position)
+
+    try:
+        yield
+    finally:
+        _unlock(slot)
+
+
+def login_limiter_stats():
+    """Current login concurrency across all workers (for /health)"""
+    config = current_app.config
+    return {
+        "max_concurrency": config['LOGIN_MAX_CONCURRENCY'],
+        "in_progress": _count_held('slot', config['LOGIN_MAX_CONCURRENCY']),
+        "queue_size": config['LOGIN_QUEUE_SIZE'],
+        "queue_depth": _count_held('queue', config['LOGIN_QUEUE_SIZE']),
+    }
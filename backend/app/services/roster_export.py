@@ -0,0 +1,374 @@
+"""
+Bulk export of student rosters as a ZIP (one file per BroSis or per house)
+
+A job runs in a background thread of the worker that accepted it:
+1. A coordinator transaction (REPEATABLE READ) lists the partitions and exports
+   its snapshot with pg_export_snapshot()
+2. Partitions are written in parallel by a process pool; every worker imports
+   the snapshot with SET TRANSACTION SNAPSHOT, so all files show the same data
+3. The files are zipped and the job manifest is marked completed
+
+Progress is kept in a manifest on disk so any worker can report it. On
+databases other than PostgreSQL the partitions are written sequentially in the
+coordinator transaction instead.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from flask import current_app
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.pool import NullPool
+
+from app.models.models import User, db
+from app.models.student import Student
+from app.services.export import (
+    STUDENT_EXPORT_COLUMNS, build_brosis_students_export_statement, build_house_students_export_statement,
+    export_headers, iter_export_rows, stream_csv, write_xlsx
+)
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY_OPTIONS = ('brosis', 'house')
+FORMAT_EXTENSIONS = {'excel': 'xlsx', 'csv': 'csv'}
+
+MANIFEST_NAME = 'manifest.json'
+RESULT_NAME = 'rosters.zip'
+PARTS_DIR = 'parts'
+
+# Interval at which a running job refreshes its manifest while partitions are in flight
+HEARTBEAT_SECONDS = 15
+
+# Per-process state of pool workers (set by _init_worker)
+_worker_engine = None
+_worker_snapshot = None
+
+
+class RosterExportError(Exception):
+    """Raised for invalid roster export requests; carries an HTTP status code"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _jobs_dir():
+    jobs_dir = current_app.config['EXPORT_JOB_DIR']
+    os.makedirs(jobs_dir, exist_ok=True)
+    return jobs_dir
+
+
+def _job_dir(jobs_dir, job_id):
+    # Job ids are uuid4 hex strings; reject anything else to avoid path traversal
+    try:
+        job_id = uuid.UUID(hex=job_id).hex
+    except (TypeError, ValueError):
+        raise RosterExportError("Export job not found", 404)
+    return os.path.join(jobs_dir, job_id)
+
+
+def _read_manifest(job_dir):
+    manifest_path = os.path.join(job_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise RosterExportError("Export job not found", 404)
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _write_manifest(job_dir, manifest):
+    manifest['updated_at'] = time.time()
+    tmp_path = os.path.join(job_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(job_dir, MANIFEST_NAME))
+
+
+def _safe_name(name):
+    """Make a partition label usable as a file name inside the ZIP"""
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', str(name or '')).strip(' ._')
+    return name or 'unnamed'
+
+
+def _status(manifest):
+    return {
+        "jobId": manifest['job_id'],
+        "status": manifest['status'],
+        "groupBy": manifest['group_by'],
+        "format": manifest['format'],
+        "area": manifest['area'],
+        "totalPartitions": manifest['total_partitions'],
+        "completedPartitions": manifest['completed_partitions'],
+        "totalRows": manifest['total_rows'],
+        "exportedRows": manifest['exported_rows'],
+        "error": manifest.get('error'),
+        "createdAt": manifest['created_at'],
+        "finishedAt": manifest.get('finished_at')
+    }
+
+
+def cleanup_expired_jobs():
+    """Remove roster export jobs older than EXPORT_JOB_EXPIRY_HOURS"""
+    expiry = current_app.config['EXPORT_JOB_EXPIRY_HOURS'] * 3600
+    now = time.time()
+    jobs_dir = _jobs_dir()
+
+    for name in os.listdir(jobs_dir):
+        path = os.path.join(jobs_dir, name)
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > expiry:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Removed expired roster export {name}")
+        except OSError as e:
+            logger.warning(f"Could not clean up roster export {name}: {str(e)}")
+
+
+def _list_partitions(connection, group_by, area):
+    """List the partitions of an export with their row counts"""
+    if group_by == 'brosis':
+        query = (
+            select(User.id, User.fullName, User.username, func.count(Student.id))
+            .join(Student, Student.user_id == User.id)
+            .where(User.role == 'brosis', Student.matched == True)
+            .group_by(User.id, User.fullName, User.username)
+            .order_by(User.id)
+        )
+        if area:
+            query = query.where(User.area == area)
+        return [
+            {"brosis_id": user_id, "label": f"{_safe_name(full_name or username)}_{user_id}", "rows": count}
+            for user_id, full_name, username, count in connection.execute(query)
+        ]
+
+    query = (
+        select(Student.area, Student.house, func.count(Student.id))
+        .where(Student.house.isnot(None))
+        .group_by(Student.area, Student.house)
+        .order_by(Student.area, Student.house)
+    )
+    if area:
+        query = query.where(Student.area == area)
+    return [
+        {"area": student_area, "house": house, "label": f"{_safe_name(student_area)}_{_safe_name(house)}", "rows": count}
+        for student_area, house, count in connection.execute(query)
+    ]
+
+
+def _write_partition(connection, partition, file_format, path):
+    """Write one partition file; returns the number of rows written"""
+    if 'brosis_id' in partition:
+        statement = build_brosis_students_export_statement(partition['brosis_id'])
+    else:
+        statement = build_house_students_export_statement(partition['area'], partition['house'])
+
+    written = [0]
+
+    def counted(rows):
+        for row in rows:
+            written[0] += 1
+            yield row
+
+    rows = counted(iter_export_rows(STUDENT_EXPORT_COLUMNS, statement, connection=connection))
+    headers = export_headers(STUDENT_EXPORT_COLUMNS)
+
+    with open(path, 'wb') as f:
+        if file_format == 'excel':
+            write_xlsx(headers, rows, sheet_name='Students', output=f)
+        else:
+            for chunk in stream_csv(headers, rows, bom=False):
+                f.write(chunk)
+
+    return written[0]
+
+
+def _init_worker(database_url, snapshot_id):
+    global _worker_engine, _worker_snapshot
+    _worker_engine = create_engine(database_url, poolclass=NullPool)
+    _worker_snapshot = snapshot_id
+
+
+def _export_partition_in_worker(partition, file_format, path):
+    """Pool task: write a partition from the coordinator's exported snapshot"""
+    with _worker_engine.connect().execution_options(isolation_level='REPEATABLE READ') as connection:
+        with connection.begin():
+            # Must be the first statement of the transaction
+            connection.execute(text("SET TRANSACTION SNAPSHOT :snapshot"), {"snapshot": _worker_snapshot})
+            return _write_partition(connection, partition, file_format, path)
+
+
+def _run_job(app, job_dir):
+    """Background thread body: generate all partitions and build the ZIP"""
+    with app.app_context():
+        manifest = _read_manifest(job_dir)
+        parts_dir = os.path.join(job_dir, PARTS_DIR)
+        os.makedirs(parts_dir, exist_ok=True)
+        extension = FORMAT_EXTENSIONS[manifest['format']]
+
+        try:
+            engine = db.engine
+            use_snapshot = engine.dialect.name == 'postgresql'
+            connection = engine.connect()
+            if use_snapshot:
+                connection = connection.execution_options(isolation_level='REPEATABLE READ')
+
+            with connection:
+                with connection.begin():
+                    partitions = _list_partitions(connection, manifest['group_by'], manifest['area'])
+                    manifest['total_partitions'] = len(partitions)
+                    manifest['total_rows'] = sum(partition['rows'] for partition in partitions)
+                    _write_manifest(job_dir, manifest)
+
+                    def finished(rows):
+                        manifest['completed_partitions'] += 1
+                        manifest['exported_rows'] += rows
+                        _write_manifest(job_dir, manifest)
+
+                    paths = {
+                        partition['label']: os.path.join(parts_dir, f"{partition['label']}.{extension}")
+                        for partition in partitions
+                    }
+
+                    if use_snapshot and len(partitions) > 1:
+                        snapshot_id = connection.execute(text("SELECT pg_export_snapshot()")).scalar()
+                        workers = min(app.config['EXPORT_JOB_WORKERS'], len(partitions))
+
+                        # The snapshot stays importable while this transaction is open
+                        with ProcessPoolExecutor(
+                            max_workers=workers,
+                            mp_context=multiprocessing.get_context('spawn'),
+                            initializer=_init_worker,
+                            initargs=(engine.url.render_as_string(hide_password=False), snapshot_id)
+                        ) as pool:
+                            pending = {
+                                pool.submit(_export_partition_in_worker, partition, manifest['format'], paths[partition['label']])
+                                for partition in partitions
+                            }
+                            while pending:
+                                done, pending = wait(pending, timeout=HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+                                for future in done:
+                                    finished(future.result())
+                                if not done:
+                                    # Heartbeat so long partitions are not reported as stalled
+                                    _write_manifest(job_dir, manifest)
+                    else:
+                        for partition in partitions:
+                            finished(_write_partition(connection, partition, manifest['format'], paths[partition['label']]))
+
+            # Excel files are already compressed
+            compression = zipfile.ZIP_STORED if extension == 'xlsx' else zipfile.ZIP_DEFLATED
+            tmp_path = os.path.join(job_dir, RESULT_NAME + '.tmp')
+            with zipfile.ZipFile(tmp_path, 'w', compression=compression) as archive:
+                for path in paths.values():
+                    archive.write(path, arcname=os.path.basename(path))
+            os.replace(tmp_path, os.path.join(job_dir, RESULT_NAME))
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+            manifest['status'] = 'completed'
+            manifest['finished_at'] = time.time()
+            _write_manifest(job_dir, manifest)
+            logger.info(f"Roster export {manifest['job_id']} completed: {manifest['total_partitions']} files, {manifest['exported_rows']} rows")
+
+        except Exception as e:
+            logger.error(f"Roster export {manifest['job_id']} failed: {str(e)}")
+            manifest['status'] = 'failed'
+            manifest['error'] = str(e)
+            manifest['finished_at'] = time.time()
+            _write_manifest(job_dir, manifest)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def start_roster_export(owner_id, group_by='brosis', file_format='excel', area=None):
+    """
+    Start a background roster export job
+
+    Args:
+        owner_id (int): ID of the user requesting the export
+        group_by (str): 'brosis' (one file per BroSis) or 'house' (one file per house)
+        file_format (str): 'excel' or 'csv'
+        area (str): Restrict the export to one area (None for all areas)
+
+    Returns:
+        dict: Initial job status including jobId
+    """
+    if group_by not in GROUP_BY_OPTIONS:
+        raise RosterExportError(f"Invalid groupBy. Must be one of: {', '.join(GROUP_BY_OPTIONS)}")
+    if file_format not in FORMAT_EXTENSIONS:
+        raise RosterExportError(f"Invalid format. Must be one of: {', '.join(FORMAT_EXTENSIONS)}")
+
+    cleanup_expired_jobs()
+
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(_jobs_dir(), job_id)
+    os.makedirs(job_dir)
+
+    manifest = {
+        "job_id": job_id,
+        "owner_id": owner_id,
+        "group_by": group_by,
+        "format": file_format,
+        "area": area,
+        "status": 'running',
+        "total_partitions": 0,
+        "completed_partitions": 0,
+        "total_rows": 0,
+        "exported_rows": 0,
+        "created_at": time.time()
+    }
+    _write_manifest(job_dir, manifest)
+
+    thread = threading.Thread(
+        target=_run_job,
+        args=(current_app._get_current_object(), job_dir),
+        name=f"roster-export-{job_id}",
+        daemon=True
+    )
+    thread.start()
+
+    logger.info(f"Started roster export {job_id} ({group_by}, {file_format}, area={area})")
+    return _status(manifest)
+
+
+def _load_owned(job_id, owner_id):
+    job_dir = _job_dir(_jobs_dir(), job_id)
+    manifest = _read_manifest(job_dir)
+    if str(manifest['owner_id']) != str(owner_id):
+        raise RosterExportError("Export job not found", 404)
+
+    # A job whose worker process went away (restart, recycle) never finishes
+    stale_after = current_app.config['EXPORT_JOB_STALE_SECONDS']
+    if manifest['status'] == 'running' and time.time() - manifest['updated_at'] > stale_after:
+        manifest['status'] = 'failed'
+        manifest['error'] = "Export job stopped responding"
+        _write_manifest(job_dir, manifest)
+
+    return job_dir, manifest
+
+
+def get_roster_export(job_id, owner_id):
+    """Return the status and progress of a roster export job"""
+    _, manifest = _load_owned(job_id, owner_id)
+    return _status(manifest)
+
+
+def get_roster_export_file(job_id, owner_id):
+    """
+    Resolve the ZIP of a completed roster export job
+
+    Returns:
+        tuple: (file path, download filename)
+    """
+    job_dir, manifest = _load_owned(job_id, owner_id)
+    if manifest['status'] != 'completed':
+        raise RosterExportError("Export job is not completed", 409)
+
+    created = time.strftime('%Y%m%d_%H%M%S', time.localtime(manifest['created_at']))
+    area = f"{_safe_name(manifest['area'])}_" if manifest['area'] else ''
+    return os.path.join(job_dir, RESULT_NAME), f"{area}rosters_by_{manifest['group_by']}_{created}.zip"
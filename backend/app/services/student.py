@@ -5,13 +5,83 @@ from app.models.student import Student
 from sqlalchemy import or_, and_
 import logging
 from app.services.auth import get_current_user
+from app.services.bulk_operations import run_in_chunks
 import random
-from collections import defaultdict
-from sqlalchemy import func
+from collections import Counter, defaultdict
+from sqlalchemy import cast, delete, func, select, update
+from sqlalchemy import column as sql_column, values as sql_values
 from flask import current_app
+import hashlib
+import heapq
 
 logger = logging.getLogger(__name__)
 
+def apply_student_filters(statement, filters):
+    """
+    Apply the student list filters to a Query or Select on Student.
+    Shared by the student list, the "select all" ID lookup and the student export,
+    so every view of "the current filter" matches the same rows.
+    
+    Args:
+        statement: Query or Select over Student
+        filters (dict): search, status, area, house, has_house, matched, user_id, brosisFilter
+        
+    Returns:
+        The filtered Query or Select
+    """
+    if not filters:
+        return statement
+    
+    conditions = []
+    join_user = False
+    
+    # Search filter - ILIKE supports Unicode characters including Vietnamese with diacritics
+    if filters.get('search'):
+        search_term = f"%{filters['search'].strip()}%"
+        join_user = True
+        conditions.append(or_(
+            Student.full_name.ilike(search_term),
+            Student.email.ilike(search_term),
+            Student.student_id.ilike(search_term),
+            User.fullName.ilike(search_term)
+        ))
+    
+    if filters.get('status'):
+        conditions.append(Student.status == filters['status'])
+    
+    if filters.get('area'):
+        conditions.append(Student.area == filters['area'])
+    
+    if filters.get('house'):
+        conditions.append(Student.house == filters['house'])
+    
+    # Has House filter - check whether house field is set or not
+    if 'has_house' in filters:
+        if filters['has_house'] is True:
+            conditions.append(and_(Student.house.isnot(None), Student.house != ''))
+        else:
+            conditions.append(or_(Student.house.is_(None), Student.house == ''))
+    
+    if filters.get('matched') not in (None, ''):
+        conditions.append(Student.matched == (str(filters['matched']).lower() == 'true'))
+    
+    # User ID filter - for limiting students to specific brosis user
+    if filters.get('user_id'):
+        conditions.append(Student.user_id == filters['user_id'])
+    
+    # Brosis filter - students assigned to a brosis with the given name
+    if filters.get('brosisFilter'):
+        brosis_term = f"%{filters['brosisFilter'].strip()}%"
+        join_user = True
+        conditions.append(User.fullName.ilike(brosis_term))
+    
+    if join_user:
+        # Outer join so unassigned students still match the student-side search terms
+        statement = statement.outerjoin(User, Student.user_id == User.id)
+    
+    return statement.where(*conditions)
+
+
 def get_all_students(page=1, per_page=20, filters=None, sort_by='id', sort_desc=False):
     """
     Get all students with pagination, filtering and sorting.
@@ -29,69 +99,8 @@ def get_all_students(page=1, per_page=20, filters=None, sort_by='id', sort_desc=
     """
     try:
         # Start with optimized base query
-        query = Student.query.order_by(Student.id.desc())
-        
-        # Apply filters efficiently using joins when needed
+        query = apply_student_filters(Student.query, filters).order_by(Student.id.desc())
         if filters:
-            # Search filter - use database indexing for performance
-            if 'search' in filters and filters['search']:
-                search_term = f"%{filters['search'].strip()}%"
-                # Use OR conditions efficiently with indexes
-                # The ILIKE operator supports Unicode characters including Vietnamese with diacritics
-                query = query.outerjoin(User, Student.user_id == User.id).filter(
-                    or_(
-                        Student.full_name.ilike(search_term),
-                        Student.email.ilike(search_term),
-                        Student.student_id.ilike(search_term),
-                        User.full_name.ilike(search_term)
-                    )
-                )
-            
-            # Status filter - direct equality check is fast
-            if 'status' in filters and filters['status']:
-                query = query.filter(Student.status == filters['status'])
-                
-            # Area filter - use join if area relationships exist
-            if 'area' in filters and filters['area']:
-                query = query.filter(Student.area == filters['area'])
-                
-            # House filter - use join if house relationships exist
-            if 'house' in filters and filters['house']:
-                query = query.filter(Student.house == filters['house'])
-                
-            # Has House filter - check whether house field is set or not
-            if 'has_house' in filters:
-                has_house = filters['has_house']
-                if has_house is True:
-                    # Find students with non-empty house field
-                    query = query.filter(Student.house.isnot(None), Student.house != '')
-                else:
-                    # Find students with empty or null house field
-                    query = query.filter(or_(Student.house.is_(None), Student.house == ''))
-                
-            # Matched filter - use optimized boolean check
-            if 'matched' in filters:
-                matched_value = filters['matched'].lower() == 'true'
-                logger.info(f"Processing matched filter: {filters['matched']} => boolean: {matched_value}")
-                query = query.filter(Student.matched == matched_value)
-                
-            # User ID filter - for limiting students to specific brosis user
-            if 'user_id' in filters and filters['user_id']:
-                user_id = filters['user_id']
-                logger.info(f"Filtering students by user_id: {user_id}")
-                query = query.filter(Student.user_id == user_id)
-            
-            # Brosis filter - find students assigned to brosis with the given name
-            if 'brosisFilter' in filters and filters['brosisFilter']:
-                brosis_term = f"%{filters['brosisFilter'].strip()}%"
-                # ILIKE supports Unicode characters including Vietnamese with diacritics
-                logger.info(f"Applying brosis filter with term: '{filters['brosisFilter']}', search pattern: '{brosis_term}'")
-                # Use outerjoin instead of join to ensure we don't lose students in the query
-                if not any(isinstance(j, tuple) and j[0] is User for j in query._join_entities):
-                    query = query.outerjoin(User, Student.user_id == User.id)
-                query = query.filter(User.full_name.ilike(brosis_term))
-                logger.info(f"Applied brosis filter, SQL: {str(query)}")
-            
             logger.info(f"Applied student filters: {filters}")
         
         # Always use pagination for large datasets
@@ -264,6 +273,286 @@ def update_student(student_id, student_data):
         return None, f"Error updating student: {str(e)}"
 
 
+# Request keys a bulk PATCH may change (API key -> Student column), as accepted by update_student
+BULK_UPDATE_FIELDS = {
+    'studentId': 'student_id',
+    'fullName': 'full_name',
+    'email': 'email',
+    'phone': 'phone',
+    'parentPhone': 'parent_phone',
+    'parent_phone': 'parent_phone',
+    'area': 'area',
+    'house': 'house',
+    'areaId': 'area_id',
+    'houseId': 'house_id',
+    'status': 'status',
+    'matched': 'matched',
+    'userId': 'user_id',
+    'notes': 'notes'
+}
+BROSIS_UPDATE_FIELDS = ('notes', 'status')
+STUDENT_STATUSES = ('pending', 'active', 'inactive')  # 'pending' is what create and import assign
+
+# Rows per UPDATE ... FROM (VALUES ...) statement (and per IN (...) list when validating)
+BULK_UPDATE_CHUNK_SIZE = 500
+
+
+def _lookup_existing(column, values):
+    """Values of `column` that exist, looked up in chunks"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), BULK_UPDATE_CHUNK_SIZE):
+        chunk = values[start:start + BULK_UPDATE_CHUNK_SIZE]
+        found.update(db.session.execute(select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _student_row_changes(changes, student, principal):
+    """
+    Validate one row's changes against the caller's permissions and the Student columns
+    
+    Returns:
+        tuple: ({column: value}, error message)
+    """
+    if not isinstance(changes, dict) or not changes:
+        return None, "No changes provided"
+        
+    unknown = [key for key in changes if key not in BULK_UPDATE_FIELDS]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+        
+    # Same restrictions as PUT /students/<id>
+    if principal.role == 'brosis':
+        if student.user_id != principal.id:
+            return None, "You can only update students assigned to you"
+        restricted = [key for key in changes if key not in BROSIS_UPDATE_FIELDS]
+        if restricted:
+            return None, f"Brosis users cannot update these fields: {', '.join(restricted)}"
+    elif principal.role != 'root' and student.area != principal.area:
+        return None, "You can only update students in your area"
+        
+    columns = {}
+    table = Student.__table__
+    for key, value in changes.items():
+        name = BULK_UPDATE_FIELDS[key]
+        column = table.c[name]
+        
+        if value is None or value == '':
+            if not column.nullable:
+                return None, f"{key} cannot be empty"
+            value = None
+        elif isinstance(column.type, db.String):
+            value = str(value).strip()
+            if column.type.length and len(value) > column.type.length:
+                return None, f"{key} is longer than {column.type.length} characters"
+        elif isinstance(column.type, db.Integer):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return None, f"{key} must be an integer"
+        elif isinstance(column.type, db.Boolean):
+            if not isinstance(value, bool):
+                return None, f"{key} must be true or false"
+                
+        if name == 'status' and value not in STUDENT_STATUSES:
+            return None, f"status must be one of: {', '.join(STUDENT_STATUSES)}"
+        columns[name] = value
+        
+    # Assigning or clearing the BroSis also sets matched, as update_student does
+    if 'user_id' in columns:
+        columns['matched'] = columns['user_id'] is not None
+        
+    return columns, None
+
+
+def _apply_student_updates(names, rows):
+    """
+    Apply rows that change the same columns (no commit)
+    
+    Identical changes become one UPDATE ... WHERE id IN (...); differing values
+    are joined in as UPDATE student SET ... FROM (VALUES ...) AS changes
+    on PostgreSQL.
+    
+    Args:
+        names (tuple): Student column names changed by every row
+        rows (list): (student id, {column: value}) pairs
+    """
+    table = Student.__table__
+    first = rows[0][1]
+    if all(columns == first for _, columns in rows):
+        db.session.execute(
+            update(Student)
+            .where(Student.id.in_([student_id for student_id, _ in rows]))
+            .values({name: first[name] for name in names})
+            .execution_options(synchronize_session=False)
+        )
+        return
+        
+    if db.engine.dialect.name != 'postgresql':
+        # No VALUES column aliases elsewhere (SQLite): executemany UPDATE by primary key
+        db.session.execute(update(Student), [dict(columns, id=student_id) for student_id, columns in rows])
+        return
+        
+    changes = sql_values(
+        sql_column('id', db.Integer),
+        *[sql_column(name, table.c[name].type) for name in names],
+        name='changes'
+    ).data([(student_id, *[columns[name] for name in names]) for student_id, columns in rows])
+    
+    # The casts keep all-NULL columns of the VALUES list from being typed as text
+    db.session.execute(
+        update(Student)
+        .where(Student.id == changes.c.id)
+        .values({name: cast(changes.c[name], table.c[name].type) for name in names})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bulk_update_students(items, principal, all_or_nothing=False, ip_address=None, user_agent=None):
+    """
+    Apply per-student changes in bulk (PATCH /students/bulk)
+    
+    Every row is validated in one pass: the students, duplicate studentIds and
+    referenced users, areas and houses are each looked up with batched IN
+    queries. Valid rows are grouped by the columns they change and written
+    with one statement per group and chunk. With all_or_nothing nothing is
+    written unless every row is valid, and all groups commit together;
+    otherwise each statement commits on its own and a failing statement only
+    fails its own rows.
+    
+    Args:
+        items (list): {"id": <student id>, "changes": {<field>: <value>}} dicts
+        principal: Current user (role, area and id drive the permission checks)
+        all_or_nothing (bool): Apply either every row or none
+        ip_address (str): Client address for the audit log
+        user_agent (str): Client user agent for the audit log
+        
+    Returns:
+        dict: results ({"success": [...], "failed": [{"id", "reason"}]}) and applied (whether anything was written)
+    """
+    results = {"success": [], "failed": []}
+    
+    requested = []
+    for item in items:
+        raw_id = item.get('id') if isinstance(item, dict) else None
+        try:
+            requested.append((int(raw_id), item.get('changes')))
+        except (TypeError, ValueError):
+            results["failed"].append({"id": raw_id, "reason": "Invalid student id"})
+            
+    # A student listed twice has conflicting changes; none of its rows are applied
+    occurrences = Counter(student_id for student_id, _ in requested)
+    for student_id, _ in requested:
+        if occurrences[student_id] > 1:
+            results["failed"].append({"id": student_id, "reason": "Student appears more than once"})
+    requested = [(student_id, changes) for student_id, changes in requested if occurrences[student_id] == 1]
+        
+    students = {}
+    ids = [student_id for student_id, _ in requested]
+    for start in range(0, len(ids), BULK_UPDATE_CHUNK_SIZE):
+        for student in db.session.execute(
+            select(Student.id, Student.student_id, Student.full_name, Student.area, Student.user_id)
+            .where(Student.id.in_(ids[start:start + BULK_UPDATE_CHUNK_SIZE]))
+        ):
+            students[student.id] = student
+            
+    valid = []
+    for student_id, changes in requested:
+        student = students.get(student_id)
+        if student is None:
+            results["failed"].append({"id": student_id, "reason": "Student not found"})
+            continue
+        columns, error = _student_row_changes(changes, student, principal)
+        if error:
+            results["failed"].append({"id": student_id, "reason": error})
+            continue
+        valid.append((student, columns))
+        
+    # Cross-row checks, one query each: unique studentIds and existing users, areas and houses
+    new_codes = [columns['student_id'] for student, columns in valid
+                 if 'student_id' in columns and columns['student_id'] != student.student_id]
+    taken = _lookup_existing(Student.student_id, set(new_codes))
+    duplicated = {code for code, count in Counter(new_codes).items() if count > 1}
+    references = {
+        'user_id': (_lookup_existing(User.id, {c['user_id'] for _, c in valid if c.get('user_id') is not None}), "BroSis user not found"),
+        'area_id': (_lookup_existing(Area.id, {c['area_id'] for _, c in valid if c.get('area_id') is not None}), "Area not found"),
+        'house_id': (_lookup_existing(House.id, {c['house_id'] for _, c in valid if c.get('house_id') is not None}), "House not found")
+    }
+    
+    groups = defaultdict(list)
+    for student, columns in valid:
+        reason = None
+        code = columns.get('student_id')
+        if code is not None and code != student.student_id:
+            if code in taken:
+                reason = f"Student with ID '{code}' already exists"
+            elif code in duplicated:
+                reason = f"Student ID '{code}' is used by more than one row"
+        for name, (existing, message) in references.items():
+            if columns.get(name) is not None and columns[name] not in existing:
+                reason = reason or message
+        if reason:
+            results["failed"].append({"id": student.id, "reason": reason})
+            continue
+        groups[tuple(sorted(columns))].append((student, columns))
+        
+    if all_or_nothing and results["failed"]:
+        return {"results": results, "applied": False}
+        
+    def audit(rows):
+        AuditLog.add(
+            user_id=principal.id,
+            action='bulk_update_students',
+            details=f"Updated {len(rows)} students as part of bulk operation",
+            ip_address=ip_address,
+            user_agent=user_agent,
+            target_type='student',
+            target_ids=[student.id for student, _ in rows],
+            counts={'success': len(rows)},
+            filters={'fields': sorted({name for _, columns in rows for name in columns})}
+        )
+        
+    def succeeded(rows):
+        results["success"].extend(
+            {"id": student.id, "studentId": columns.get('student_id', student.student_id),
+             "fullName": columns.get('full_name', student.full_name)}
+            for student, columns in rows
+        )
+        
+    if all_or_nothing:
+        rows = [row for group in groups.values() for row in group]
+        try:
+            for names, group in groups.items():
+                for start in range(0, len(group), BULK_UPDATE_CHUNK_SIZE):
+                    _apply_student_updates(names, [(student.id, columns) for student, columns in group[start:start + BULK_UPDATE_CHUNK_SIZE]])
+            if rows:
+                audit(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error applying bulk student update: {str(e)}")
+            results["failed"].extend({"id": student.id, "reason": str(e)} for student, _ in rows)
+            return {"results": results, "applied": False}
+        succeeded(rows)
+        return {"results": results, "applied": bool(rows)}
+        
+    for names, group in groups.items():
+        for start in range(0, len(group), BULK_UPDATE_CHUNK_SIZE):
+            rows = group[start:start + BULK_UPDATE_CHUNK_SIZE]
+            try:
+                _apply_student_updates(names, [(student.id, columns) for student, columns in rows])
+                audit(rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error applying bulk student update: {str(e)}")
+                results["failed"].extend({"id": student.id, "reason": str(e)} for student, _ in rows)
+                continue
+            succeeded(rows)
+            
+    return {"results": results, "applied": bool(results["success"])}
+
+
 def delete_student(student_id):
     """
     Delete a student
@@ -289,6 +578,284 @@ def delete_student(student_id):
         return None, f"Error deleting student: {str(e)}"
 
 
+def bulk_delete_students(filters=None, student_ids=None, current_user_id=None, ip_address=None, user_agent=None,
+                         operation=None):
+    """
+    Delete many students with chunked set-based DELETE statements
+    
+    Without student_ids every student matching the filters is deleted; with
+    student_ids only those of them that also match the filters (the caller's
+    area scope) are. The ids are resolved up front and deleted by
+    run_in_chunks, one DELETE ... WHERE id IN (<chunk>) AND <filters>
+    RETURNING id per chunk, committed together with an audit entry listing the
+    deleted students.
+    
+    Args:
+        filters (dict): Student list filters (see apply_student_filters), including the area scope
+        student_ids (list): IDs to delete, or None to delete everything matching the filters
+        current_user_id (int): User performing the operation (for the audit log)
+        ip_address (str): Client address for the audit log
+        user_agent (str): Client user agent for the audit log
+        operation (BulkOperation): Record that receives the progress, if any
+        
+    Returns:
+        dict: success, failed and skipped counts (skipped: requested IDs that do not exist or are out of scope)
+    """
+    mode = 'selected' if student_ids is not None else 'all'
+    skipped_count = 0
+    
+    if student_ids is not None:
+        target_ids = list(dict.fromkeys(int(student_id) for student_id in student_ids))
+        skipped_count += len(student_ids) - len(target_ids)
+    else:
+        target_ids = db.session.execute(
+            apply_student_filters(select(Student.id), filters).order_by(Student.id)
+        ).scalars().all()
+        
+    def delete_chunk(chunk):
+        # The filters are applied again: students may have changed since the ids were resolved
+        candidates = apply_student_filters(select(Student.id), filters).where(Student.id.in_(chunk))
+        deleted_ids = db.session.execute(
+            delete(Student)
+            .where(Student.id.in_(candidates.scalar_subquery()))
+            .returning(Student.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        
+        if deleted_ids:
+            AuditLog.add(
+                user_id=current_user_id,
+                action='delete_student_in_bulk',
+                details=f"Deleted {len(deleted_ids)} students as part of bulk operation",
+                ip_address=ip_address,
+                user_agent=user_agent,
+                target_type='student',
+                target_ids=deleted_ids,
+                counts={'success': len(deleted_ids)},
+                filters={'mode': mode}
+            )
+        return {'success': len(deleted_ids), 'skipped': len(chunk) - len(deleted_ids)}
+        
+    totals = run_in_chunks(target_ids, delete_chunk, operation=operation)
+    return {
+        "success": totals['success'],
+        "failed": totals['failed'],
+        "skipped": skipped_count + totals['skipped']
+    }
+
+
+def _distinct_student_ids(student_ids, results):
+    """Request ids as distinct integers, in order; ids that are not integers go to results['failed']"""
+    parsed = []
+    for student_id in student_ids:
+        try:
+            parsed.append(int(student_id))
+        except (TypeError, ValueError):
+            results["failed"].append({"id": student_id, "reason": "Invalid student ID"})
+    return list(dict.fromkeys(parsed))
+
+
+def _discard_chunk_results(results, chunk, error):
+    """Replace whatever a rolled back chunk reported with one failure per id"""
+    chunk_ids = set(chunk)
+    results["success"] = [item for item in results["success"] if item["id"] not in chunk_ids]
+    results["failed"] = [item for item in results["failed"] if item["id"] not in chunk_ids]
+    results["failed"] += [{"id": student_id, "reason": str(error)} for student_id in chunk]
+
+
+def bulk_assign_students(student_ids, brosis_user, current_user_id=None, ip_address=None, user_agent=None,
+                         operation=None):
+    """
+    Assign students to a BroSis in chunks
+    
+    Each chunk reads its students once to report why some cannot be assigned,
+    then assigns the rest with one UPDATE whose WHERE clause repeats the area
+    and house rules, committed together with an audit entry.
+    
+    Args:
+        student_ids (list): IDs of the students to assign
+        brosis_user (User): BroSis receiving the students (already authorized by the caller)
+        current_user_id (int): User performing the operation (for the audit log)
+        ip_address (str): Client address for the audit log
+        user_agent (str): Client user agent for the audit log
+        operation (BulkOperation): Record that receives the progress, if any
+        
+    Returns:
+        dict: success ({id, studentId, fullName}) and failed ({id, reason}) lists
+    """
+    results = {"success": [], "failed": []}
+    target_ids = _distinct_student_ids(student_ids, results)
+    
+    rules = [Student.area == brosis_user.area]
+    if brosis_user.house:
+        rules.append(Student.house == brosis_user.house)
+        
+    def assign_chunk(chunk):
+        rows = {
+            row.id: row for row in db.session.execute(
+                select(Student.id, Student.student_id, Student.full_name, Student.area, Student.house)
+                .where(Student.id.in_(chunk))
+            )
+        }
+        
+        failed = []
+        eligible = []
+        for student_id in chunk:
+            row = rows.get(student_id)
+            if row is None:
+                reason = "Student not found"
+            elif row.area != brosis_user.area:
+                reason = "Student not in the same area as BroSis"
+            elif brosis_user.house and row.house != brosis_user.house:
+                reason = "Student not in the same house as BroSis"
+            else:
+                eligible.append(student_id)
+                continue
+            failed.append({"id": student_id, "reason": reason})
+            
+        assigned = set()
+        if eligible:
+            assigned = set(db.session.execute(
+                update(Student)
+                .where(Student.id.in_(eligible), *rules)
+                .values(user_id=brosis_user.id, matched=True)
+                .returning(Student.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            
+        success = [
+            {"id": student_id, "studentId": rows[student_id].student_id, "fullName": rows[student_id].full_name}
+            for student_id in eligible if student_id in assigned
+        ]
+        failed += [
+            {"id": student_id, "reason": "Student changed during the operation"}
+            for student_id in eligible if student_id not in assigned
+        ]
+        
+        if success:
+            AuditLog.add(
+                user_id=current_user_id,
+                action='assign_students_to_brosis',
+                details=f"Assigned {len(success)} students to BroSis {brosis_user.username}",
+                ip_address=ip_address,
+                user_agent=user_agent,
+                target_type='student',
+                target_ids=[item['id'] for item in success],
+                counts={'success': len(success), 'failed': len(failed)},
+                filters={'brosis_user_id': brosis_user.id}
+            )
+            
+        results["success"] += success
+        results["failed"] += failed
+        return {'success': len(success), 'failed': len(failed)}
+        
+    run_in_chunks(
+        target_ids, assign_chunk, operation=operation,
+        on_error=lambda chunk, error: _discard_chunk_results(results, chunk, error)
+    )
+    return results
+
+
+def bulk_unassign_students(student_ids, principal, ip_address=None, user_agent=None, operation=None):
+    """
+    Unassign students from their BroSis in chunks
+    
+    Each chunk reads its students (and their BroSis) once, then unassigns the
+    eligible ones with one UPDATE that repeats the rules in its WHERE clause,
+    committed together with an audit entry. Non-root callers can only
+    unassign students in their own area.
+    
+    Args:
+        student_ids (list): IDs of the students to unassign
+        principal: Current user (Principal)
+        ip_address (str): Client address for the audit log
+        user_agent (str): Client user agent for the audit log
+        operation (BulkOperation): Record that receives the progress, if any
+        
+    Returns:
+        dict: success ({id, studentId, fullName, previousBroSis}) and failed ({id, reason}) lists
+    """
+    results = {"success": [], "failed": []}
+    target_ids = _distinct_student_ids(student_ids, results)
+    
+    rules = [Student.matched == True, Student.user_id.isnot(None)]
+    if principal.role != 'root':
+        rules.append(Student.area == principal.area)
+        
+    def unassign_chunk(chunk):
+        rows = {
+            row.id: row for row in db.session.execute(
+                select(
+                    Student.id, Student.student_id, Student.full_name, Student.area,
+                    Student.matched, Student.user_id, User.username
+                )
+                .outerjoin(User, User.id == Student.user_id)
+                .where(Student.id.in_(chunk))
+            )
+        }
+        
+        failed = []
+        eligible = []
+        for student_id in chunk:
+            row = rows.get(student_id)
+            if row is None:
+                reason = "Student not found"
+            elif not row.matched or not row.user_id:
+                reason = "Student is not assigned to any BroSis"
+            elif principal.role != 'root' and row.area != principal.area:
+                reason = "You can only unassign students in your area"
+            else:
+                eligible.append(student_id)
+                continue
+            failed.append({"id": student_id, "reason": reason})
+            
+        unassigned = set()
+        if eligible:
+            unassigned = set(db.session.execute(
+                update(Student)
+                .where(Student.id.in_(eligible), *rules)
+                .values(user_id=None, matched=False)
+                .returning(Student.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            
+        success = [
+            {
+                "id": student_id,
+                "studentId": rows[student_id].student_id,
+                "fullName": rows[student_id].full_name,
+                "previousBroSis": rows[student_id].username or "unknown"
+            }
+            for student_id in eligible if student_id in unassigned
+        ]
+        failed += [
+            {"id": student_id, "reason": "Student changed during the operation"}
+            for student_id in eligible if student_id not in unassigned
+        ]
+        
+        if success:
+            AuditLog.add(
+                user_id=principal.id,
+                action='unassign_students_from_brosis',
+                details=f"Unassigned {len(success)} students",
+                ip_address=ip_address,
+                user_agent=user_agent,
+                target_type='student',
+                target_ids=[item['id'] for item in success],
+                counts={'success': len(success), 'failed': len(failed)}
+            )
+            
+        results["success"] += success
+        results["failed"] += failed
+        return {'success': len(success), 'failed': len(failed)}
+        
+    run_in_chunks(
+        target_ids, unassign_chunk, operation=operation,
+        on_error=lambda chunk, error: _discard_chunk_results(results, chunk, error)
+    )
+    return results
+
+
 def toggle_student_status(student_id):
     """
     Toggle a student's status between active and inactive
@@ -364,6 +931,225 @@ def map_student_to_user(student_id, user_id):
         return None, f"Error mapping student to user: {str(e)}"
 
 
+# Columns of a BroSis mapping file (one student per row, paired with a BroSis username)
+MAPPING_COLUMNS = ['studentId', 'brosisUsername']
+
+# Values per IN (...) lookup and rows per UPDATE ... FROM (VALUES ...) statement
+MAPPING_CHUNK_SIZE = 1000
+
+
+def _mapping_error(student, brosis, admin_area):
+    """Why a student cannot be assigned to a BroSis, or None (same rules as the assign endpoint)"""
+    if admin_area and student.area != admin_area:
+        return "Student is not in your area"
+    if brosis.role != 'brosis':
+        return f"User '{brosis.username}' is not a BroSis"
+    if brosis.status != 'active':
+        return f"BroSis '{brosis.username}' is not active"
+    if student.area != brosis.area:
+        return "Student not in the same area as BroSis"
+    if brosis.house and student.house and student.house != brosis.house:
+        return "Student not in the same house as BroSis"
+    return None
+
+
+def _apply_brosis_mapping(rows):
+    """
+    Assign students to BroSis users (no commit)
+    
+    On PostgreSQL the mapping is joined in as a VALUES list and the role,
+    status, area and house rules are repeated in the WHERE clause, so a row
+    only changes if it is still valid at write time.
+    
+    Args:
+        rows (list): Dicts with student_pk, user_id, house, house_id and area_id
+        
+    Returns:
+        set: IDs of the students that were assigned
+    """
+    if db.engine.dialect.name != 'postgresql':
+        # No VALUES column aliases elsewhere (SQLite): executemany UPDATE by primary key
+        db.session.execute(update(Student), [
+            {key: value for key, value in {
+                'id': row['student_pk'],
+                'user_id': row['user_id'],
+                'matched': True,
+                'house': row['house'],
+                'house_id': row['house_id'],
+                'area_id': row['area_id']
+            }.items() if value is not None}
+            for row in rows
+        ])
+        return {row['student_pk'] for row in rows}
+        
+    mapping = sql_values(
+        sql_column('student_pk', db.Integer),
+        sql_column('user_id', db.Integer),
+        sql_column('house', db.String(100)),
+        sql_column('house_id', db.Integer),
+        sql_column('area_id', db.Integer),
+        name='mapping'
+    ).data([(row['student_pk'], row['user_id'], row['house'], row['house_id'], row['area_id']) for row in rows])
+    
+    return set(db.session.execute(
+        update(Student)
+        .where(
+            Student.id == mapping.c.student_pk,
+            User.id == mapping.c.user_id,
+            User.role == 'brosis',
+            User.status == 'active',
+            Student.area.is_not_distinct_from(User.area),
+            or_(func.coalesce(User.house, '') == '', func.coalesce(Student.house, '') == '', Student.house == User.house)
+        )
+        .values(
+            user_id=mapping.c.user_id,
+            matched=True,
+            # Like map_student_to_user, the student takes the BroSis's house (and the area/house ids)
+            house=func.coalesce(cast(mapping.c.house, db.String(100)), Student.house),
+            house_id=func.coalesce(cast(mapping.c.house_id, db.Integer), Student.house_id),
+            area_id=func.coalesce(cast(mapping.c.area_id, db.Integer), Student.area_id)
+        )
+        .returning(Student.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+
+
+def import_brosis_mapping(file_data, admin_area=None, dry_run=False, current_user_id=None, ip_address=None, user_agent=None):
+    """
+    Assign students to BroSis users from a mapping file (studentId -> brosisUsername)
+    
+    Student IDs are resolved with one batched lookup, usernames with one batched
+    join that also resolves each BroSis's area and house IDs (instead of the
+    per-call name lookups in map_student_to_user). Every valid row is then
+    applied with set-based UPDATE statements in a single transaction.
+    
+    Args:
+        file_data (list): Parsed rows with studentId and brosisUsername
+        admin_area (str): Area the caller is limited to (None for root)
+        dry_run (bool): Validate and report without writing anything
+        current_user_id (int): User performing the import (for the audit log)
+        ip_address (str): Client address for the audit log
+        user_agent (str): Client user agent for the audit log
+        
+    Returns:
+        tuple: (summary dict, list of row errors)
+    """
+    errors = []
+    pairs = []
+    seen = set()
+    
+    for idx, row in enumerate(file_data, start=2):  # Start from 2 to account for header row in Excel
+        code = _normalize_import_value(row.get('studentId'))
+        username = _normalize_import_value(row.get('brosisUsername'))
+        missing_fields = [field for field, value in zip(MAPPING_COLUMNS, (code, username)) if not value]
+        
+        if missing_fields:
+            errors.append({"row": idx, "error": f"Missing required fields: {', '.join(missing_fields)}"})
+            continue
+            
+        if code in seen:
+            errors.append({"row": idx, "studentId": code, "error": f"Duplicate student ID '{code}' in mapping data"})
+            continue
+            
+        seen.add(code)
+        pairs.append((idx, code, username))
+        
+    # Batched lookup 1: students by student ID
+    students = {}
+    codes = [code for _, code, _ in pairs]
+    for start in range(0, len(codes), MAPPING_CHUNK_SIZE):
+        for student in db.session.execute(
+            select(Student.id, Student.student_id, Student.area, Student.house, Student.user_id, Student.matched)
+            .where(Student.student_id.in_(codes[start:start + MAPPING_CHUNK_SIZE]))
+        ):
+            students[student.student_id] = student
+            
+    # Batched lookup 2: users by username, joined to the ids of their area and house
+    users = {}
+    usernames = list({username.lower() for _, _, username in pairs})
+    for start in range(0, len(usernames), MAPPING_CHUNK_SIZE):
+        for user in db.session.execute(
+            select(
+                User.id, User.username, User.role, User.status, User.area, User.house,
+                Area.id.label('area_id'), House.id.label('house_id')
+            )
+            .outerjoin(Area, Area.name == User.area)
+            .outerjoin(House, and_(House.name == User.house, House.area_id == Area.id))
+            .where(func.lower(User.username).in_(usernames[start:start + MAPPING_CHUNK_SIZE]))
+        ):
+            users[user.username.lower()] = user
+            
+    unchanged = 0
+    valid = []
+    for idx, code, username in pairs:
+        student = students.get(code)
+        brosis = users.get(username.lower())
+        if student is None:
+            errors.append({"row": idx, "studentId": code, "error": f"Student with ID '{code}' not found"})
+            continue
+        if brosis is None:
+            errors.append({"row": idx, "studentId": code, "error": f"User '{username}' not found"})
+            continue
+            
+        error = _mapping_error(student, brosis, admin_area)
+        if error:
+            errors.append({"row": idx, "studentId": code, "error": error})
+            continue
+            
+        if student.matched and student.user_id == brosis.id:
+            unchanged += 1
+            continue
+            
+        valid.append((idx, code, {
+            'student_pk': student.id,
+            'user_id': brosis.id,
+            'house': brosis.house or None,
+            'house_id': brosis.house_id,
+            'area_id': brosis.area_id
+        }))
+        
+    summary = {
+        "total": len(file_data),
+        "assigned": 0 if dry_run else len(valid),
+        "wouldAssign": len(valid) if dry_run else 0,
+        "unchanged": unchanged,
+        "failed": len(errors),
+        "dryRun": dry_run
+    }
+    if dry_run or not valid:
+        return summary, sorted(errors, key=lambda error: error['row'])
+        
+    try:
+        assigned = set()
+        for start in range(0, len(valid), MAPPING_CHUNK_SIZE):
+            assigned |= _apply_brosis_mapping([row for _, _, row in valid[start:start + MAPPING_CHUNK_SIZE]])
+            
+        # Rows that stopped matching the rules between validation and the UPDATE
+        for idx, code, row in valid:
+            if row['student_pk'] not in assigned:
+                errors.append({"row": idx, "studentId": code, "error": "Student or BroSis changed during the import; not assigned"})
+                
+        AuditLog.add(
+            user_id=current_user_id,
+            action='import_brosis_mapping',
+            details=f"Assigned {len(assigned)} students to BroSis from a mapping file, {len(errors)} rows failed",
+            ip_address=ip_address,
+            user_agent=user_agent,
+            target_type='student',
+            target_ids=sorted(assigned),
+            counts={'success': len(assigned), 'unchanged': unchanged, 'failed': len(errors)}
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error applying BroSis mapping: {str(e)}")
+        summary.update({"assigned": 0, "failed": len(file_data) - unchanged, "error": str(e)})
+        return summary, sorted(errors, key=lambda error: error['row'])
+        
+    summary.update({"assigned": len(assigned), "failed": len(errors)})
+    return summary, sorted(errors, key=lambda error: error['row'])
+
+
 def unmap_student(student_id):
     """
     Unmaps a student from their mentor/brosis user while preserving 
@@ -521,7 +1307,58 @@ def distribute_students_to_houses(students, area):
     return student_house_mapping
 
 
-def import_students_from_file(file_data, admin_area=None):
+def assign_students_to_brosis(students, area):
+    """
+    Assigns new students to the least-loaded active BroSis in their house.
+    Loads are read with one grouped count and kept in per-house heaps, so the
+    assignment reuses the house mapping already applied to the students.
+    
+    Args:
+        students: List of Student objects (house already set) in the given area
+        area: Area name the students belong to
+        
+    Returns:
+        Dictionary mapping each assigned student to its BroSis user ID
+    """
+    if not students or not area:
+        return {}
+    
+    brosis_users = db.session.query(User.id, User.house).filter(
+        func.lower(User.role) == 'brosis',
+        User.status == 'active',
+        User.area == area,
+        User.house.isnot(None)
+    ).all()
+    if not brosis_users:
+        current_app.logger.warning(f"No active brosis users found for area: {area}")
+        return {}
+    
+    # Current load of every candidate in a single grouped query
+    brosis_ids = [brosis.id for brosis in brosis_users]
+    loads = dict(
+        db.session.query(Student.user_id, func.count(Student.id))
+        .filter(Student.user_id.in_(brosis_ids))
+        .group_by(Student.user_id)
+        .all()
+    )
+    
+    house_heaps = defaultdict(list)
+    for brosis in brosis_users:
+        heapq.heappush(house_heaps[brosis.house], (loads.get(brosis.id, 0), brosis.id))
+    
+    student_brosis_mapping = {}
+    for student in students:
+        heap = house_heaps.get(student.house)
+        if not heap:
+            continue
+        load, brosis_id = heapq.heappop(heap)
+        student_brosis_mapping[student] = brosis_id
+        heapq.heappush(heap, (load + 1, brosis_id))
+    
+    return student_brosis_mapping
+
+
+def import_students_from_file(file_data, admin_area=None, assign_brosis=False, commit=True):
 
     try:
         imported_students = []
@@ -607,7 +1444,6 @@ def import_students_from_file(file_data, admin_area=None):
                         area_records[area].append((idx, row))
                     else:
                         # If no area, can't distribute to houses, so add directly
-                        db.session.add(new_student)
                         batch_students.append(new_student)
                     
                 except Exception as e:
@@ -616,21 +1452,24 @@ def import_students_from_file(file_data, admin_area=None):
                         "error": f"Error processing row: {str(e)}"
                     })
             
-            # Process students with no area
+            # Process students with no area (savepoints: a failure only undoes these rows,
+            # not students flushed earlier in the same transaction)
             try:
                 # Add students without area to database
                 if batch_students:
-                    db.session.flush()
+                    with db.session.begin_nested():
+                        db.session.add_all(batch_students)
+                        db.session.flush()
                     imported_students.extend(batch_students)
             except Exception as e:
-                db.session.rollback()
                 # Handle error for students without area
                 current_app.logger.error(f"Error adding students without area: {str(e)}")
                 for student in batch_students:
                     try:
                         # Try adding one by one
-                        db.session.add(student)
-                        db.session.flush()
+                        with db.session.begin_nested():
+                            db.session.add(student)
+                            db.session.flush()
                         imported_students.append(student)
                     except Exception as inner_e:
                         errors.append({
@@ -647,13 +1486,22 @@ def import_students_from_file(file_data, admin_area=None):
             for student in students:
                 if student in student_house_mapping:
                     student.house = student_house_mapping[student]
+            
+            # Optionally assign BroSis in the same transaction
+            student_brosis_mapping = assign_students_to_brosis(students, area) if assign_brosis else {}
+            
+            for student in students:
+                if student in student_brosis_mapping:
+                    student.user_id = student_brosis_mapping[student]
+                    student.matched = True
                 
                 try:
-                    db.session.add(student)
-                    db.session.flush()  # Check for database errors
+                    # Savepoint per student: a failure only undoes this student
+                    with db.session.begin_nested():
+                        db.session.add(student)
+                        db.session.flush()  # Check for database errors
                     imported_students.append(student)
                 except Exception as e:
-                    db.session.rollback()
                     # Find the corresponding record
                     idx = next((rec[0] for rec in area_records[area] if rec[1]['studentId'] == student.student_id), "Unknown")
                     errors.append({
@@ -661,8 +1509,8 @@ def import_students_from_file(file_data, admin_area=None):
                         "error": f"Error adding student to database: {str(e)}"
                     })
         
-        # Commit all changes if there are successful imports
-        if imported_students:
+        # Commit all changes if there are successful imports (the upsert commits them with its updates)
+        if imported_students and commit:
             db.session.commit()
         
         # Generate summary stats
@@ -671,8 +1519,12 @@ def import_students_from_file(file_data, admin_area=None):
             "successful_imports": len(imported_students),
             "failed_imports": len(errors),
             "area_inherited": admin_area is not None,
-            "auto_house_distribution": True  # Indicate house distribution was applied
+            "auto_house_distribution": True,  # Indicate house distribution was applied
+            "auto_brosis_assignment": assign_brosis
         }
+        if assign_brosis:
+            summary["assigned_to_brosis"] = sum(1 for s in imported_students if s.user_id)
+            summary["unassigned"] = len(imported_students) - summary["assigned_to_brosis"]
         
         return imported_students, errors, summary
         
@@ -687,6 +1539,212 @@ def import_students_from_file(file_data, admin_area=None):
         }
 
 
+# Import columns that an upsert compares and updates (import key -> Student attribute).
+# Area/house are managed by house distribution and are not overwritten by an upsert.
+UPSERT_FIELDS = {
+    'fullName': 'full_name',
+    'email': 'email',
+    'phone': 'phone',
+    'parentPhone': 'parent_phone',
+    'address': 'address',
+    'notes': 'notes'
+}
+UPSERT_CHUNK_SIZE = 500
+
+
+def _normalize_import_value(value):
+    """Normalize a cell value so incoming rows and stored rows hash the same way"""
+    if value is None or (isinstance(value, float) and value != value):  # None or NaN
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _row_fingerprint(values):
+    """Hash a sequence of normalized values"""
+    payload = '\x1f'.join('' if value is None else value for value in values)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def upsert_students_from_file(file_data, admin_area=None, deactivate_missing=False, dry_run=False, assign_brosis=False):
+    """
+    Apply a re-exported roster as a diff against the stored students
+    
+    Each incoming row is hashed over UPSERT_FIELDS and compared with the hash of the
+    stored row with the same studentId. New students go through the normal import
+    path (including house distribution), changed students are updated in bulk by
+    primary key and unchanged students are left alone. With admin_area, stored
+    students of other areas are reported as errors and never updated. Inserts,
+    updates and deactivations are committed in one transaction.
+    
+    deactivate_missing only touches the admin's area, or for root (no admin_area)
+    the areas named in the file (its area column and the stored area of the
+    students it lists). A student whose row is in the file counts as present even
+    if the row fails validation.
+    
+    Args:
+        file_data (list): Parsed rows (same format as import_students_from_file)
+        admin_area (str): Area forced on new students and used as the scope for deactivation
+        deactivate_missing (bool): Mark students in scope (see above) that are absent from the file inactive
+        dry_run (bool): Compute the diff without writing anything
+        assign_brosis (bool): Assign new students to the least-loaded BroSis in their house
+        
+    Returns:
+        tuple: (diff summary dict, errors list)
+    """
+    errors = []
+    incoming = {}
+    
+    try:
+        # Every student listed in the file, valid row or not: only these are kept active
+        present_ids = set()
+        file_areas = set()
+        for row in file_data:
+            student_id = _normalize_import_value(row.get('studentId'))
+            if student_id:
+                present_ids.add(student_id)
+            area = _normalize_import_value(row.get('area'))
+            if area:
+                file_areas.add(area)
+        
+        # Validate rows and drop duplicates within the file
+        for idx, row in enumerate(file_data, start=2):
+            required_fields = ['studentId', 'fullName', 'email', 'phone', 'parentPhone', 'address']
+            missing_fields = [field for field in required_fields if field not in row or not row[field]]
+            
+            if missing_fields:
+                errors.append({
+                    "row": idx,
+                    "error": f"Missing required fields: {', '.join(missing_fields)}"
+                })
+                continue
+            
+            student_id = str(row['studentId']).strip()
+            if student_id in incoming:
+                errors.append({
+                    "row": idx,
+                    "error": f"Duplicate student ID '{student_id}' in import data"
+                })
+                continue
+            
+            incoming[student_id] = (idx, row)
+        
+        # Load only the stored rows that the file refers to, in chunks
+        columns = [Student.id, Student.student_id, Student.area] + [getattr(Student, attr) for attr in UPSERT_FIELDS.values()]
+        stored = {}
+        student_ids = list(present_ids | set(incoming))
+        for start in range(0, len(student_ids), UPSERT_CHUNK_SIZE):
+            chunk = student_ids[start:start + UPSERT_CHUNK_SIZE]
+            for record in db.session.query(*columns).filter(Student.student_id.in_(chunk)).all():
+                stored[record.student_id] = record
+        
+        new_rows = []
+        updates = []
+        changed = []
+        unchanged_count = 0
+        
+        for student_id, (idx, row) in incoming.items():
+            record = stored.get(student_id)
+            if record is None:
+                new_rows.append(row)
+                continue
+            
+            # Area admins can only update students of their own area
+            if admin_area and record.area != admin_area:
+                errors.append({
+                    "row": idx,
+                    "error": f"Student with ID '{student_id}' belongs to another area"
+                })
+                continue
+            
+            # Only compare the columns present in the file
+            keys = [key for key in UPSERT_FIELDS if key in row]
+            incoming_values = [_normalize_import_value(row[key]) for key in keys]
+            stored_values = [_normalize_import_value(getattr(record, UPSERT_FIELDS[key])) for key in keys]
+            
+            if _row_fingerprint(incoming_values) == _row_fingerprint(stored_values):
+                unchanged_count += 1
+                continue
+            
+            changed_fields = [key for key, new, old in zip(keys, incoming_values, stored_values) if new != old]
+            update_row = {'id': record.id}
+            for key in changed_fields:
+                update_row[UPSERT_FIELDS[key]] = incoming_values[keys.index(key)]
+            updates.append(update_row)
+            changed.append({"studentId": student_id, "row": idx, "fields": changed_fields})
+        
+        # Students in scope that no longer appear in the file
+        missing_ids = []
+        if deactivate_missing:
+            scope_areas = {admin_area} if admin_area else file_areas | {
+                record.area for record in stored.values() if record.area
+            }
+            if scope_areas:
+                scope_query = db.session.query(Student.id, Student.student_id).filter(
+                    or_(Student.status.is_(None), Student.status != 'inactive'),
+                    Student.area.in_(scope_areas)
+                )
+                missing_ids = [id for id, sid in scope_query.all() if sid not in present_ids]
+        
+        inserted_count = 0
+        if not dry_run:
+            # New students use the regular import path (house distribution, pending status)
+            if new_rows:
+                imported_students, insert_errors, insert_summary = import_students_from_file(
+                    new_rows, admin_area=admin_area, assign_brosis=assign_brosis, commit=False
+                )
+                if 'error' in insert_summary:
+                    raise RuntimeError(insert_summary['error'])
+                inserted_count = len(imported_students)
+                errors.extend(insert_errors)
+            
+            # Changed students: bulk UPDATE by primary key (still limited to the admin's area)
+            update_statement = update(Student).execution_options(synchronize_session=None)
+            if admin_area:
+                update_statement = update_statement.where(Student.area == admin_area)
+            for start in range(0, len(updates), UPSERT_CHUNK_SIZE):
+                db.session.execute(update_statement, updates[start:start + UPSERT_CHUNK_SIZE])
+            
+            for start in range(0, len(missing_ids), UPSERT_CHUNK_SIZE):
+                chunk = missing_ids[start:start + UPSERT_CHUNK_SIZE]
+                db.session.execute(
+                    update(Student).where(Student.id.in_(chunk)).values(status='inactive')
+                )
+            
+            # One transaction for inserts, updates and deactivations
+            if inserted_count or updates or missing_ids:
+                db.session.commit()
+        
+        summary = {
+            "mode": "upsert",
+            "dry_run": dry_run,
+            "total_rows": len(file_data),
+            "inserted": len(new_rows) if dry_run else inserted_count,
+            "updated": len(updates),
+            "unchanged": unchanged_count,
+            "deactivated": len(missing_ids),
+            "failed": len(errors),
+            "changes": changed[:100]  # Keep the response compact for large rosters
+        }
+        
+        return summary, errors
+    
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error upserting students: {str(e)}")
+        return {
+            "mode": "upsert",
+            "dry_run": dry_run,
+            "total_rows": len(file_data),
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "deactivated": 0,
+            "failed": len(errors) + 1,
+            "error": str(e)
+        }, errors + [{"row": "N/A", "error": f"Error importing file: {str(e)}"}]
+
+
 def get_all_student_ids(filters=None):
     """
     Get all student IDs matching the given filters without pagination.
@@ -699,48 +1757,9 @@ def get_all_student_ids(filters=None):
         list: List of student IDs matching the filters
     """
     try:
-        # Start with base query that only selects the ID column for efficiency
-        query = Student.query.with_entities(Student.id)
-        
-        # Apply the same filters as in get_all_students
+        # Select only the ID column, with the same filters as get_all_students
+        query = apply_student_filters(db.session.query(Student.id), filters)
         if filters:
-            # Search filter
-            if 'search' in filters and filters['search']:
-                search_term = f"%{filters['search'].strip()}%"
-                query = query.filter(
-                    or_(
-                        Student.full_name.ilike(search_term),
-                        Student.email.ilike(search_term),
-                        Student.student_id.ilike(search_term)
-                    )
-                )
-            
-            # Status filter
-            if 'status' in filters and filters['status']:
-                query = query.filter(Student.status == filters['status'])
-                
-            # Area filter
-            if 'area' in filters and filters['area']:
-                query = query.filter(Student.area == filters['area'])
-                
-            # House filter
-            if 'house' in filters and filters['house']:
-                query = query.filter(Student.house == filters['house'])
-                
-            # Matched filter
-            if 'matched' in filters and filters['matched']:
-                matched_value = filters['matched'].lower() == 'true'
-                query = query.filter(Student.matched == matched_value)
-            
-            # Brosis filter - find students assigned to brosis with the given name
-            if 'brosisFilter' in filters and filters['brosisFilter']:
-                brosis_term = f"%{filters['brosisFilter'].strip()}%"
-                # ILIKE supports Unicode characters including Vietnamese with diacritics
-                logger.info(f"Applying brosis filter to student IDs with term: '{filters['brosisFilter']}'")
-                # Use outerjoin instead of join to ensure we don't lose students in the query
-                query = query.outerjoin(User, Student.user_id == User.id)
-                query = query.filter(User.full_name.ilike(brosis_term))
-            
             logger.info(f"Applied student ID filters: {filters}")
         
         # Execute query and extract IDs
@@ -1,11 +1,17 @@
 from app.models.models import db, User, AuditLog
-from flask import request
+from app.services.auth import get_principal
+from app.utils.password import ARGON2ID, hash_passwords, hashing_throughput
+from flask import current_app, request
 import pandas as pd
 import io
 import logging
 import traceback
 import time
 import random
+from sqlalchemy import func
+
+# Maximum number of values per IN (...) list when checking import candidates for duplicates
+DUPLICATE_LOOKUP_CHUNK_SIZE = 500
 
 def get_all_users(page=None, per_page=None, filters=None):
     """
@@ -75,7 +81,7 @@ def get_all_users(page=None, per_page=None, filters=None):
 
 def create_new_user(username, email, password=None, fullName=None, phone=None, 
                 area=None, house=None, role='brosis', status='active',
-                student_id=None, current_user_id=None, hash_type="sha256"):
+                student_id=None, current_user_id=None):
     """
     Create a new user
     
@@ -116,10 +122,6 @@ def create_new_user(username, email, password=None, fullName=None, phone=None,
     if normalized_role not in ['root', 'admin', 'mentor', 'brosis']:
         normalized_role = 'brosis'  # Default to brosis if invalid role
     
-    if normalized_role == 'root':
-        # Root users should use argon2id for enhanced security
-        hash_type = "argon2id"
-        
     # For admin users, set default house to "FPT + Area" if area is provided but house is not
     if normalized_role == 'admin' and area and not house:
         house = f"FPT {area}"
@@ -142,7 +144,7 @@ def create_new_user(username, email, password=None, fullName=None, phone=None,
     if password is None:
         password = username
         
-    new_user.set_password(password, hash_type=hash_type)
+    new_user.set_password(password)
     
     db.session.add(new_user)
     db.session.commit()
@@ -157,7 +159,9 @@ def create_new_user(username, email, password=None, fullName=None, phone=None,
             action='create_user',
             details=f"Created new user: {username} (role: {role})",
             ip_address=ip,
-            user_agent=user_agent
+            user_agent=user_agent,
+            target_type='user',
+            target_ids=[new_user.id]
         )
     
     return new_user, None
@@ -171,7 +175,7 @@ def update_user(user_id, current_user_id, **kwargs):
         return None, "User not found"
     
     # Get the current user to check their role
-    current_user = User.query.get(current_user_id)
+    current_user = get_principal(current_user_id)
     if not current_user:
         return None, "Current user not found"
     
@@ -195,8 +199,7 @@ def update_user(user_id, current_user_id, **kwargs):
     for key, value in kwargs.items():
         if key == 'password' and value:
             # Special handling for password
-            hash_type = "argon2id" if user.role == 'root' else "sha256"
-            user.set_password(value, hash_type=hash_type)
+            user.set_password(value)
         elif key == 'role':
             # Special handling for role
             if value == 'root' and user.role != 'root':
@@ -256,8 +259,7 @@ def update_user(user_id, current_user_id, **kwargs):
                 
                 # Create an audit log entry for this mass unassignment
                 try:
-                    from app.models.audit import AuditLog
-                    from flask import request, has_request_context
+                    from flask import has_request_context
                     
                     # Check if we're in a request context to avoid errors
                     if has_request_context():
@@ -272,7 +274,11 @@ def update_user(user_id, current_user_id, **kwargs):
                         action='auto_unassign_students',
                         details=f"Auto-unassigned {unassigned_count} students from BroSis {user.username} due to: {unassignment_reason}",
                         ip_address=ip,
-                        user_agent=user_agent
+                        user_agent=user_agent,
+                        target_type='student',
+                        target_ids=[student.id for student in students],
+                        counts={'unassigned': unassigned_count},
+                        filters={'brosis_user_id': user.id}
                     )
                 except Exception as audit_error:
                     print(f"Warning: Could not create audit log for auto-unassignment: {str(audit_error)}")
@@ -294,7 +300,9 @@ def update_user(user_id, current_user_id, **kwargs):
         action='update_user',
         details=f"Updated user: {user.username} (ID: {user_id})",
         ip_address=ip,
-        user_agent=user_agent
+        user_agent=user_agent,
+        target_type='user',
+        target_ids=[user_id]
     )
     
     return user, None
@@ -332,7 +340,9 @@ def delete_user(user_id, current_user_id):
         action='delete_user',
         details=f"Deleted user: {username} (ID: {user_id})",
         ip_address=ip,
-        user_agent=user_agent
+        user_agent=user_agent,
+        target_type='user',
+        target_ids=[user_id]
     )
     
     return True, None
@@ -354,7 +364,7 @@ def toggle_user_status(user_id, current_user_id):
             return None, "User not found"
             
         # Only root can change root user's status
-        current_user = User.query.get(current_user_id)
+        current_user = get_principal(current_user_id)
         if not current_user:
             logger.error(f"Current user not found: {current_user_id}")
             return None, "Current user not found"
@@ -381,7 +391,9 @@ def toggle_user_status(user_id, current_user_id):
             action='toggle_user_status',
             details=f"Changed {user.username}'s status to {new_status} (ID: {user_id})",
             ip_address=ip,
-            user_agent=user_agent
+            user_agent=user_agent,
+            target_type='user',
+            target_ids=[user_id]
         )
         logger.info(f"Audit log created for user status change")
         
@@ -400,7 +412,7 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
     For other roles: username is required
     
     Parameters:
-    - file_data: Binary content of the Excel file
+    - file_data: Binary content of the Excel file, or a path to a spooled upload on disk
     - current_user_id: ID of the user performing the import
     - auto_generate_username: Whether to auto-generate usernames for users with role=brosis
     - username_not_required: Whether username is not required for students (brosis role)
@@ -409,10 +421,13 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
     Returns: dict with success count, error count, and details of errors
     """
     logger = logging.getLogger(__name__)
+    import_started = time.perf_counter()
     
     try:
         # Parse Excel file - optimized using engine='openpyxl'
-        df = pd.read_excel(io.BytesIO(file_data), engine='openpyxl')
+        # Spooled uploads are passed as a path and read straight from disk
+        source = io.BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data
+        df = pd.read_excel(source, engine='openpyxl')
         
         # Check required columns
         required_columns = ['email', 'fullName']
@@ -465,14 +480,11 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                 houses_dict[area_name_lower].append(house_name_lower)
                 houses_orig[area_name_lower][house_name_lower] = house.name
         
-        # Cache existing usernames and emails for fast duplicate checking (one-time query)
-        existing_usernames = {user.username.lower(): user.username for user in User.query.all()}
-        existing_emails = {user.email.lower(): user.email for user in User.query.all()}
-        
         # Process users in batches to optimize memory usage and database performance
         BATCH_SIZE = 100  # Process 100 users at a time
         
         # First validate all data to catch errors before any database changes
+        candidate_users = []
         valid_users = []
         
         # Extract and validate all users first (only validation, no DB operations yet)
@@ -545,17 +557,6 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                 if missing_fields:
                     raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
                 
-                # Check username and email duplicates (fast in-memory check)
-                if user_data['username'].lower() in existing_usernames:
-                    raise ValueError(f"Username '{user_data['username']}' already exists")
-                
-                if user_data['email'].lower() in existing_emails:
-                    raise ValueError(f"Email '{user_data['email']}' already exists")
-                
-                # Add to "taken" list to prevent duplicates within the import file itself
-                existing_usernames[user_data['username'].lower()] = user_data['username']
-                existing_emails[user_data['email'].lower()] = user_data['email']
-                
                 # Check if 'brosis' role requires student_id
                 if user_data['role'] == 'brosis' and (not user_data['student_id'] or user_data['student_id'].strip() == ''):
                     raise ValueError("Student ID is required for BroSis users")
@@ -582,8 +583,8 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                             # Use original capitalization for house in final data
                             user_data['house'] = houses_orig[area_lower][house_lower]
                 
-                # If validation passes, add to valid users
-                valid_users.append(user_data)
+                # If validation passes, keep as a candidate for the duplicate check
+                candidate_users.append(user_data)
                 
             except Exception as e:
                 error_count += 1
@@ -595,12 +596,49 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                 })
                 logger.warning(f"Error validating user at row {index + 2}: {str(e)}")
         
+        # Check username and email duplicates against only the candidates from the file
+        # (batched lower(...) IN (...) lookups instead of loading the whole user table)
+        existing_usernames = find_existing_values(User.username, [u['username'] for u in candidate_users])
+        existing_emails = find_existing_values(User.email, [u['email'] for u in candidate_users])
+        
+        for user_data in candidate_users:
+            try:
+                if user_data['username'].lower() in existing_usernames:
+                    raise ValueError(f"Username '{user_data['username']}' already exists")
+                
+                if user_data['email'].lower() in existing_emails:
+                    raise ValueError(f"Email '{user_data['email']}' already exists")
+                
+                # Add to "taken" list to prevent duplicates within the import file itself
+                existing_usernames[user_data['username'].lower()] = user_data['username']
+                existing_emails[user_data['email'].lower()] = user_data['email']
+                
+                valid_users.append(user_data)
+                
+            except ValueError as e:
+                error_count += 1
+                error_details.append({
+                    "row": user_data['row_number'],
+                    "username": user_data['username'],
+                    "email": user_data['email'],
+                    "error": str(e)
+                })
+                logger.warning(f"Error validating user at row {user_data['row_number']}: {str(e)}")
+        
         # Process the valid users in batches
         total_users = len(valid_users)
         total_batches = (total_users + BATCH_SIZE - 1) // BATCH_SIZE  # Ceiling division
         
         logger.info(f"Found {total_users} valid users to import in {total_batches} batches")
         
+        # Hash every initial password (same as username) up front on the password hash pool
+        hash_started = time.perf_counter()
+        password_hashes = hash_passwords([u['username'] for u in valid_users], current_app.config['PASSWORD_HASH_WORKERS'])
+        hash_seconds = time.perf_counter() - hash_started
+        for user_data, password_hash in zip(valid_users, password_hashes):
+            user_data['password_hash'] = password_hash
+        logger.info(f"Hashed {total_users} passwords in {hash_seconds:.2f}s")
+        
         for batch_num in range(total_batches):
             start_idx = batch_num * BATCH_SIZE
             end_idx = min(start_idx + BATCH_SIZE, total_users)
@@ -633,12 +671,12 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                         role=user_data['role'],
                         status=user_data['status'],
                         student_id=user_data['student_id'] if user_data['role'] == 'brosis' else None,
-                        password_change_required=True
+                        password_change_required=True,
+                        # Password (same as username), hashed above
+                        password_hash=user_data['password_hash'],
+                        hash_type=ARGON2ID
                     )
                     
-                    # Set password (same as username)
-                    new_user.set_password(user_data['username'], hash_type="sha256")
-                    
                     # Add to batch
                     new_users.append(new_user)
                     
@@ -668,7 +706,9 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
                         action='batch_create_users',
                         details=f"Batch imported {len(new_users)} users (batch {batch_num + 1}/{total_batches})",
                         ip_address=ip,
-                        user_agent=user_agent
+                        user_agent=user_agent,
+                        target_type='user',
+                        counts={'created': len(new_users), 'batch': batch_num + 1, 'total_batches': total_batches}
                     )
                     
                 except Exception as e:
@@ -690,7 +730,8 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
             "success": success_count,
             "error": error_count,
             "message": f"Imported {success_count} users successfully, {error_count} failed",
-            "details": error_details
+            "details": error_details,
+            "throughput": hashing_throughput(total_users, hash_seconds, time.perf_counter() - import_started)
         }
         
     except Exception as e:
@@ -703,6 +744,27 @@ def bulk_import_users(file_data, current_user_id, auto_generate_username=False,
             "details": []
         }
 
+def find_existing_values(column, values, chunk_size=DUPLICATE_LOOKUP_CHUNK_SIZE):
+    """
+    Find which of the given values already exist in a User column (case-insensitive)
+    
+    Runs batched lower(column) IN (...) queries backed by the functional indexes on
+    user.username / user.email, so the cost scales with the number of candidates
+    instead of the size of the user table.
+    
+    Returns: dict mapping the lowercase value to the value stored in the database
+    """
+    candidates = list({value.lower() for value in values if value})
+    existing = {}
+    
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        rows = db.session.query(column).filter(func.lower(column).in_(chunk)).all()
+        for (value,) in rows:
+            existing[value.lower()] = value
+    
+    return existing
+
 def generate_username_from_fullname_and_student_id(fullName, student_id):
 
     if not fullName or not student_id:
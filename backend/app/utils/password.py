@@ -0,0 +1,219 @@
+"""
+Password hashing
+
+Every password is hashed with one shared argon2id PasswordHasher whose cost
+parameters come from the PASSWORD_HASH_* settings. Accounts created before
+argon2id became the default still carry salted SHA-256 hashes
+("<hex digest>:<hex salt>"); those keep verifying, and needs_rehash() flags
+them so the login path can upgrade them to argon2id.
+
+Bulk paths (password resets, user imports) hash through hash_passwords(),
+which fans the memory-hard work out to a bounded process pool.
+"""
+import hashlib
+import hmac
+import math
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import argon2
+
+ARGON2ID = 'argon2id'
+LEGACY_SHA256 = 'sha256'
+
+# Defaults match the parameters the root account has always been hashed with
+DEFAULT_TIME_COST = 3
+DEFAULT_MEMORY_COST = 65536  # KiB
+DEFAULT_PARALLELISM = 4
+HASH_LEN = 32
+SALT_LEN = 16
+
+# Below this many passwords starting a pool costs more than it saves
+PARALLEL_HASH_MIN_PASSWORDS = 16
+
+# Tasks per worker handed out by the pool (keeps workers busy without huge chunks)
+PARALLEL_HASH_CHUNKS_PER_WORKER = 4
+
+_hasher = None
+_dummy_hash = None
+
+
+def build_password_hasher(time_cost=DEFAULT_TIME_COST, memory_cost=DEFAULT_MEMORY_COST,
+                          parallelism=DEFAULT_PARALLELISM):
+    """Create an argon2id hasher with the given cost parameters"""
+    return argon2.PasswordHasher(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        hash_len=HASH_LEN,
+        salt_len=SALT_LEN,
+        encoding='utf-8',
+        type=argon2.Type.ID
+    )
+
+
+def hasher_parameters(config):
+    """Cost parameters (time_cost, memory_cost, parallelism) from an app config mapping"""
+    return (
+        int(config.get('PASSWORD_HASH_TIME_COST', DEFAULT_TIME_COST)),
+        int(config.get('PASSWORD_HASH_MEMORY_COST', DEFAULT_MEMORY_COST)),
+        int(config.get('PASSWORD_HASH_PARALLELISM', DEFAULT_PARALLELISM)),
+    )
+
+
+def configure_password_hasher(config):
+    """Build the shared hasher from the app config (called by create_app)"""
+    global _hasher, _dummy_hash
+    _hasher = build_password_hasher(*hasher_parameters(config))
+    _dummy_hash = None
+
+
+def get_password_hasher():
+    """The shared argon2id hasher (default parameters until configured)"""
+    global _hasher
+    if _hasher is None:
+        _hasher = build_password_hasher()
+    return _hasher
+
+
+def is_argon2_hash(password_hash):
+    return bool(password_hash) and password_hash.startswith('$argon2')
+
+
+def hash_password(password):
+    """Hash a password with the shared argon2id hasher"""
+    return get_password_hasher().hash(password)
+
+
+def _verify_legacy_sha256(password_hash, password):
+    try:
+        stored_hash, salt_hex = password_hash.split(':')
+        salt = bytes.fromhex(salt_hex)
+    except ValueError:
+        return False
+    calculated_hash = hashlib.sha256(salt + password.encode()).hexdigest()
+    return hmac.compare_digest(stored_hash, calculated_hash)
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against a stored hash in constant time
+
+    Args:
+        password_hash (str): argon2id hash or legacy "<sha256 hex>:<salt hex>"
+        password (str): Password to check
+
+    Returns:
+        bool: Whether the password matches
+    """
+    if not password_hash or password is None:
+        return False
+
+    if is_argon2_hash(password_hash):
+        try:
+            return get_password_hasher().verify(password_hash, password)
+        except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+            return False
+
+    return _verify_legacy_sha256(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether a hash is legacy SHA-256 or argon2id with outdated cost parameters"""
+    if not is_argon2_hash(password_hash):
+        return True
+    try:
+        return get_password_hasher().check_needs_rehash(password_hash)
+    except argon2.exceptions.InvalidHashError:
+        return True
+
+
+def burn_password_verification(password):
+    """
+    Spend the time of a real verification without a stored hash
+
+    Used when the username does not exist, so response times do not reveal
+    which usernames are registered.
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password('dummy-password')
+    verify_password(_dummy_hash, password or '')
+
+
+def _init_hash_worker(parameters):
+    global _hasher
+    _hasher = build_password_hasher(*parameters)
+
+
+def hash_passwords(passwords, workers=1):
+    """
+    Hash many passwords with the shared hasher's parameters
+
+    Large batches are spread over a pool of at most `workers` processes (spawned,
+    so no database connections or locks are inherited); small ones are hashed
+    in the calling process.
+
+    Args:
+        passwords (list): Passwords to hash
+        workers (int): Maximum number of worker processes
+
+    Returns:
+        list: Hashes in the same order as the passwords
+    """
+    passwords = list(passwords)
+    workers = min(workers, len(passwords))
+    if workers <= 1 or len(passwords) < PARALLEL_HASH_MIN_PASSWORDS:
+        return [hash_password(password) for password in passwords]
+
+    hasher = get_password_hasher()
+    parameters = (hasher.time_cost, hasher.memory_cost, hasher.parallelism)
+    chunksize = max(1, math.ceil(len(passwords) / (workers * PARALLEL_HASH_CHUNKS_PER_WORKER)))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_hash_worker,
+        initargs=(parameters,)
+    ) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+
+def hashing_throughput(count, hash_seconds, total_seconds):
+    """Throughput summary returned by bulk endpoints"""
+    return {
+        "passwords": count,
+        "hash_seconds": round(hash_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "passwords_per_second": round(count / hash_seconds, 1) if hash_seconds > 0 else None,
+    }
+
+
+def benchmark_password_hasher(time_cost, memory_cost, parallelism, samples=20):
+    """
+    Time argon2id verification (the per-login cost) for one set of parameters
+
+    Returns:
+        dict: Parameters with p50, p99 and max verification time in milliseconds
+    """
+    hasher = build_password_hasher(time_cost, memory_cost, parallelism)
+    password = 'benchmark-password'
+    password_hash = hasher.hash(password)
+
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.verify(password_hash, password)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    p99 = statistics.quantiles(timings, n=100, method='inclusive')[98] if len(timings) > 1 else timings[0]
+    return {
+        'time_cost': time_cost,
+        'memory_cost': memory_cost,
+        'parallelism': parallelism,
+        'p50_ms': statistics.median(timings),
+        'p99_ms': p99,
+        'max_ms': timings[-1],
+    }
@@ -659,6 +659,230 @@ def backup_database():
         import traceback
         traceback.print_exc()
 
+# === HIỆU NĂNG BĂM MẬT KHẨU ===
+
+# Các mức memory_cost (KiB) và time_cost được thử khi đo hiệu năng argon2id
+PASSWORD_BENCHMARK_MEMORY_COSTS = [19456, 47104, 65536, 131072]
+PASSWORD_BENCHMARK_TIME_COSTS = [1, 2, 3, 4]
+PASSWORD_BENCHMARK_SAMPLES = 20
+
+def benchmark_password_hashing():
+    """Đo thời gian xác thực argon2id với các tham số khác nhau"""
+    print_header("ĐO HIỆU NĂNG BĂM MẬT KHẨU (ARGON2ID)")
+    
+    try:
+        from app.config.config import Config
+        from app.utils.password import benchmark_password_hasher
+        
+        # Chỉ cần cấu hình, không cần kết nối cơ sở dữ liệu
+        budget = Config.PASSWORD_HASH_BUDGET_MS
+        parallelism = Config.PASSWORD_HASH_PARALLELISM
+        
+        print_info(f"Tham số hiện tại: time_cost={Config.PASSWORD_HASH_TIME_COST}, "
+                   f"memory_cost={Config.PASSWORD_HASH_MEMORY_COST} KiB, parallelism={parallelism}")
+        print_info(f"Ngân sách p99 cho mỗi lần đăng nhập: {budget} ms")
+        print_info(f"Mỗi cấu hình được đo {PASSWORD_BENCHMARK_SAMPLES} lần trên một luồng; "
+                   "khi nhiều worker cùng băm, thời gian thực tế sẽ cao hơn.\n")
+        
+        print(f"{'time_cost':>9} {'memory (KiB)':>12} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+        results = []
+        for memory_cost in PASSWORD_BENCHMARK_MEMORY_COSTS:
+            for time_cost in PASSWORD_BENCHMARK_TIME_COSTS:
+                result = benchmark_password_hasher(time_cost, memory_cost, parallelism, PASSWORD_BENCHMARK_SAMPLES)
+                results.append(result)
+                marker = '' if result['p99_ms'] <= budget else f"  {Colors.YELLOW}(vượt ngân sách){Colors.ENDC}"
+                print(f"{time_cost:>9} {memory_cost:>12} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['max_ms']:>9.1f}{marker}")
+        
+        within_budget = [r for r in results if r['p99_ms'] <= budget]
+        if not within_budget:
+            print_warning("Không có cấu hình nào nằm trong ngân sách. Hãy tăng PASSWORD_HASH_BUDGET_MS hoặc giảm parallelism.")
+            return
+        
+        # Cấu hình mạnh nhất (tốn nhiều bộ nhớ x vòng lặp nhất) vẫn nằm trong ngân sách
+        best = max(within_budget, key=lambda r: (r['memory_cost'] * r['time_cost'], r['memory_cost']))
+        print()
+        print_success(f"Đề xuất: time_cost={best['time_cost']}, memory_cost={best['memory_cost']} KiB "
+                      f"(p99 {best['p99_ms']:.1f} ms)")
+        print_info("Đặt các biến môi trường sau để áp dụng (mật khẩu cũ sẽ được băm lại khi người dùng đăng nhập):")
+        print(f"  PASSWORD_HASH_TIME_COST={best['time_cost']}")
+        print(f"  PASSWORD_HASH_MEMORY_COST={best['memory_cost']}")
+        print(f"  PASSWORD_HASH_PARALLELISM={parallelism}")
+    
+    except Exception as e:
+        print_error(f"Lỗi khi đo hiệu năng băm mật khẩu: {str(e)}")
+        traceback.print_exc()
+
+# === PHÂN VÙNG AUDIT LOG ===
+
+def manage_audit_partitions():
+    """Tạo trước các phân vùng audit_log theo tháng và tách các tháng cũ"""
+    print_header("QUẢN LÝ PHÂN VÙNG AUDIT LOG")
+    
+    try:
+        app = create_app()
+        with app.app_context():
+            from app.services.audit_log import (
+                add_months, detach_audit_partition, ensure_audit_partitions,
+                is_audit_log_partitioned, list_audit_partitions, month_start, upcoming_months
+            )
+            
+            if db.engine.dialect.name != 'postgresql':
+                print_error("Phân vùng audit_log chỉ được hỗ trợ trên PostgreSQL.")
+                return
+            
+            with db.engine.begin() as connection:
+                if not is_audit_log_partitioned(connection):
+                    print_warning("Bảng audit_log chưa được phân vùng. Hãy chạy migrations trước (tùy chọn 3).")
+                    return
+                created = ensure_audit_partitions(connection, upcoming_months(app.config['AUDIT_LOG_PARTITIONS_AHEAD']))
+            for name in created:
+                print_success(f"Đã tạo phân vùng {name}")
+            
+            with db.engine.connect() as connection:
+                partitions = list_audit_partitions(connection)
+            
+            print(f"\n{'Phân vùng':<22} {'Tháng':<8} {'Trạng thái':<12} {'Số dòng (ước tính)':>18}")
+            for partition in partitions:
+                status = 'đang dùng' if partition['attached'] else 'đã tách'
+                print(f"{partition['name']:<22} {partition['month']:%Y-%m}  {status:<12} {partition['estimated_rows']:>18}")
+            
+            # Giữ lại AUDIT_LOG_HOT_MONTHS tháng gần nhất (tính cả tháng hiện tại)
+            hot_months = app.config['AUDIT_LOG_HOT_MONTHS']
+            oldest_hot = add_months(month_start(datetime.utcnow()), 1 - hot_months)
+            old_partitions = [p['name'] for p in partitions if p['attached'] and p['month'] < oldest_hot]
+            
+            if not old_partitions:
+                print_info(f"\nKhông có phân vùng nào cũ hơn {hot_months} tháng.")
+                return
+            
+            print_info(f"\nCác phân vùng cũ hơn {hot_months} tháng: {', '.join(old_partitions)}")
+            print_info("Tách phân vùng dùng DETACH PARTITION ... CONCURRENTLY, không chặn việc ghi vào tháng hiện tại.")
+            if not confirm_action("Bạn có muốn tách các phân vùng này khỏi audit_log không?"):
+                return
+            
+            for name in old_partitions:
+                detach_audit_partition(db.engine, name)
+                print_success(f"Đã tách phân vùng {name}")
+            print_info("Các bảng đã tách vẫn nằm trong cơ sở dữ liệu; có thể sao lưu bằng `pg_dump -t <tên bảng>` rồi xóa.")
+    
+    except Exception as e:
+        print_error(f"Lỗi khi quản lý phân vùng audit log: {str(e)}")
+        traceback.print_exc()
+
+# === LƯU TRỮ AUDIT LOG ===
+
+def compact_audit_logs():
+    """Gộp các dòng audit từng mục của thao tác hàng loạt thành dòng tổng hợp"""
+    print_header("THU GỌN AUDIT LOG")
+    
+    try:
+        app = create_app()
+        with app.app_context():
+            from app.services.audit_archive import COMPACTABLE_AUDIT_ACTIONS, compact_audit_log
+            
+            days = app.config['AUDIT_LOG_COMPACT_AFTER_DAYS']
+            gap = app.config['AUDIT_LOG_COMPACT_GAP_SECONDS']
+            print_info(f"Các hành động được gộp: {', '.join(COMPACTABLE_AUDIT_ACTIONS)}")
+            print_info(f"Chỉ gộp các dòng cũ hơn {days} ngày; các dòng cách nhau quá {gap} giây thuộc thao tác khác.")
+            
+            if not confirm_action("Bạn có muốn thu gọn audit log không?"):
+                return
+            
+            started = time.time()
+            stats = compact_audit_log(days, gap)
+            print_success(f"Đã quét {stats['scanned']} dòng, thay {stats['removed']} dòng bằng {stats['groups']} dòng tổng hợp "
+                          f"({time.time() - started:.1f} giây).")
+    
+    except Exception as e:
+        print_error(f"Lỗi khi thu gọn audit log: {str(e)}")
+        traceback.print_exc()
+
+def archive_audit_logs():
+    """Xuất các tháng audit log cũ ra file NDJSON nén rồi xóa khỏi cơ sở dữ liệu"""
+    print_header("LƯU TRỮ AUDIT LOG")
+    
+    try:
+        app = create_app()
+        with app.app_context():
+            from app.services.audit_archive import archivable_audit_months, archive_audit_month, archive_compression
+            
+            archive_dir = app.config['AUDIT_LOG_ARCHIVE_DIR']
+            hot_months = app.config['AUDIT_LOG_HOT_MONTHS']
+            compression = archive_compression(app.config['AUDIT_LOG_ARCHIVE_COMPRESSION'])
+            if compression != app.config['AUDIT_LOG_ARCHIVE_COMPRESSION']:
+                print_warning("Chưa cài gói zstandard, dùng gzip thay cho zstd.")
+            
+            months = archivable_audit_months(hot_months)
+            if not months:
+                print_info(f"Không có tháng nào cũ hơn {hot_months} tháng cần lưu trữ.")
+                return
+            
+            print_info(f"Các tháng sẽ được lưu trữ vào {archive_dir} ({compression}): "
+                       f"{', '.join(f'{month:%Y-%m}' for month in months)}")
+            print_warning("Sau khi ghi file, dữ liệu của các tháng này sẽ bị xóa khỏi cơ sở dữ liệu.")
+            if not confirm_action():
+                return
+            
+            for month in months:
+                entry = archive_audit_month(month, archive_dir, compression)
+                if entry is None:
+                    print_info(f"{month:%Y-%m}: không có dữ liệu")
+                    continue
+                print_success(f"{month:%Y-%m}: {entry['rows']} dòng -> {entry['file']} "
+                              f"({entry['bytes'] / 1024:.1f} KiB, {len(entry['blocks'])} khối)")
+            print_info("Tìm trong kho lưu trữ bằng: database_tool.py audit-scan --action ... --from ... --to ...")
+    
+    except Exception as e:
+        print_error(f"Lỗi khi lưu trữ audit log: {str(e)}")
+        traceback.print_exc()
+
+def scan_audit_archive(args=None):
+    """Tìm các dòng audit trong kho lưu trữ (không cần kết nối cơ sở dữ liệu)"""
+    print_header("TÌM TRONG KHO LƯU TRỮ AUDIT LOG")
+    
+    try:
+        import json
+        from app.config.config import Config
+        from app.services.audit_archive import scan_audit_archives
+        
+        if args is None:
+            # Chế độ menu: hỏi từng bộ lọc, bỏ trống để bỏ qua
+            args = argparse.Namespace(
+                user_id=input("ID người thực hiện: ").strip() or None,
+                audit_action=input("Hành động (phân cách bằng dấu phẩy): ").strip() or None,
+                date_from=input("Từ thời điểm (ISO, ví dụ 2025-01-01): ").strip() or None,
+                date_to=input("Đến trước thời điểm (ISO): ").strip() or None,
+                target_type=input("Loại đối tượng (user, student, ...): ").strip() or None,
+                target_id=input("ID đối tượng: ").strip() or None,
+                limit=int(input("Số dòng tối đa [100]: ").strip() or 100)
+            )
+        
+        filters = {}
+        if args.user_id:
+            filters['user_id'] = int(args.user_id)
+        if args.audit_action:
+            filters['actions'] = [name.strip() for name in args.audit_action.split(',') if name.strip()]
+        if args.date_from:
+            filters['since'] = datetime.fromisoformat(args.date_from)
+        if args.date_to:
+            filters['until'] = datetime.fromisoformat(args.date_to)
+        if args.target_type:
+            filters['target_type'] = args.target_type
+        if args.target_id:
+            filters['target_id'] = int(args.target_id)
+        
+        found = 0
+        for entry in scan_audit_archives(Config.AUDIT_LOG_ARCHIVE_DIR, filters):
+            print(json.dumps(entry, ensure_ascii=False))
+            found += 1
+            if args.limit and found >= args.limit:
+                break
+        print_info(f"Tìm thấy {found} dòng.")
+    
+    except Exception as e:
+        print_error(f"Lỗi khi tìm trong kho lưu trữ audit log: {str(e)}")
+        traceback.print_exc()
+
 # === HÀM HIỂN THỊ MENU ===
 
 def show_menu():
@@ -691,9 +915,18 @@ def show_menu():
         print("15. Thống kê dữ liệu sinh viên")
         print("16. Xóa tất cả sinh viên")
         
+        print(f"\n{Colors.BLUE}[ BẢO MẬT ]{Colors.ENDC}")
+        print("17. Đo hiệu năng băm mật khẩu (argon2id)")
+        
+        print(f"\n{Colors.BLUE}[ AUDIT LOG ]{Colors.ENDC}")
+        print("18. Quản lý phân vùng audit log")
+        print("19. Thu gọn audit log (gộp dòng của thao tác hàng loạt)")
+        print("20. Lưu trữ các tháng cũ ra file nén")
+        print("21. Tìm trong kho lưu trữ audit log")
+        
         print(f"\n{Colors.RED}0. Thoát{Colors.ENDC}")
         
-        choice = input(f"\n{Colors.GREEN}Chọn một tùy chọn (0-16): {Colors.ENDC}")
+        choice = input(f"\n{Colors.GREEN}Chọn một tùy chọn (0-21): {Colors.ENDC}")
         
         if choice == '0':
             break
@@ -729,6 +962,16 @@ def show_menu():
             show_student_stats()
         elif choice == '16':
             delete_all_students()
+        elif choice == '17':
+            benchmark_password_hashing()
+        elif choice == '18':
+            manage_audit_partitions()
+        elif choice == '19':
+            compact_audit_logs()
+        elif choice == '20':
+            archive_audit_logs()
+        elif choice == '21':
+            scan_audit_archive()
         else:
             print_warning("Lựa chọn không hợp lệ. Vui lòng chọn lại.")
         
@@ -747,6 +990,11 @@ def parse_arguments():
           database_tool.py create-root       # Tạo tài khoản root mặc định
           database_tool.py setup-2fa         # Thiết lập 2FA cho tài khoản root
           database_tool.py migrate-students  # Di chuyển dữ liệu sinh viên
+          database_tool.py benchmark-password  # Đo hiệu năng băm mật khẩu argon2id
+          database_tool.py audit-partitions  # Tạo/tách phân vùng audit_log theo tháng
+          database_tool.py audit-compact     # Gộp các dòng audit của thao tác hàng loạt
+          database_tool.py audit-archive     # Lưu trữ các tháng audit cũ ra file nén
+          database_tool.py audit-scan --target-type student --target-id 123  # Tìm trong kho lưu trữ
         """)
     )
     
@@ -755,10 +1003,21 @@ def parse_arguments():
                             'menu', 'init', 'reset', 'migrate', 'diagnose', 'backup',
                             'create-root', 'custom-root', 'check-root', 'change-password',
                             'setup-2fa', 'get-2fa-token', 'verify-2fa', 'generate-qr',
-                            'migrate-students', 'student-stats', 'delete-students'
+                            'migrate-students', 'student-stats', 'delete-students',
+                            'benchmark-password', 'audit-partitions', 'audit-compact', 'audit-archive',
+                            'audit-scan'
                         ],
                         help='Hành động cần thực hiện')
     
+    # Bộ lọc cho audit-scan
+    parser.add_argument('--user-id', help='ID người thực hiện')
+    parser.add_argument('--action', dest='audit_action', help='Hành động (phân cách bằng dấu phẩy)')
+    parser.add_argument('--from', dest='date_from', help='Từ thời điểm (ISO 8601, UTC)')
+    parser.add_argument('--to', dest='date_to', help='Đến trước thời điểm (ISO 8601, UTC)')
+    parser.add_argument('--target-type', help='Loại đối tượng (user, student, area, house, ...)')
+    parser.add_argument('--target-id', help='ID đối tượng')
+    parser.add_argument('--limit', type=int, default=0, help='Số dòng tối đa (0 = không giới hạn)')
+    
     return parser.parse_args()
 
 # === CHỨC NĂNG QUẢN LÝ SINH VIÊN ===
@@ -993,6 +1252,16 @@ if __name__ == "__main__":
             show_student_stats()
         elif args.action == 'delete-students':
             delete_all_students()
+        elif args.action == 'benchmark-password':
+            benchmark_password_hashing()
+        elif args.action == 'audit-partitions':
+            manage_audit_partitions()
+        elif args.action == 'audit-compact':
+            compact_audit_logs()
+        elif args.action == 'audit-archive':
+            archive_audit_logs()
+        elif args.action == 'audit-scan':
+            scan_audit_archive(args)
     
     except KeyboardInterrupt:
         print_info("\nĐã hủy thao tác.")
@@ -29,3 +29,9 @@ static_url = '/static/'
 keyfile = None
 certfile = None
 
+
+# Server hooks
+def worker_exit(server, worker):
+    """Write buffered audit log entries before the worker exits"""
+    from app.services.audit_writer import flush_audit_writers
+    flush_audit_writers()
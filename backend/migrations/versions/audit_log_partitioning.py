@@ -0,0 +1,106 @@
+"""Partition audit_log by month and index timestamp, user_id and action
+
+Revision ID: audit_log_partitioning
+Revises: data_version_table
+Create Date: 2025-06-16 09:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'audit_log_partitioning'
+down_revision = 'data_version_table'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions created beyond the current month
+MONTHS_AHEAD = 3
+
+INDEXES = [
+    ('ix_audit_log_timestamp_brin', 'USING brin (timestamp)'),
+    ('ix_audit_log_timestamp_id', '(timestamp, id)'),
+    ('ix_audit_log_user_id_timestamp', '(user_id, timestamp, id)'),
+    ('ix_audit_log_action_timestamp', '(action, timestamp, id)'),
+]
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _create_partition(month):
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS audit_log_y{month.year:04d}m{month.month:02d} PARTITION OF audit_log "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # The primary key of a partitioned table has to include the partition key
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_unpartitioned")
+    op.execute("ALTER TABLE audit_log_unpartitioned RENAME CONSTRAINT audit_log_pkey TO audit_log_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY NONE")
+    op.execute(
+        "CREATE TABLE audit_log ("
+        " id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),"
+        " timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),"
+        " user_id INTEGER REFERENCES \"user\" (id),"
+        " action VARCHAR(100) NOT NULL,"
+        " details TEXT,"
+        " ip_address VARCHAR(50),"
+        " user_agent VARCHAR(255),"
+        " CONSTRAINT audit_log_pkey PRIMARY KEY (id, timestamp)"
+        ") PARTITION BY RANGE (timestamp)"
+    )
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+
+    now = datetime.utcnow()
+    last = _add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    oldest = bind.execute(sa.text("SELECT min(timestamp) FROM audit_log_unpartitioned")).scalar() or now
+    month = datetime(oldest.year, oldest.month, 1)
+    while month <= last:
+        _create_partition(month)
+        month = _add_months(month, 1)
+
+    op.execute(
+        "INSERT INTO audit_log (id, timestamp, user_id, action, details, ip_address, user_agent) "
+        "SELECT id, COALESCE(timestamp, now() AT TIME ZONE 'utc'), user_id, action, details, ip_address, user_agent "
+        "FROM audit_log_unpartitioned"
+    )
+    op.execute("DROP TABLE audit_log_unpartitioned")
+
+    # Created on the parent, each index is built on every partition (and on future ones)
+    for name, definition in INDEXES:
+        op.execute(f"CREATE INDEX {name} ON audit_log {definition}")
+
+
+def downgrade():
+    # Only rows in attached partitions come back; detached archives are left alone
+    op.execute("ALTER TABLE audit_log RENAME TO audit_log_partitioned")
+    op.execute("ALTER TABLE audit_log_partitioned RENAME CONSTRAINT audit_log_pkey TO audit_log_partitioned_pkey")
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY NONE")
+    op.execute(
+        "CREATE TABLE audit_log ("
+        " id INTEGER NOT NULL DEFAULT nextval('audit_log_id_seq'),"
+        " timestamp TIMESTAMP WITHOUT TIME ZONE,"
+        " user_id INTEGER REFERENCES \"user\" (id),"
+        " action VARCHAR(100) NOT NULL,"
+        " details TEXT,"
+        " ip_address VARCHAR(50),"
+        " user_agent VARCHAR(255),"
+        " CONSTRAINT audit_log_pkey PRIMARY KEY (id)"
+        ")"
+    )
+    op.execute("ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id")
+    op.execute(
+        "INSERT INTO audit_log (id, timestamp, user_id, action, details, ip_address, user_agent) "
+        "SELECT id, timestamp, user_id, action, details, ip_address, user_agent FROM audit_log_partitioned"
+    )
+    op.execute("DROP TABLE audit_log_partitioned")
@@ -0,0 +1,29 @@
+"""Add structured JSONB payload to audit_log with a GIN index
+
+Revision ID: audit_log_payload
+Revises: audit_log_partitioning
+Create Date: 2025-06-23 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'audit_log_payload'
+down_revision = 'audit_log_partitioning'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Added to the partitioned parent, so every monthly partition gets the column and the index
+    op.add_column('audit_log', sa.Column('payload', postgresql.JSONB(), nullable=True))
+    # jsonb_path_ops: smaller than the default opclass and serves payload @> '{...}'
+    op.execute('CREATE INDEX IF NOT EXISTS ix_audit_log_payload ON audit_log USING gin (payload jsonb_path_ops)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_audit_log_payload')
+    op.drop_column('audit_log', 'payload')
@@ -0,0 +1,46 @@
+"""Add bulk_operation table (progress and idempotency keys of chunked bulk operations)
+
+Revision ID: bulk_operation_table
+Revises: audit_log_payload
+Create Date: 2025-06-30 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'bulk_operation_table'
+down_revision = 'audit_log_payload'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'bulk_operation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.String(length=50), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=100), nullable=True),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('success', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('skipped', sa.Integer(), nullable=False),
+        sa.Column('result', postgresql.JSONB(), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'idempotency_key', name='uq_bulk_operation_user_key')
+    )
+
+
+def downgrade():
+    op.drop_table('bulk_operation')
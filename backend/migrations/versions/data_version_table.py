@@ -0,0 +1,31 @@
+"""Add data_version table (per-table change counters used to key export caches)
+
+Revision ID: data_version_table
+Revises: user_lower_indexes
+Create Date: 2025-06-09 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'data_version_table'
+down_revision = 'user_lower_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'data_version',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute("INSERT INTO data_version (table_name, version, updated_at) VALUES ('user', 0, now()), ('student', 0, now())")
+
+
+def downgrade():
+    op.drop_table('data_version')
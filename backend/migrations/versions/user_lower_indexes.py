@@ -0,0 +1,26 @@
+"""Add functional lower() indexes on user username and email
+
+Revision ID: user_lower_indexes
+Revises: add_password_change_required
+Create Date: 2025-06-02 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'user_lower_indexes'
+down_revision = 'add_password_change_required'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Case-insensitive duplicate checks during import use lower(username) / lower(email) IN (...)
+    op.execute('CREATE INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email))')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_user_email_lower')
+    op.execute('DROP INDEX IF EXISTS ix_user_username_lower')
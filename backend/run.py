@@ -29,9 +29,6 @@ def rebuild_database():
         # Create default root user
         root = User.query.filter_by(username='root').first()
         if not root:
-            from argon2 import PasswordHasher
-            ph = PasswordHasher()
-            
             root = User(
                 username='root',
                 email='root@fpt.com.vn',
@@ -42,10 +39,9 @@ def rebuild_database():
                 is_admin=True,
                 is_root=True,
                 role='root',
-                status='active',
-                hash_type='argon2id',
-                password_hash=ph.hash('FpT@707279-hCMcIty')
+                status='active'
             )
+            root.set_password('FpT@707279-hCMcIty')
             
             # Set up 2FA (optional during setup)
             import pyotp
@@ -67,7 +63,6 @@ def rebuild_database():
                     is_root=False,
                     role='admin',
                     status='active',
-                    hash_type='sha256',
                     phone='+1234567890',
                     area='Main Office',
                     house='HQ Building'
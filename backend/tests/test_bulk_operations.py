@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.models import BulkOperation, db
+from app.services.bulk_operations import (
+    IDEMPOTENCY_KEY_HEADER, REPLAYED_HEADER, BulkOperationError, finish_bulk_operation,
+    run_bulk_request, start_bulk_operation
+)
+
+PARAMS = {'ids': [1, 2, 3]}
+
+
+def _age(operation, **delta):
+    operation.updated_at -= timedelta(**delta)
+    db.session.commit()
+
+
+def test_completed_request_is_replayed(app):
+    calls = []
+
+    def run(operation):
+        calls.append(operation.id)
+        return {'deleted': 3}, 200
+
+    with app.test_request_context(headers={IDEMPOTENCY_KEY_HEADER: 'key-1'}):
+        first = run_bulk_request('delete_users', 1, PARAMS, run)
+        second = run_bulk_request('delete_users', 1, PARAMS, run)
+
+    assert len(calls) == 1
+    assert first[0] == second[0] == {'deleted': 3, 'operationId': calls[0]}
+    assert second[1] == 200
+    assert second[2] == {REPLAYED_HEADER: 'true'}
+
+
+def test_key_reused_for_other_request_is_rejected(app):
+    start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+
+    with pytest.raises(BulkOperationError) as error:
+        start_bulk_operation('delete_users', 1, {'ids': [4]}, 'key-1')
+    assert error.value.status_code == 422
+
+
+def test_keys_are_scoped_to_the_user(app):
+    first, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    second, earlier = start_bulk_operation('delete_users', 2, PARAMS, 'key-1')
+
+    assert earlier is None
+    assert second.id != first.id
+
+
+def test_running_request_is_rejected(app):
+    operation, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+
+    with pytest.raises(BulkOperationError) as error:
+        start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    assert error.value.status_code == 409
+    assert error.value.operation['id'] == operation.id
+
+
+def test_stale_request_is_taken_over_once(app):
+    operation, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    operation.processed = operation.success = 2
+    _age(operation, seconds=app.config['BULK_OPERATION_STALE_SECONDS'] + 1)
+
+    retried, earlier = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    assert earlier is None
+    assert retried.id == operation.id
+    assert retried.status == 'running'
+    assert retried.processed == retried.success == 0
+
+    # The takeover counts as progress: a second retry has to wait again
+    with pytest.raises(BulkOperationError) as error:
+        start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    assert error.value.status_code == 409
+
+
+def test_failed_request_runs_again(app):
+    operation, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    finish_bulk_operation(operation, {'error': 'boom'}, 500, error='boom')
+
+    retried, earlier = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    assert earlier is None
+    assert retried.id == operation.id
+    assert retried.status == 'running'
+    assert retried.result is None and retried.error is None
+
+
+def test_claim_lost_to_another_retry_is_rejected(app):
+    operation, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    finish_bulk_operation(operation, {'error': 'boom'}, 500, error='boom')
+
+    # Another worker claims the row between this request's read and its claim
+    original_query = BulkOperation.query
+
+    class ClaimedMeanwhile:
+        def filter_by(self, **kwargs):
+            found = original_query.filter_by(**kwargs).first()
+            db.session.execute(
+                db.update(BulkOperation)
+                .where(BulkOperation.id == found.id)
+                .values(status='running', updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            return self
+
+        def first(self):
+            return db.session.get(BulkOperation, operation.id)
+
+    BulkOperation.query = ClaimedMeanwhile()
+    try:
+        with pytest.raises(BulkOperationError) as error:
+            start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    finally:
+        del BulkOperation.query
+    assert error.value.status_code == 409
+
+
+def test_expired_key_starts_over(app):
+    operation, _ = start_bulk_operation('delete_users', 1, PARAMS, 'key-1')
+    finish_bulk_operation(operation, {'deleted': 3}, 200)
+    operation.created_at -= timedelta(hours=app.config['BULK_OPERATION_KEY_EXPIRY_HOURS'] + 1)
+    db.session.commit()
+
+    fresh, earlier = start_bulk_operation('delete_users', 1, {'ids': [4]}, 'key-1')
+    assert earlier is None
+    assert fresh.status == 'running'
+    assert fresh.result is None
+    assert BulkOperation.query.filter_by(user_id=1, idempotency_key='key-1').count() == 1